@@ -0,0 +1,206 @@
+import argparse
+import io
+import json
+import os
+import random
+from email.message import EmailMessage
+from email.utils import format_datetime, make_msgid
+from datetime import datetime, timedelta
+import docx
+import fitz  # PyMuPDF
+from PIL import Image, ImageDraw
+
+BODY_SIZES = {"short": 1, "medium": 6, "long": 40}
+ATTACHMENT_KINDS = ("none", "docx", "text_pdf", "scanned_pdf")
+
+DEAL_NAMES = ["Alpha Term Loan B", "Harbor Revolving Facility", "Cedar Holdings Bridge Loan",
+              "Northwind Delayed Draw", "Summit Capital Term Loan A", "Orion Energy Facility"]
+BANKS = ["Wells Fargo", "First National Bank", "Bank of Commerce", "Riverside Trust"]
+FILLER = [
+    "Please refer to the credit agreement for the applicable terms and definitions.",
+    "This notice is provided for information purposes and requires no further action unless stated.",
+    "Kindly confirm receipt of this notice at your earliest convenience.",
+    "Should you have any questions, please contact the agency services desk.",
+    "All amounts are quoted in USD unless otherwise indicated.",
+    "The effective date of this notice is the date first written above."
+]
+
+
+def _luhn_digit(digits):
+    """Check digit for CUSIP (after letter conversion) and ISIN style Luhn checksums."""
+    total = 0
+    for index, digit in enumerate(reversed(digits)):
+        if index % 2 == 0:
+            digit *= 2
+        total += digit // 10 + digit % 10
+    return (10 - total % 10) % 10
+
+
+def make_cusip(rng):
+    base = "".join(rng.choice("0123456789ABCDEFGHJKLMNPRSTUVWXYZ") for _ in range(8))
+    values = [int(char) if char.isdigit() else ord(char) - 55 for char in base]
+    total = 0
+    for index, value in enumerate(values):
+        value = value * 2 if index % 2 else value
+        total += value // 10 + value % 10
+    return f"{base}{(10 - total % 10) % 10}"
+
+
+def make_isin(rng, cusip):
+    base = f"US{cusip}"
+    digits = [int(char) for char in "".join(str(int(char, 36)) for char in base)]
+    return f"{base}{_luhn_digit(digits)}"
+
+
+def make_aba(rng):
+    digits = [rng.randint(0, 9) for _ in range(8)]
+    check = -(3 * (digits[0] + digits[3] + digits[6]) + 7 * (digits[1] + digits[4] + digits[7])
+              + (digits[2] + digits[5])) % 10
+    return "".join(map(str, digits)) + str(check)
+
+
+def make_fields(rng, request_type, sub_request_type):
+    """Returns the financial details an email of this category would mention."""
+    cusip = make_cusip(rng)
+    principal = rng.randint(100, 50000) * 1000
+    interest = round(principal * rng.uniform(0.001, 0.02), 2)
+    fees = round(rng.uniform(500, 25000), 2)
+    return {
+        "Deal Name": rng.choice(DEAL_NAMES),
+        "CUSIP": cusip,
+        "ISIN": make_isin(rng, cusip),
+        "Previous Principal Balance": f"${principal:,.2f}",
+        "New Principal Balance": f"${principal - rng.randint(0, principal // 2000) * 1000:,.2f}",
+        "Interest Amount": f"${interest:,.2f}",
+        "Fees": f"${fees:,.2f}",
+        "Total Payment Amount": f"${interest + fees:,.2f}",
+        "Expiration Date": (datetime(2025, 1, 1) + timedelta(days=rng.randint(30, 900))).strftime("%m/%d/%Y"),
+        "ABA Number": make_aba(rng),
+        "Account Number": "".join(str(rng.randint(0, 9)) for _ in range(rng.randint(8, 12)))
+    }
+
+
+def make_body(rng, request_type, sub_request_type, fields, size):
+    label = f"{request_type} - {sub_request_type}" if sub_request_type else request_type
+    lines = [
+        "Dear Agent,",
+        "",
+        f"Please be advised of the following {label} for {fields['Deal Name']}.",
+        f"Total Payment Amount: {fields['Total Payment Amount']} with value date {fields['Expiration Date']}.",
+        f"CUSIP {fields['CUSIP']} / ISIN {fields['ISIN']}.",
+        f"Remit to {rng.choice(BANKS)}, ABA {fields['ABA Number']}, Account Number {fields['Account Number']}.",
+        ""
+    ]
+    for _ in range(BODY_SIZES[size]):
+        lines.append(" ".join(rng.sample(FILLER, 3)))
+    lines += ["", "Regards,", "Loan Agency Services"]
+    return "\n".join(lines)
+
+
+def _notice_lines(request_type, sub_request_type, fields):
+    lines = [f"{request_type.upper()} NOTICE", f"Request: {sub_request_type or request_type}"]
+    return lines + [f"{name}: {value}" for name, value in fields.items()]
+
+
+def make_docx(lines):
+    document = docx.Document()
+    for line in lines:
+        document.add_paragraph(line)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def make_text_pdf(lines, pages=2):
+    doc = fitz.open()
+    for page_num in range(pages):
+        page = doc.new_page()
+        for index, line in enumerate(lines):
+            page.insert_text((72, 72 + 16 * index), line if page_num == 0 else f"{line} (page {page_num + 1})")
+    return doc.tobytes()
+
+
+def make_scanned_pdf(lines, pages=1):
+    """Renders the notice to a bitmap so the PDF has no text layer, like a scanned fax."""
+    image = Image.new("L", (1240, 1754), 255)
+    draw = ImageDraw.Draw(image)
+    for index, line in enumerate(lines):
+        draw.text((100, 120 + 40 * index), line, fill=0)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    doc = fitz.open()
+    for _ in range(pages):
+        page = doc.new_page()
+        page.insert_image(page.rect, stream=buffer.getvalue())
+    return doc.tobytes()
+
+
+ATTACHMENT_BUILDERS = {
+    "docx": ("notice.docx", "application", "vnd.openxmlformats-officedocument.wordprocessingml.document", make_docx),
+    "text_pdf": ("notice.pdf", "application", "pdf", make_text_pdf),
+    "scanned_pdf": ("scan.pdf", "application", "pdf", make_scanned_pdf)
+}
+
+
+def make_email(rng, index, classification_criteria):
+    """Builds one synthetic email and returns (eml_bytes, manifest_entry)."""
+    request_type = rng.choice(sorted(classification_criteria))
+    sub_types = classification_criteria[request_type]
+    sub_request_type = rng.choice(sub_types) if sub_types else None
+    size = rng.choice(list(BODY_SIZES))
+    kind = rng.choice(ATTACHMENT_KINDS)
+    fields = make_fields(rng, request_type, sub_request_type)
+
+    msg = EmailMessage()
+    msg["Subject"] = f"{sub_request_type or request_type} - {fields['Deal Name']}"
+    msg["From"] = "agency@example-bank.com"
+    msg["To"] = "servicing@example-lender.com"
+    msg["Date"] = format_datetime(datetime(2025, 1, 1) + timedelta(minutes=index))
+    msg["Message-ID"] = make_msgid(idstring=f"bench{index}", domain="example-bank.com")
+    msg.set_content(make_body(rng, request_type, sub_request_type, fields, size))
+    if kind != "none":
+        filename, maintype, subtype, builder = ATTACHMENT_BUILDERS[kind]
+        msg.add_attachment(builder(_notice_lines(request_type, sub_request_type, fields)),
+                           maintype=maintype, subtype=subtype, filename=filename)
+
+    return msg.as_bytes(), {
+        "request_type": request_type,
+        "sub_request_type": sub_request_type,
+        "body_size": size,
+        "attachment": kind,
+        "fields": fields
+    }
+
+
+def generate_corpus(out_dir, count, seed, classification_criteria):
+    """Writes count .eml files plus manifest.json to out_dir; the same seed gives the same corpus."""
+    rng = random.Random(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {}
+    for index in range(count):
+        eml_bytes, entry = make_email(rng, index, classification_criteria)
+        filename = f"email_{index:05d}.eml"
+        with open(os.path.join(out_dir, filename), "wb") as file:
+            file.write(eml_bytes)
+        manifest[filename] = entry
+    with open(os.path.join(out_dir, "manifest.json"), "w") as file:
+        json.dump({"seed": seed, "count": count, "emails": manifest}, file, indent=2)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic financial .eml corpus for benchmarks.")
+    parser.add_argument("--out", default="corpus", help="output directory")
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--config", default=os.path.join(os.path.dirname(__file__), "..", "email_classifier", "backend", "config.json"))
+    args = parser.parse_args()
+
+    with open(args.config, "r") as file:
+        criteria = json.load(file)["classification_criteria"]
+    generate_corpus(args.out, args.count, args.seed, criteria)
+    print(f"Wrote {args.count} emails to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from run_benchmark import BACKEND_DIR, configure, git_commit, peak_rss_mb, summarize
+
+BOUNDARY = "----email-load-test"
+
+
+def multipart_chunks(eml_bytes, chunk_size=64 * 1024):
+    """Yields a multipart/form-data body carrying eml_bytes as email_file, without copying the email."""
+    yield (f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"email_file\"; filename=\"email.eml\"\r\n"
+           f"Content-Type: message/rfc822\r\n\r\n").encode()
+    view = memoryview(eml_bytes)
+    for offset in range(0, len(view), chunk_size):
+        yield view[offset:offset + chunk_size]
+    yield f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+async def post(app, eml_bytes):
+    """Streams one POST /process-email straight into the ASGI app and returns the status code."""
+    chunks = multipart_chunks(eml_bytes)
+    pending = next(chunks)
+    status = []
+
+    async def receive():
+        nonlocal pending
+        if pending is None:
+            return {"type": "http.disconnect"}
+        body, pending = bytes(pending), next(chunks, None)
+        return {"type": "http.request", "body": body, "more_body": pending is not None}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    scope = {"type": "http", "method": "POST", "path": "/process-email", "query_string": b"", "http_version": "1.1",
+             "headers": [(b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode())]}
+    await app(scope, receive, send)
+    return status[0]
+
+
+async def drive(app, get_in_flight, emails, requests, concurrency):
+    """Keeps `concurrency` requests in flight until `requests` were sent; returns (outcomes, peaks, wall).
+
+    Request bodies are streamed from the shared corpus bytes, so the driver itself holds
+    no per-request copies.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    peaks = {"in_flight": 0, "threads": threading.active_count()}
+    done = asyncio.Event()
+
+    async def monitor():
+        while not done.is_set():
+            peaks["in_flight"] = max(peaks["in_flight"], get_in_flight())
+            peaks["threads"] = max(peaks["threads"], threading.active_count())
+            await asyncio.sleep(0.005)
+
+    async def one(index):
+        async with semaphore:
+            start = time.perf_counter()
+            status = await post(app, emails[index % len(emails)])
+            return status, time.perf_counter() - start
+
+    monitor_task = asyncio.create_task(monitor())
+    start = time.perf_counter()
+    outcomes = await asyncio.gather(*(one(index) for index in range(requests)))
+    wall_seconds = time.perf_counter() - start
+    done.set()
+    await monitor_task
+    return outcomes, peaks, wall_seconds
+
+
+def run_load_test(config, args, work_dir, corpus_dir):
+    """Sends the corpus through the async server in one process and returns the report dict."""
+    from corpus import generate_corpus
+
+    if corpus_dir is None:
+        corpus_dir = os.path.join(work_dir, "corpus")
+        generate_corpus(corpus_dir, args.count, args.seed, config["classification_criteria"])
+    emails = []
+    for name in sorted(os.listdir(corpus_dir)):
+        if name.endswith(".eml"):
+            with open(os.path.join(corpus_dir, name), "rb") as file:
+                emails.append(file.read())
+
+    config.setdefault("async_server", {}).update({"max_in_flight": max(args.concurrency, 1)})
+    # The stub has no account limits; keep the RPM/TPM pacing from dominating the run
+    config["llm"].update({"requests_per_minute": 10 ** 7, "tokens_per_minute": 10 ** 9})
+    if args.executor_workers:
+        config["async_server"]["executor_workers"] = args.executor_workers
+    from asgi_app import app, get_in_flight
+
+    # Warm up imports, pools and the SQLite stores before measuring
+    asyncio.run(drive(app, get_in_flight, emails, 2, 1))
+    rss_before = peak_rss_mb()
+    outcomes, peaks, wall_seconds = asyncio.run(drive(app, get_in_flight, emails, args.requests, args.concurrency))
+    summary = summarize([elapsed for _, elapsed in outcomes], wall_seconds)
+    summary.update({
+        "concurrency": args.concurrency,
+        "non_200": sum(status != 200 for status, _ in outcomes),
+        "peak_in_flight": peaks["in_flight"],
+        "peak_threads": peaks["threads"]
+    })
+    return {
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "cpu_count": os.cpu_count(),
+        "corpus": {"directory": args.corpus or "generated", "emails": len(emails), "seed": args.seed},
+        "llm": {"latency_ms": args.llm_latency_ms, "transport": "in-process"},
+        "async_endpoint": summary,
+        "peak_rss_mb": {"after_warmup": rss_before, "after_load": peak_rss_mb()}
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the async /process-email endpoint in one process.")
+    parser.add_argument("--corpus", default=None, help="directory of .eml files (generated when omitted)")
+    parser.add_argument("--count", type=int, default=50, help="emails to generate when --corpus is omitted")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--requests", type=int, default=1000, help="requests to send in total")
+    parser.add_argument("--concurrency", type=int, default=300, help="requests kept in flight at once")
+    parser.add_argument("--llm-latency-ms", type=float, default=1000, help="fixed latency of the LLM stub")
+    parser.add_argument("--executor-workers", type=int, default=None, help="override async_server.executor_workers")
+    parser.add_argument("--output", default=None, help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+    # configure() also reads these run_benchmark options
+    args.llm_batching, args.warm_caches = False, False
+
+    corpus_arg = os.path.abspath(args.corpus) if args.corpus else None
+    output_path = os.path.abspath(args.output) if args.output else None
+    os.chdir(BACKEND_DIR)
+    sys.path.insert(0, BACKEND_DIR)
+    from config_loader import config
+
+    work_dir = tempfile.mkdtemp(prefix="email-load-test-")
+    try:
+        configure(config, work_dir, args)
+        with contextlib.redirect_stdout(sys.stderr):
+            report = run_load_test(config, args, work_dir, corpus_arg)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if output_path:
+        with open(output_path, "w") as file:
+            file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(BENCHMARK_DIR, "..", "email_classifier", "backend")
+STAGES = ("email_reader", "attachment_parser", "compute_from_model", "flask_endpoint")
+
+
+def summarize(latencies, wall_seconds):
+    """Throughput and latency percentiles for one stage."""
+    if not latencies:
+        return {"count": 0}
+    values = np.array(latencies) * 1000
+    return {
+        "count": len(latencies),
+        "wall_seconds": round(wall_seconds, 4),
+        "throughput_per_second": round(len(latencies) / wall_seconds, 3) if wall_seconds else None,
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+        "max_ms": round(float(values.max()), 3)
+    }
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def run_stage(function, items, concurrency=1):
+    """Calls function once per item and returns (results, summary)."""
+    start = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(lambda item: timed(function, item), items))
+    else:
+        outcomes = [timed(function, item) for item in items]
+    wall_seconds = time.perf_counter() - start
+    return [result for result, _ in outcomes], summarize([elapsed for _, elapsed in outcomes], wall_seconds)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, where the platform reports it."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARK_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def configure(config, work_dir, args):
+    """Points every on-disk store at work_dir and swaps the LLM for the deterministic stub."""
+    for section, key in (("results_store", "db_file"), ("dedup_index", "db_file"), ("classification_cache", "db_file"),
+                         ("ocr_cache", "db_file"), ("job_queue", "db_file"), ("thread_tracking", "db_file"),
+                         ("local_classifier", "model_file")):
+        config.setdefault(section, {})[key] = os.path.join(work_dir, os.path.basename(config.get(section, {}).get(key, section)))
+    config["processed_emails_file"] = os.path.join(work_dir, "processed_emails.json")
+    config.setdefault("llm", {}).update({"backend": "stub", "stub_latency_ms": args.llm_latency_ms})
+    config.setdefault("llm_batching", {})["enabled"] = args.llm_batching
+    if not args.warm_caches:
+        # Measure the real work on every email instead of cache and dedup hits
+        for section in ("classification_cache", "dedup_index", "ocr_cache"):
+            config.setdefault(section, {})["enabled"] = False
+
+
+def run_benchmark(config, args, work_dir, corpus_dir):
+    """Runs the selected stages over the corpus and returns the report dict."""
+    from corpus import generate_corpus
+
+    if corpus_dir is None:
+        corpus_dir = os.path.join(work_dir, "corpus")
+        generate_corpus(corpus_dir, args.count, args.seed, config["classification_criteria"])
+    emails = []
+    for name in sorted(os.listdir(corpus_dir)):
+        if name.endswith(".eml"):
+            with open(os.path.join(corpus_dir, name), "rb") as file:
+                emails.append(file.read())
+
+    stub_server = None
+    if args.llm_stub_server:
+        from llm_stub_server import start_stub_server
+        stub_server = start_stub_server(latency_ms=args.llm_latency_ms)
+        config["llm"].update({"backend": "openai", "base_url": f"http://127.0.0.1:{stub_server.server_address[1]}/v1"})
+        config["OPENAI_API_KEY"] = config.get("OPENAI_API_KEY") or "benchmark"
+
+    from email_reader import read_email, release_attachments
+    from attachment_parser import extract_texts_from_attachments
+    from ai_classifier import compute_from_model
+    from app import app
+
+    selected = [stage for stage in args.stages.split(",") if stage]
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "corpus": {"directory": args.corpus or "generated", "emails": len(emails), "bytes": sum(map(len, emails)), "seed": args.seed},
+        "llm": {"latency_ms": args.llm_latency_ms, "transport": "http" if args.llm_stub_server else "in-process",
+                "batching": args.llm_batching},
+        "stages": {}
+    }
+
+    # Parsing and extraction always run: later stages need their output
+    parsed, summary = run_stage(read_email, emails)
+    if "email_reader" in selected:
+        report["stages"]["email_reader"] = summary
+
+    attachment_texts, summary = run_stage(
+        lambda email: "\n".join(extract_texts_from_attachments(email["attachments"])), parsed
+    )
+    if "attachment_parser" in selected:
+        summary["peak_rss_mb"] = peak_rss_mb()
+        report["stages"]["attachment_parser"] = summary
+    for email in parsed:
+        release_attachments(email["attachments"])
+
+    if "compute_from_model" in selected:
+        items = [(email["subject"] or "", email["email_text"], text) for email, text in zip(parsed, attachment_texts)]
+        results, summary = run_stage(lambda item: compute_from_model(*item), items)
+        summary["errors"] = sum("error" in result for result in results)
+        report["stages"]["compute_from_model"] = summary
+
+    if "flask_endpoint" in selected:
+        client = app.test_client()
+
+        def post(eml_bytes):
+            return client.post("/process-email", data={"email_file": (io.BytesIO(eml_bytes), "email.eml")},
+                               content_type="multipart/form-data").status_code
+
+        statuses, summary = run_stage(post, emails, args.concurrency)
+        summary["concurrency"] = args.concurrency
+        summary["non_200"] = sum(status != 200 for status in statuses)
+        report["stages"]["flask_endpoint"] = summary
+
+    if stub_server is not None:
+        stub_server.shutdown()
+    report["peak_rss_mb"] = peak_rss_mb()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the email pipeline stage by stage and report JSON.")
+    parser.add_argument("--corpus", default=None, help="directory of .eml files (generated when omitted)")
+    parser.add_argument("--count", type=int, default=50, help="emails to generate when --corpus is omitted")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--llm-latency-ms", type=float, default=0, help="fixed latency of the LLM stub")
+    parser.add_argument("--llm-stub-server", action="store_true",
+                        help="call the stub over HTTP through the OpenAI client instead of in-process")
+    parser.add_argument("--concurrency", type=int, default=1, help="concurrent requests for the flask_endpoint stage")
+    parser.add_argument("--stages", default=",".join(STAGES), help="comma separated subset of " + ", ".join(STAGES))
+    parser.add_argument("--llm-batching", action="store_true", help="pack concurrent short emails into shared LLM calls")
+    parser.add_argument("--warm-caches", action="store_true", help="keep the classification, dedup and OCR caches enabled")
+    parser.add_argument("--output", default=None, help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    corpus_arg = os.path.abspath(args.corpus) if args.corpus else None
+    output_path = os.path.abspath(args.output) if args.output else None
+    # The backend resolves config.json and its modules relative to its own directory
+    os.chdir(BACKEND_DIR)
+    sys.path.insert(0, BACKEND_DIR)
+    from config_loader import config
+
+    work_dir = tempfile.mkdtemp(prefix="email-benchmark-")
+    try:
+        configure(config, work_dir, args)
+        # The pipeline logs to stdout; keep stdout for the JSON report
+        with contextlib.redirect_stdout(sys.stderr):
+            report = run_benchmark(config, args, work_dir, corpus_arg)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    if output_path:
+        with open(output_path, "w") as file:
+            file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,139 +1,214 @@
-import openai
-import json
-import re
-from collections import OrderedDict
-from config_loader import config
-
-openai.api_key = config["OPENAI_API_KEY"]
-
-
-def detect_duplicate(email_text):
-    """
-    Identifies if the email is a duplicate.
-    - If the latest chain in a thread contains generic replies (e.g., "Thank you so much"), mark as duplicate.
-    - If the thread has multiple detailed replies/forwards, do not mark as duplicate.
-    """
-    generic_reply_patterns = [
-        r"thank you.*", r"thanks.*", r"appreciate it.*", r"noted.*",
-        r"got it.*", r"acknowledged.*", r"understood.*"
-    ]
-
-    last_reply = email_text.strip().split("\n")[-1].lower()  # Get last line of email
-
-    for pattern in generic_reply_patterns:
-        if re.match(pattern, last_reply):
-            return True  # Considered duplicate if generic response is detected
-
-    return False  # Not a duplicate if it contains meaningful content
-
-
-def assign_request(request_type, sub_request_type):
-    """Assigns request to an appropriate person or team based on config."""
-    roles_data = config["roles_and_skills"]
-
-    if request_type in roles_data:
-        if sub_request_type and isinstance(roles_data[request_type], dict):
-            return roles_data[request_type].get(sub_request_type, {})
-        return roles_data[request_type]  # Assign role/team if only RequestType exists
-
-    return {"role": "Unassigned", "assigned_to": "General Support"}
-
-
-def compute_from_model(email_subject, email_text, attachment_text=None):
-    """Runs email classification using OpenAI with ordered response format and improved error handling."""
-    try:
-        classification_criteria = json.dumps(config["classification_criteria"], indent=4)
-        extractable_fields = json.dumps(config["extractable_fields"], indent=4)
-
-        # Detect duplicate based on generic responses in email thread
-        is_duplicate = detect_duplicate(email_text)
-
-        prompt = f"""
-        You are an AI email classifier specializing in financial transactions.
-
-        ### **Task**
-        1. **Context-Based Classification:** Identify the **RequestType** and **SubRequestType**.  
-        2. **Context-Based Data Extraction:** Extract relevant financial details based on **RequestType**.  
-        3. **Priority Handling:** Prefer email content for classification, use attachments for numerical data.  
-        4. **Duplicate Detection:** If latest response in thread contains generic text (e.g., "Thank you"), mark `"DuplicateFlag": true`.  
-        5. **Assign Request:** Route the request to the appropriate **team or person**.  
-        6. **Confidence Scoring:** Provide a **confidence score (0-100%)**.  
-
-        ### **Classification Criteria**
-        {classification_criteria}
-
-        ### **Extractable Fields**
-        {extractable_fields}
-
-        ### **Email to Analyze**
-        **Subject:** {email_subject}  
-        **Email Content:** {email_text}  
-        **Attachment Content:** {attachment_text or 'No Attachment'}
-
-        ### **Expected JSON Response Format**
-        You **must** return a **pure JSON** response with **no markdown formatting** or extra characters:
-        {{
-            "request_type": "<RequestType>",
-            "sub_request_type": "<SubRequestType>",
-            "DuplicateFlag": {str(is_duplicate).lower()},
-            "confidence_score": "<Confidence Score in %>",
-            "assigned_to": "<Team or Individual>",
-            "role": "<Role Responsible>",
-            "context": "<Explanation based on email and attachments>",
-            "extracted_data": {{
-                "<Relevant Field 1>": "<Value>",
-                "<Relevant Field 2>": "<Value>"
-            }}
-        }}
-        """
-
-        client = openai.OpenAI()
-
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system",
-                 "content": "You are an AI email classifier. Always respond in pure JSON format without markdown (` ``` `)."},
-                {"role": "user", "content": prompt}
-            ]
-        )
-
-        # ✅ Check if OpenAI response is empty or invalid
-        if not response or not response.choices:
-            return {"error": "OpenAI response is empty. Please check the API request or model output."}
-
-        response_content = response.choices[0].message.content.strip()
-
-        # ✅ Clean AI response (remove markdown artifacts)
-        cleaned_response = response_content.replace("```json", "").replace("```", "").strip()
-
-        # ✅ Log raw AI response for debugging
-        print("Cleaned OpenAI Response:", cleaned_response)
-
-        # ✅ Ensure AI response is valid JSON
-        try:
-            result = json.loads(cleaned_response)
-        except json.JSONDecodeError as e:
-            return {"error": f"Failed to parse JSON from AI response: {str(e)}", "raw_response": cleaned_response}
-
-        # Assign request to appropriate team/person
-        assigned_data = assign_request(result.get("request_type"), result.get("sub_request_type"))
-        result["assigned_to"] = assigned_data.get("assigned_to", "General Support")
-        result["role"] = assigned_data.get("role", "Unassigned")
-
-        # ✅ Convert result to an **OrderedDict** to enforce response order
-        ordered_result = OrderedDict([
-            ("request_type", result.get("request_type", "Unclassified")),
-            ("sub_request_type", result.get("sub_request_type", "N/A")),
-            ("DuplicateFlag", is_duplicate),
-            ("confidence_score", result.get("confidence_score", "Unknown")),
-            ("assigned_to", result.get("assigned_to")),
-            ("role", result.get("role")),
-            ("context", result.get("context", "No context provided")),
-            ("extracted_data", result.get("extracted_data", {}))
-        ])
-
-        return ordered_result  # ✅ Returns a JSON response with correct order
-
-    except Exception as e:
-        return {"error": f"Error processing model request: {str(e)}"}
+import openai
+import json
+import logging
+import time
+from collections import OrderedDict
+from config_loader import UNASSIGNED, config, current_snapshot
+import llm_batcher
+import llm_client
+import local_classifier
+from field_extractor import extract_fields, validate_extracted
+from prompt_builder import build_prompt, count_tokens
+from telemetry import increment, log_event, run_in_executor, span
+
+openai.api_key = config["OPENAI_API_KEY"]
+
+
+def detect_duplicate(email_text):
+    """
+    Identifies if the email is a duplicate.
+    - If the latest chain in a thread contains generic replies (e.g., "Thank you so much"), mark as duplicate.
+    - If the thread has multiple detailed replies/forwards, do not mark as duplicate.
+    """
+    last_reply = email_text.strip().split("\n")[-1].lower()  # Get last line of email
+
+    # ✅ generic_reply_patterns are compiled into one regex per config snapshot
+    return current_snapshot(config).generic_reply_pattern.match(last_reply) is not None
+
+
+def assign_request(request_type, sub_request_type):
+    """Assigns request to an appropriate person or team based on config."""
+    routes = current_snapshot(config).routing_table
+    return routes.get((request_type, sub_request_type)) or routes.get((request_type, None)) or dict(UNASSIGNED)
+
+
+def _local_result(prediction, is_duplicate, extracted_data):
+    """Builds the ordered response for an email answered by the local classifier tier."""
+    assigned_data = assign_request(prediction["request_type"], prediction["sub_request_type"])
+    return OrderedDict([
+        ("request_type", prediction["request_type"]),
+        ("sub_request_type", prediction["sub_request_type"] or "N/A"),
+        ("DuplicateFlag", is_duplicate),
+        ("confidence_score", f"{round(prediction['confidence'] * 100)}%"),
+        ("assigned_to", assigned_data.get("assigned_to", "General Support")),
+        ("role", assigned_data.get("role", "Unassigned")),
+        ("context", "Classified by the local model from classification history."),
+        ("extracted_data", extracted_data),
+        ("classification_tier", "local")
+    ])
+
+
+def _prepare(email_subject, email_text, attachment_text, thread_context):
+    """Runs the local steps that come before any model call.
+
+    Returns (result, None) when the local tier answers the email, otherwise (None, request)
+    where request carries what the model call and _finish need.
+    """
+    # Detect duplicate based on generic responses in email thread
+    is_duplicate = detect_duplicate(email_text)
+
+    # ✅ Identifiers, account numbers, amounts and dates are extracted and check-digit validated locally
+    with span("field_extraction"):
+        local_fields = extract_fields(attachment_text, email_text)
+    increment("extracted_fields_total", len(local_fields), source="local")
+
+    # ✅ First tier: a confident local prediction skips the OpenAI call entirely
+    with span("local_classifier"):
+        local_prediction = local_classifier.predict(email_subject, email_text)
+    if local_prediction and local_prediction["confident"]:
+        local_classifier.record_local(local_prediction)
+        return _local_result(local_prediction, is_duplicate, local_fields), None
+
+    return None, {
+        "email_subject": email_subject,
+        "email_text": email_text,
+        "attachment_text": attachment_text,
+        "thread_context": thread_context,
+        "is_duplicate": is_duplicate,
+        "local_fields": local_fields,
+        "local_prediction": local_prediction,
+        # ✅ The model is only asked for the fields that were not found locally
+        "missing_fields": [field for field in config["extractable_fields"] if field not in local_fields] if local_fields else None
+    }
+
+
+def _completion_messages(request):
+    """Builds the chat messages for one email; returns (messages, prompt_stats)."""
+    # ✅ Static prefix is precompiled per config version; body and attachments are trimmed to the token budget
+    with span("prompt_build"):
+        prompt, prompt_stats = build_prompt(request["email_subject"], request["email_text"], request["attachment_text"],
+                                            request["is_duplicate"], request["thread_context"], request["missing_fields"])
+    increment("llm_prompt_tokens_total", prompt_stats["prompt_tokens"])
+    messages = [
+        {"role": "system",
+         "content": "You are an AI email classifier. Always respond in pure JSON format without markdown (` ``` `)."},
+        {"role": "user", "content": prompt}
+    ]
+    return messages, prompt_stats
+
+
+def _parse_completion(response, prompt_stats):
+    """Returns the parsed JSON of a chat completion, or an error dict."""
+    # ✅ Check if OpenAI response is empty or invalid
+    if not response or not response.choices:
+        return {"error": "OpenAI response is empty. Please check the API request or model output."}
+
+    response_content = response.choices[0].message.content.strip()
+
+    # ✅ Clean AI response (remove markdown artifacts)
+    cleaned_response = response_content.replace("```json", "").replace("```", "").strip()
+
+    # ✅ Log raw AI response for debugging
+    response_tokens = getattr(getattr(response, "usage", None), "completion_tokens", None)
+    increment("llm_response_tokens_total", response_tokens if isinstance(response_tokens, int) else count_tokens(cleaned_response))
+    log_event("llm_response", logging.DEBUG, prompt_tokens=prompt_stats["prompt_tokens"],
+              tokens_saved=prompt_stats["tokens_saved"], response=cleaned_response)
+
+    # ✅ Ensure AI response is valid JSON
+    try:
+        with span("response_parse"):
+            return json.loads(cleaned_response)
+    except json.JSONDecodeError as e:
+        log_event("llm_response_invalid", logging.WARNING, error=str(e), response=cleaned_response)
+        return {"error": f"Failed to parse JSON from AI response: {str(e)}", "raw_response": cleaned_response}
+
+
+def _single_completion(request):
+    """Classifies one email with its own chat completion; returns the parsed JSON or an error dict."""
+    messages, prompt_stats = _completion_messages(request)
+
+    # ✅ Shared pooled client: rate limited to the account's RPM/TPM and retried with backoff
+    with span("llm_call"):
+        response = llm_client.chat_completion(messages=messages, estimated_prompt_tokens=prompt_stats["prompt_tokens"])
+    return _parse_completion(response, prompt_stats)
+
+
+def _finish(request, result, llm_latency_ms):
+    """Validates and routes the model's answer and returns the ordered response."""
+    local_classifier.record_escalation(request["local_prediction"], result, llm_latency_ms)
+
+    # ✅ Locally validated values win; model identifiers with a bad check digit are dropped
+    extracted_data = result.get("extracted_data", {})
+    if isinstance(extracted_data, dict):
+        extracted_data, rejected = validate_extracted(extracted_data)
+        increment("extracted_fields_total", len(extracted_data), source="llm")
+        increment("extracted_fields_total", len(rejected), source="rejected")
+        extracted_data.update(request["local_fields"])
+        result["extracted_data"] = extracted_data
+
+    # Assign request to appropriate team/person
+    assigned_data = assign_request(result.get("request_type"), result.get("sub_request_type"))
+    result["assigned_to"] = assigned_data.get("assigned_to", "General Support")
+    result["role"] = assigned_data.get("role", "Unassigned")
+
+    # ✅ Convert result to an **OrderedDict** to enforce response order
+    return OrderedDict([
+        ("request_type", result.get("request_type", "Unclassified")),
+        ("sub_request_type", result.get("sub_request_type", "N/A")),
+        ("DuplicateFlag", request["is_duplicate"]),
+        ("confidence_score", result.get("confidence_score", "Unknown")),
+        ("assigned_to", result.get("assigned_to")),
+        ("role", result.get("role")),
+        ("context", result.get("context", "No context provided")),
+        ("extracted_data", result.get("extracted_data", {})),
+        ("classification_tier", "llm")
+    ])
+
+
+def compute_from_model(email_subject, email_text, attachment_text=None, thread_context=None):
+    """Runs email classification using OpenAI with ordered response format and improved error handling."""
+    try:
+        result, request = _prepare(email_subject, email_text, attachment_text, thread_context)
+        if result is not None:
+            return result
+
+        # ✅ Short emails share one completion with other concurrent short emails when micro-batching is on
+        llm_start = time.perf_counter()
+        result = llm_batcher.classify(email_subject, email_text, attachment_text, thread_context,
+                                      request["missing_fields"])
+        if result is None:
+            result = _single_completion(request)
+            if "error" in result:
+                return result
+        return _finish(request, result, (time.perf_counter() - llm_start) * 1000)  # ✅ Returns a JSON response with correct order
+
+    except Exception as e:
+        log_event("classification_failed", logging.ERROR, error=str(e))
+        return {"error": f"Error processing model request: {str(e)}"}
+
+
+async def async_compute_from_model(email_subject, email_text, attachment_text=None, thread_context=None, executor=None):
+    """compute_from_model for the async server.
+
+    The local steps and prompt building run on executor, while the model call is
+    awaited on the async client, so a request waiting for OpenAI holds no thread.
+    Micro-batching is thread based and is not used on this path.
+    """
+    try:
+        result, request = await run_in_executor(executor, _prepare, email_subject, email_text, attachment_text, thread_context)
+        if result is not None:
+            return result
+
+        llm_start = time.perf_counter()
+        messages, prompt_stats = await run_in_executor(executor, _completion_messages, request)
+        with span("llm_call"):
+            response = await llm_client.async_chat_completion(messages=messages,
+                                                              estimated_prompt_tokens=prompt_stats["prompt_tokens"])
+        result = _parse_completion(response, prompt_stats)
+        if "error" in result:
+            return result
+        return _finish(request, result, (time.perf_counter() - llm_start) * 1000)
+
+    except Exception as e:
+        log_event("classification_failed", logging.ERROR, error=str(e))
+        return {"error": f"Error processing model request: {str(e)}"}
@@ -1,62 +1,225 @@
-from flask import Flask, request, jsonify
-import os
-from datetime import datetime
-from email_reader import extract_email_content
-from attachment_parser import extract_text_from_attachment
-from ai_classifier import compute_from_model
-from file_handler import (
-    load_seen_hashes, save_seen_hashes,
-    load_processed_emails, save_processed_email
-)
-from flask_cors import CORS
-
-app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
-
-@app.route("/process-email", methods=["POST"])
-def process_email():
-    """Processes an uploaded .eml file, checks for duplicates, and stores results."""
-    try:
-
-        if "email_file" not in request.files:
-            return jsonify({"error": "No email file provided"}), 400
-
-        eml_file = request.files["email_file"]
-        if not eml_file.filename.endswith(".eml"):
-            return jsonify({"error": "Invalid file format. Only .eml files are supported"}), 400
-
-        # Save temp file
-        file_path = f"temp_{eml_file.filename}"
-        eml_file.save(file_path)
-
-        # Extract email content & attachments
-        email_text, attachments = extract_email_content(file_path)
-        email_subject = email_text.split("\n")[0].replace("Subject: ", "").strip()
-
-
-        # Extract text from attachments
-        attachment_texts = [extract_text_from_attachment(att) for att in attachments]
-        combined_attachment_text = "\n".join(attachment_texts)
-
-        # **Process email using AI model**
-        classification_result = compute_from_model(email_subject, email_text, combined_attachment_text)
-
-        # **Store processed email**
-        email_data = {
-            "email_subject": email_subject,
-            "classification_result": classification_result,
-            "processed_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        }
-
-        # **Cleanup temp files**
-        os.remove(file_path)
-        for att in attachments:
-            os.remove(att)
-
-        return jsonify(email_data)
-
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
-
-if __name__ == "__main__":
-    app.run(debug=True)
+import os
+import time
+from flask import Flask, request, jsonify, Response, stream_with_context, url_for, g
+from email_pipeline import run_email_pipeline
+from batch_processor import detach_uploads, iter_batch_uploads, process_batch, stream_ndjson
+from classification_cache import get_cache_stats
+from dashboard import get_counts, get_summary, make_etag
+from config_loader import get_config_info, reload_config, start_config_watcher
+from job_queue import QueueFullError, submit_job, get_job, retry_dead_job, get_queue_stats, ensure_workers
+from llm_client import get_llm_stats
+from local_classifier import get_cascade_report
+from ocr_cache import get_ocr_cache_stats
+from prompt_builder import get_prompt_stats
+from results_store import query_results, get_result, get_results_version
+from telemetry import new_correlation_id, observe, render_prometheus
+from flask_cors import CORS
+
+app = Flask(__name__)
+CORS(app)  # Enable CORS for all routes
+
+def start_background_services():
+    """Starts the config watcher and the embedded job workers; safe to call more than once."""
+    start_config_watcher()  # Picks up config.json edits without a restart
+    ensure_workers()  # Resume jobs left queued or in flight by a previous run
+
+def create_app():
+    """App factory for WSGI servers (gunicorn "app:create_app()"): the app with its background services running."""
+    start_background_services()
+    return app
+
+@app.before_request
+def start_request():
+    """Tags the request with a correlation id (taken from X-Request-ID when the caller sends one)."""
+    g.correlation_id = new_correlation_id(request.headers.get("X-Request-ID"))
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def finish_request(response):
+    """Records request latency and echoes the correlation id back to the caller."""
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    observe("http_request_duration_seconds", time.perf_counter() - g.request_start,
+            endpoint=endpoint, method=request.method, status=response.status_code)
+    response.headers["X-Request-ID"] = g.correlation_id
+    return response
+
+def _conditional_json(kind, build):
+    """Answers 304 when the caller already holds this view of the results, else the JSON from build(version)."""
+    version = get_results_version()
+    etag = make_etag(kind, sorted(request.args.items(multi=True)), version)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(build(version))
+    response.set_etag(etag)
+    # Clients may keep the payload but must revalidate it, which costs one MAX(id) lookup
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+@app.route("/process-email", methods=["POST"])
+def process_email():
+    """Processes an uploaded .eml file, checks for duplicates, and stores results."""
+    try:
+
+        if "email_file" not in request.files:
+            return jsonify({"error": "No email file provided"}), 400
+
+        eml_file = request.files["email_file"]
+        if not eml_file.filename.endswith(".eml"):
+            return jsonify({"error": "Invalid file format. Only .eml files are supported"}), 400
+
+        # Parse, extract attachments and classify
+        email_data = run_email_pipeline(eml_file.stream)
+
+        return jsonify(email_data)
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/process-emails", methods=["POST"])
+def process_emails():
+    """Classifies a batch of .eml files, zip archives or mbox files and streams NDJSON results."""
+    uploads = request.files.getlist("email_files")
+    if not uploads:
+        return jsonify({"error": "No email files provided"}), 400
+
+    concurrency = request.form.get("concurrency", type=int)
+    results = process_batch(iter_batch_uploads(detach_uploads(uploads)), concurrency)
+    return Response(stream_with_context(stream_ndjson(results)), mimetype="application/x-ndjson")
+
+@app.route("/jobs", methods=["POST"])
+def submit_email_job():
+    """Queues an uploaded .eml file for background processing and returns its job id."""
+    if "email_file" not in request.files:
+        return jsonify({"error": "No email file provided"}), 400
+
+    eml_file = request.files["email_file"]
+    if not eml_file.filename.endswith(".eml"):
+        return jsonify({"error": "Invalid file format. Only .eml files are supported"}), 400
+
+    try:
+        job_id = submit_job(eml_file.read(), eml_file.filename)
+    except QueueFullError as e:
+        return jsonify({"error": str(e)}), 429, {"Retry-After": str(e.retry_after)}
+    ensure_workers()
+    return jsonify({"job_id": job_id, "status": "queued", "status_url": url_for("get_email_job", job_id=job_id)}), 202
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_email_job(job_id):
+    """Returns a job's status, and its result once processing has finished."""
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+@app.route("/jobs/<job_id>/retry", methods=["POST"])
+def retry_email_job(job_id):
+    """Requeues a dead-lettered job."""
+    if not retry_dead_job(job_id):
+        return jsonify({"error": "Only dead-lettered jobs can be retried"}), 409
+    ensure_workers()
+    return jsonify(get_job(job_id)), 202
+
+@app.route("/job-stats", methods=["GET"])
+def job_stats():
+    """Returns job counts per status and the current queue depth."""
+    return jsonify(get_queue_stats())
+
+@app.route("/processed-emails", methods=["GET"])
+def list_processed_emails():
+    """Returns stored results, newest first, filtered by request type, sub-type, assignee or date."""
+    try:
+        filters = {key: request.args.get(key) for key in (
+            "request_type", "sub_request_type", "assigned_to", "processed_from", "processed_to"
+        )}
+        return _conditional_json("processed-emails", lambda version: query_results(
+            filters, request.args.get("limit", 50, type=int), request.args.get("cursor", type=int)
+        ))
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/dashboard/summary", methods=["GET"])
+def dashboard_summary():
+    """Returns totals, duplicate rate, confidence distribution and counts per type and assignee."""
+    try:
+        return _conditional_json("dashboard-summary", lambda version: get_summary(
+            version, request.args.get("processed_from"), request.args.get("processed_to")
+        ))
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/dashboard/counts", methods=["GET"])
+def dashboard_counts():
+    """Returns email counts per hour, day or month and per type or assignee, one page at a time."""
+    group_by = [field for value in request.args.getlist("group_by") for field in value.split(",") if field]
+    try:
+        return _conditional_json("dashboard-counts", lambda version: get_counts(
+            version, request.args.get("period", "day"), group_by or ["request_type"],
+            request.args.get("processed_from"), request.args.get("processed_to"),
+            request.args.get("limit", 100, type=int), request.args.get("cursor")
+        ))
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/processed-emails/<int:record_id>", methods=["GET"])
+def get_processed_email(record_id):
+    """Returns a single stored result."""
+    record = get_result(record_id)
+    if record is None:
+        return jsonify({"error": "Processed email not found"}), 404
+    return jsonify(record)
+
+@app.route("/cache-stats", methods=["GET"])
+def cache_stats():
+    """Returns hit/miss counters of the classification cache."""
+    return jsonify(get_cache_stats())
+
+@app.route("/ocr-cache-stats", methods=["GET"])
+def ocr_cache_stats():
+    """Returns hit/miss counters of the OCR cache and the size of its disk tier."""
+    return jsonify(get_ocr_cache_stats())
+
+@app.route("/cascade-report", methods=["GET"])
+def cascade_report():
+    """Returns escalation rate, agreement with the LLM and latency per classifier tier."""
+    return jsonify(get_cascade_report())
+
+@app.route("/prompt-stats", methods=["GET"])
+def prompt_stats():
+    """Returns prompt sizes and tokens saved by the prompt budget."""
+    return jsonify(get_prompt_stats())
+
+@app.route("/llm-stats", methods=["GET"])
+def llm_stats():
+    """Returns request, retry and throttling counters of the shared LLM client."""
+    return jsonify(get_llm_stats())
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Exposes stage latency histograms and pipeline counters in the Prometheus text format."""
+    return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/admin/config", methods=["GET"])
+def config_info():
+    """Returns the version and generation of the active config snapshot."""
+    return jsonify(get_config_info())
+
+@app.route("/admin/reload-config", methods=["POST"])
+def reload_config_now():
+    """Re-reads config.json and swaps in the new snapshot; the old one stays active if the file is invalid."""
+    try:
+        _, changed = reload_config(force=True)
+    except (OSError, ValueError) as e:
+        return jsonify({"error": f"Config not reloaded: {str(e)}"}), 500
+    return jsonify({**get_config_info(), "changed": changed})
+
+if __name__ == "__main__":
+    # With the debug reloader only the serving child (WERKZEUG_RUN_MAIN) runs the background services
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_background_services()
+    app.run(debug=True)
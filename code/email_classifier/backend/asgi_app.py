@@ -0,0 +1,287 @@
+import contextvars
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.http import parse_options_header
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+from app import app as flask_app, start_background_services
+from config_loader import config
+from email_pipeline import async_run_email_pipeline
+from telemetry import log_event, new_correlation_id, observe, run_in_executor
+
+DEFAULT_ASYNC_SETTINGS = {
+    "host": "127.0.0.1",
+    "port": 5000,
+    # Requests (to any route) beyond this are answered 503 instead of queueing in memory
+    "max_in_flight": 512,
+    # Threads for parsing, attachment extraction, lookups and storage; LLM waits hold none
+    "executor_workers": 8,
+    # Largest upload or request body accepted on any route; bigger ones get 413
+    "max_upload_bytes": 50 * 1024 * 1024,
+    # Uploads and request bodies larger than this are spooled to a temp file while they are read
+    "upload_spool_bytes": 1024 * 1024
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+_in_flight = 0
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+def _settings():
+    """Returns async server settings from config, falling back to defaults for missing keys."""
+    return {**DEFAULT_ASYNC_SETTINGS, **config.get("async_server", {})}
+
+
+def _get_executor():
+    """Returns the shared executor for blocking pipeline stages, creating it on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=_settings()["executor_workers"], thread_name_prefix="pipeline")
+        return _executor
+
+
+def _shutdown_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _header(scope, name):
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+async def _receive_body(receive):
+    """Yields the request body chunk by chunk."""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise ConnectionError("Client disconnected")
+        yield message.get("body", b"")
+        if not message.get("more_body", False):
+            return
+
+
+async def _read_upload(scope, receive, settings):
+    """Streams a multipart body and returns (filename, file) for its email_file part, or None.
+
+    The file part is written to a SpooledTemporaryFile as it arrives, so a large upload
+    never sits in memory whole.
+    """
+    content_type, options = parse_options_header(_header(scope, b"content-type") or "")
+    if content_type != "multipart/form-data" or "boundary" not in options:
+        return None
+    decoder = MultipartDecoder(options["boundary"].encode("latin-1"))
+    chunks = _receive_body(receive)
+    upload, in_upload, size, finished = None, False, 0, False
+    try:
+        while True:
+            event = decoder.next_event()
+            if isinstance(event, NeedData):
+                if finished:
+                    raise ValueError("Truncated multipart body")
+                chunk = await anext(chunks, None)
+                finished = chunk is None
+                decoder.receive_data(chunk)
+            elif isinstance(event, File):
+                in_upload = event.name == "email_file" and upload is None
+                if in_upload:
+                    upload = (event.filename, tempfile.SpooledTemporaryFile(max_size=settings["upload_spool_bytes"]))
+            elif isinstance(event, Field):
+                in_upload = False
+            elif isinstance(event, Data) and in_upload:
+                size += len(event.data)
+                if size > settings["max_upload_bytes"]:
+                    raise UploadTooLarge(f"Email file exceeds {settings['max_upload_bytes']} bytes")
+                upload[1].write(event.data)
+            elif isinstance(event, Epilogue):
+                break
+    except (ValueError, UploadTooLarge) as e:
+        if upload is not None:
+            upload[1].close()
+        if isinstance(e, UploadTooLarge):
+            raise
+        # Like Flask, a malformed form simply has no email_file
+        return None
+    if upload is not None:
+        upload[1].seek(0)
+    return upload
+
+
+async def _process_email(scope, receive, settings):
+    """POST /process-email with the same request and response contract as the Flask endpoint."""
+    upload = None
+    try:
+        upload = await _read_upload(scope, receive, settings)
+        if upload is None:
+            return 400, {"error": "No email file provided"}
+
+        filename, stream = upload
+        if not filename.endswith(".eml"):
+            return 400, {"error": "Invalid file format. Only .eml files are supported"}
+
+        # Parse, extract attachments and classify; only the LLM call runs on the event loop
+        return 200, await async_run_email_pipeline(stream, _get_executor())
+
+    except UploadTooLarge as e:
+        return 413, {"error": str(e)}
+    except Exception as e:
+        return 500, {"error": str(e)}
+    finally:
+        if upload is not None:
+            upload[1].close()
+
+
+async def _send_json(send, status, payload, headers):
+    body = (flask_app.json.dumps(payload) + "\n").encode("utf-8")
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), *headers]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _call_flask(scope, receive, send, settings):
+    """Serves every other route from the Flask app on the executor, streaming its response back.
+
+    The request body is spooled to a temp file as it arrives, up to max_upload_bytes.
+    """
+    too_large = {"error": f"Request body exceeds {settings['max_upload_bytes']} bytes"}
+    declared = _header(scope, b"content-length")
+    if declared and declared.isdigit() and int(declared) > settings["max_upload_bytes"]:
+        await _send_json(send, 413, too_large, [])
+        return
+    body = tempfile.SpooledTemporaryFile(max_size=settings["upload_spool_bytes"])
+    try:
+        size = 0
+        async for chunk in _receive_body(receive):
+            size += len(chunk)
+            if size > settings["max_upload_bytes"]:
+                await _send_json(send, 413, too_large, [])
+                return
+            body.write(chunk)
+        body.seek(0)
+        await _run_flask(scope, send, body, size)
+    finally:
+        body.close()
+
+
+async def _run_flask(scope, send, body, size):
+    """Calls the Flask app with a WSGI environ over the spooled body and sends its response."""
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": (scope.get("server") or ("localhost", 80))[0],
+        "SERVER_PORT": str((scope.get("server") or ("localhost", 80))[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "CONTENT_LENGTH": str(size),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False
+    }
+    for key, value in scope["headers"]:
+        name = key.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif name != "CONTENT_LENGTH":
+            environ[f"HTTP_{name}"] = f"{environ[f'HTTP_{name}']},{value}" if f"HTTP_{name}" in environ else value
+
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started["status"] = int(status.split(" ", 1)[0])
+        started["headers"] = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+
+    # One context for the whole response: stream_with_context pushes Flask's contexts on the
+    # first chunk and pops them on close, which fails if each step runs in a fresh copy
+    executor, context = _get_executor(), contextvars.copy_context()
+    response = await run_in_executor(executor, context.run, flask_app, environ, start_response)
+    chunks = iter(response)
+    try:
+        await send({"type": "http.response.start", "status": started["status"], "headers": started["headers"]})
+        while True:
+            chunk = await run_in_executor(executor, context.run, next, chunks, None)
+            if chunk is None:
+                break
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        if hasattr(response, "close"):
+            await run_in_executor(executor, context.run, response.close)
+
+
+async def app(scope, receive, send):
+    """ASGI entry point: /process-email runs on the async pipeline, every other route on the Flask app.
+
+    Every HTTP request counts toward max_in_flight.
+    """
+    global _in_flight
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                start_background_services()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                _shutdown_executor()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+
+    start = time.perf_counter()
+    is_process_email = scope["path"] == "/process-email" and scope["method"] == "POST"
+    settings = _settings()
+    if _in_flight >= settings["max_in_flight"]:
+        correlation_id = new_correlation_id(_header(scope, b"x-request-id"))
+        log_event("request_rejected", in_flight=_in_flight, path=scope["path"])
+        observe("http_request_duration_seconds", time.perf_counter() - start,
+                endpoint=scope["path"] if is_process_email else "unmatched", method=scope["method"], status=503)
+        await _send_json(send, 503, {"error": "Too many requests in flight, try again shortly"},
+                         [(b"x-request-id", correlation_id.encode("latin-1")), (b"retry-after", b"1")])
+        return
+
+    _in_flight += 1
+    try:
+        if not is_process_email:
+            await _call_flask(scope, receive, send, settings)
+            return
+        correlation_id = new_correlation_id(_header(scope, b"x-request-id"))
+        headers = [(b"x-request-id", correlation_id.encode("latin-1"))]
+        if _header(scope, b"origin"):
+            headers.append((b"access-control-allow-origin", b"*"))
+        status, payload = await _process_email(scope, receive, settings)
+    finally:
+        _in_flight -= 1
+    observe("http_request_duration_seconds", time.perf_counter() - start,
+            endpoint="/process-email", method="POST", status=status)
+    await _send_json(send, status, payload, headers)
+
+
+def get_in_flight():
+    """Returns the number of requests currently being handled."""
+    return _in_flight
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    settings = _settings()
+    uvicorn.run(app, host=settings["host"], port=settings["port"], backlog=settings["max_in_flight"])
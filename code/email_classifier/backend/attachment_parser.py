@@ -1,55 +1,543 @@
-import PyPDF2
-import docx
-import fitz  # PyMuPDF
-import pytesseract
-from PIL import Image
-import io
-from config_loader import config
-
-# Set up Tesseract OCR
-pytesseract.pytesseract.tesseract_cmd = config["TESSERACT_PATH"]
-
-def extract_text_from_attachment(attachment_path):
-    """Extracts text from PDFs, DOCX, and scanned PDFs with OCR."""
-    try:
-        text = ""
-        if attachment_path.endswith(".pdf"):
-            with open(attachment_path, "rb") as file:
-                reader = PyPDF2.PdfReader(file)
-                extracted_text = "\n".join([page.extract_text() for page in reader.pages if page.extract_text()])
-
-                if extracted_text.strip():
-                    text = extracted_text
-                else:
-                    text = extract_images_from_pdf(attachment_path)
-
-        elif attachment_path.endswith(".docx"):
-            doc = docx.Document(attachment_path)
-            text = "\n".join([para.text for para in doc.paragraphs])
-
-        else:
-            text = "Unsupported file format"
-        return text
-
-    except Exception as e:
-        return f"Error extracting text: {str(e)}"
-
-def extract_images_from_pdf(pdf_path):
-    """Extracts images from a PDF and applies OCR."""
-    try:
-        doc = fitz.open(pdf_path)
-        extracted_text = ""
-
-        for page_num in range(len(doc)):
-            for img_index, img in enumerate(doc[page_num].get_images(full=True)):
-                xref = img[0]
-                base_image = doc.extract_image(xref)
-                image_bytes = base_image["image"]
-                image = Image.open(io.BytesIO(image_bytes))
-                text = pytesseract.image_to_string(image)
-                extracted_text += f"\n[Page {page_num + 1}, Image {img_index + 1}]:\n{text}\n"
-
-        return extracted_text
-
-    except Exception as e:
-        return f"Error extracting image text: {str(e)}"
+import fitz  # PyMuPDF
+import pytesseract
+from PIL import Image
+import io
+import os
+import tempfile
+import threading
+import time
+import zipfile
+from collections import deque
+from contextlib import ExitStack, contextmanager
+from xml.etree import ElementTree
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from config_loader import config
+from email_reader import Attachment
+from field_extractor import extract_fields, local_field_names
+import ocr_cache
+from telemetry import increment, record_stage, span
+
+# Set up Tesseract OCR
+pytesseract.pytesseract.tesseract_cmd = config["TESSERACT_PATH"]
+
+DEFAULT_EXTRACTION_SETTINGS = {
+    "parallel": True,
+    "max_workers": 4,
+    "attachment_timeout_seconds": 120,
+    "ocr_min_text_chars": 20,
+    # Per-attachment budgets: pages read, bytes of text kept and seconds spent
+    "max_pages": 200,
+    "max_text_bytes": 200000,
+    "time_budget_seconds": 60,
+    # Stop once this much text is collected and either every locally extractable field
+    # was found or the last early_stop_idle_bytes of text turned up no new field
+    "early_stop": True,
+    "early_stop_min_bytes": 16000,
+    "early_stop_idle_bytes": 8000
+}
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _settings():
+    """Returns extraction settings from config, falling back to defaults for missing keys."""
+    return {**DEFAULT_EXTRACTION_SETTINGS, **config.get("attachment_extraction", {})}
+
+
+def _as_attachment(attachment):
+    """Accepts either an Attachment or a plain file path."""
+    if isinstance(attachment, Attachment):
+        return attachment
+    return Attachment(os.path.basename(attachment), path=attachment)
+
+
+@contextmanager
+def _open_pdf(attachment):
+    """Opens a PDF with PyMuPDF straight from memory, or from its spill file.
+
+    MuPDF keeps decoded fonts and images in a process-wide store that otherwise grows
+    with every document seen; it is emptied once the document is closed.
+    """
+    doc = fitz.open(stream=attachment.data, filetype="pdf") if attachment.data is not None else fitz.open(attachment.path)
+    try:
+        yield doc
+    finally:
+        doc.close()
+        fitz.TOOLS.store_shrink(100)
+
+
+@contextmanager
+def _on_disk(attachment):
+    """Yields the attachment backed by a file, spilling an in-memory payload to a temp file meanwhile.
+
+    Page OCR tasks then send the pool a path instead of pickling the whole payload per page.
+    """
+    if attachment.data is None:
+        yield attachment
+        return
+    fd, path = tempfile.mkstemp(prefix="attachment_", suffix=os.path.splitext(attachment.filename)[1])
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(attachment.data)
+        yield Attachment(attachment.filename, path=path)
+    finally:
+        os.remove(path)
+
+
+def extract_text_from_attachment(attachment):
+    """Extracts text from PDFs, DOCX, and scanned PDFs with OCR, within the attachment budgets."""
+    try:
+        attachment = _as_attachment(attachment)
+        name = attachment.filename.lower()
+        if not name.endswith((".pdf", ".docx")):
+            return "Unsupported file format"
+        return _collect_blocks(iter_attachment_blocks(attachment), _settings())
+
+    except Exception as e:
+        return f"Error extracting text: {str(e)}"
+
+
+def iter_attachment_blocks(attachment):
+    """Yields the text of an attachment block by block: PDF pages, DOCX paragraphs and table rows.
+
+    Scanned PDF pages are OCR'd as they are reached, so a consumer that stops early
+    never pays for the pages after it.
+    """
+    attachment = _as_attachment(attachment)
+    name = attachment.filename.lower()
+    if name.endswith(".pdf"):
+        with _open_pdf(attachment) as doc:
+            for page in _iter_pdf_pages(doc):
+                if isinstance(page, tuple):
+                    increment("ocr_pages_total")
+                    with span("ocr", page=page[0] + 1):
+                        page = _ocr_page(doc, *page)
+                yield page
+    elif name.endswith(".docx"):
+        yield from _iter_docx_blocks(attachment)
+
+
+class _TextBudget:
+    """Tracks the text collected from one attachment against its byte, time and early-stop budgets."""
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.deadline = time.monotonic() + settings["time_budget_seconds"]
+        self.wanted = local_field_names() if settings["early_stop"] else set()
+        self.found = set()
+        self.size = 0
+        self.size_at_last_field = 0
+        self.stop_reason = None
+
+    def add(self, block):
+        """Counts one block and returns the part of it that fits the byte budget."""
+        encoded = block.encode("utf-8")
+        separator = 1 if self.size else 0  # the newline blocks are joined with
+        room = self.settings["max_text_bytes"] - self.size - separator
+        if len(encoded) > room:
+            block = encoded[:max(room, 0)].decode("utf-8", "ignore")
+            encoded = block.encode("utf-8")
+            self.stop_reason = "text_budget"
+        self.size += len(encoded) + separator
+        if self.settings["early_stop"]:
+            new_fields = set(extract_fields(block)) - self.found
+            if new_fields:
+                self.found |= new_fields
+                self.size_at_last_field = self.size
+            if self.stop_reason is None and self.size >= self.settings["early_stop_min_bytes"] and (
+                    self.wanted <= self.found
+                    or self.size - self.size_at_last_field >= self.settings["early_stop_idle_bytes"]):
+                self.stop_reason = "enough_text"
+        if self.stop_reason is None and time.monotonic() >= self.deadline:
+            self.stop_reason = "time_budget"
+        return block
+
+
+def _collect_blocks(blocks, settings):
+    """Joins blocks of text until the attachment's budgets say to stop, then closes the source."""
+    budget = _TextBudget(settings)
+    parts = []
+    try:
+        for block in blocks:
+            if not block:
+                continue
+            parts.append(budget.add(block))
+            if budget.stop_reason:
+                increment("attachment_early_stops_total", reason=budget.stop_reason)
+                break
+    finally:
+        if hasattr(blocks, "close"):
+            blocks.close()
+    return _join_pages(parts)
+
+
+def extract_images_from_pdf(attachment):
+    """Extracts images from a PDF and applies OCR."""
+    try:
+        with _open_pdf(_as_attachment(attachment)) as doc:
+            return "".join(_ocr_images(page_num, _page_images(doc, page_num)) for page_num in range(len(doc)))
+
+    except Exception as e:
+        return f"Error extracting image text: {str(e)}"
+
+
+def _iter_pdf_pages(doc):
+    """Reads an open PDF page by page in a single PyMuPDF pass, deciding per page between text layer and OCR.
+
+    Yields one entry per page: the page text when its text layer has at least
+    ocr_min_text_chars characters or the page has no images, otherwise a
+    (page_num, text) tuple for a scanned page still to be OCR'd. Image bytes are not
+    read here. Mixed documents therefore get OCR only on their scanned pages. Pages
+    past max_pages are never read.
+    """
+    settings = _settings()
+    for page_num, page in enumerate(doc):
+        if page_num >= settings["max_pages"]:
+            increment("attachment_early_stops_total", reason="page_budget")
+            return
+        text = page.get_text("text").strip()
+        yield (page_num, text) if len(text) < settings["ocr_min_text_chars"] and page.get_images(full=True) else text
+
+
+def _scan_pdf(doc, settings):
+    """Collects the pages of an open PDF up to the point where its text layer alone exhausts the budgets.
+
+    Scanned pages only add text, so the final collection over the OCR'd pages never
+    needs a page beyond the last one returned here.
+    """
+    budget = _TextBudget(settings)
+    pages = []
+    source = _iter_pdf_pages(doc)
+    try:
+        for page in source:
+            pages.append(page)
+            if not isinstance(page, tuple) and page:
+                budget.add(page)
+            if budget.stop_reason:
+                break
+    finally:
+        source.close()
+    return pages
+
+
+def _iter_docx_blocks(attachment):
+    """Streams a DOCX body in document order: paragraph by paragraph and table row by table row.
+
+    word/document.xml is parsed incrementally and each block is dropped once yielded,
+    so memory stays flat however long the document is. Table rows come out as their
+    cell texts joined by " | ".
+    """
+    with attachment.open() as stream, zipfile.ZipFile(stream) as archive, archive.open("word/document.xml") as xml:
+        body = None
+        table_depth = 0
+        for event, element in ElementTree.iterparse(xml, events=("start", "end")):
+            if event == "start":
+                if element.tag == _W + "body":
+                    body = element
+                elif element.tag == _W + "tbl":
+                    table_depth += 1
+                continue
+            if element.tag == _W + "tbl":
+                table_depth -= 1
+            elif element.tag == _W + "tr" and table_depth == 1:
+                yield " | ".join(_docx_text(cell) for cell in element.findall(_W + "tc"))
+                element.clear()
+            elif element.tag == _W + "p" and table_depth == 0:
+                yield _docx_text(element)
+            else:
+                continue
+            if table_depth == 0 and body is not None:
+                body.clear()
+
+
+def _docx_text(element):
+    """Returns the text of a DOCX paragraph, or of every paragraph in a table cell joined by spaces."""
+    if element.tag != _W + "p":
+        return " ".join(filter(None, (_docx_text(paragraph) for paragraph in element.iter(_W + "p"))))
+    parts = []
+    for node in element.iter():
+        if node.tag == _W + "t":
+            parts.append(node.text or "")
+        elif node.tag == _W + "tab":
+            parts.append("\t")
+        elif node.tag in (_W + "br", _W + "cr"):
+            parts.append("\n")
+    return "".join(parts)
+
+
+def _join_pages(pages):
+    return "\n".join(page for page in pages if page)
+
+
+def _page_images(doc, page_num):
+    """Returns the raw bytes of every image on one page of an open PDF."""
+    return [doc.extract_image(img[0])["image"] for img in doc[page_num].get_images(full=True)]
+
+
+def _ocr_image(image_bytes):
+    """OCRs one image, reusing the cached text of any identical image seen before."""
+    key = ocr_cache.image_key(image_bytes)
+    text = ocr_cache.get_cached_text(key)
+    if text is None:
+        text = pytesseract.image_to_string(Image.open(io.BytesIO(image_bytes)))
+        ocr_cache.store_text(key, text)
+    return text
+
+
+def _ocr_images(page_num, images):
+    """Applies OCR to the images of a single page."""
+    extracted_text = ""
+    for img_index, image_bytes in enumerate(images):
+        text = _ocr_image(image_bytes)
+        extracted_text += f"\n[Page {page_num + 1}, Image {img_index + 1}]:\n{text}\n"
+    return extracted_text
+
+
+def _ocr_page(doc, page_num, text):
+    """Returns a scanned page's (short) text layer followed by the OCR text of its images."""
+    return text + _ocr_images(page_num, _page_images(doc, page_num))
+
+
+def _ocr_pdf_page(attachment, page_num, text):
+    """Pool task: reopens the PDF and OCRs one scanned page, so its image bytes stay in the worker."""
+    with _open_pdf(attachment) as doc:
+        return _ocr_page(doc, page_num, text)
+
+
+def _resolve_cached_page(doc, page_num, text):
+    """Returns the page text if every image on it is already in the OCR cache, else None."""
+    images = _page_images(doc, page_num)
+    for image_bytes in images:
+        if ocr_cache.get_cached_text(ocr_cache.image_key(image_bytes)) is None:
+            return None
+    return text + _ocr_images(page_num, images)
+
+
+def _plan_attachment(attachment, settings):
+    """Runs the cheap first pass for one attachment in a worker.
+
+    Returns ("text", text, cached_pages) when no OCR is needed, or ("pages", pages,
+    cached_pages) for a PDF with scanned pages, where each scanned page is a
+    (page_num, text) tuple to be OCR'd on its own. Pages whose images are all in the
+    OCR cache are resolved here (cached_pages counts them). No image bytes travel back
+    to the parent.
+    """
+    if attachment.filename.lower().endswith(".pdf"):
+        try:
+            with _open_pdf(attachment) as doc:
+                pages = _scan_pdf(doc, settings)
+                cached_pages = 0
+                for index, page in enumerate(pages):
+                    if isinstance(page, tuple):
+                        resolved = _resolve_cached_page(doc, *page)
+                        if resolved is not None:
+                            pages[index] = resolved
+                            cached_pages += 1
+            if not any(isinstance(page, tuple) for page in pages):
+                return "text", _collect_blocks(iter(pages), settings), cached_pages
+            return "pages", pages, cached_pages
+        except Exception as e:
+            return "text", f"Error extracting text: {str(e)}", 0
+    return "text", extract_text_from_attachment(attachment), 0
+
+
+class _PageWindow:
+    """Yields a planned PDF's pages in order, OCR'ing scanned ones in the pool a few pages ahead.
+
+    At most size pages are queued or running at once, and the next one is only submitted
+    when the reader asks for more, so a reader that stops at its budget leaves the
+    remaining scans un-OCR'd. close() cancels what was queued; overran is set when a
+    task is already running and cannot be cancelled.
+    """
+
+    def __init__(self, pool, attachment, pages, size, deadline):
+        self.pool = pool
+        self.attachment = attachment
+        self.pages = pages
+        self.size = size
+        self.deadline = deadline
+        self.pending = deque()  # (page_num, text or future) in page order
+        self.next_page = 0
+        self.in_flight = 0
+        self.overran = False
+        self._fill()
+
+    def _fill(self):
+        while self.next_page < len(self.pages) and self.in_flight < self.size:
+            page = self.pages[self.next_page]
+            if isinstance(page, tuple):
+                increment("ocr_pages_total")
+                page = self.pool.submit(_pool_task, _ocr_pdf_page, self.attachment, *page)
+                self.in_flight += 1
+            self.pending.append((self.next_page, page))
+            self.next_page += 1
+
+    def __iter__(self):
+        while self.pending:
+            page_num, page = self.pending[0]
+            if not isinstance(page, str):
+                # Left in pending until it returns, so close() can cancel it after a timeout
+                page = _pool_result(page, self.deadline, "ocr", page=page_num + 1)
+                self.in_flight -= 1
+            self.pending.popleft()
+            yield page
+            self._fill()
+
+    def close(self):
+        for _, page in self.pending:
+            if not isinstance(page, str):
+                self.overran |= not page.cancel() and not page.done()
+        self.pending.clear()
+
+
+def _pool_task(function, *args):
+    """Runs function in a pool worker and returns (result, error, OCR cache lookups, seconds taken).
+
+    Metrics updated in a worker process are lost with it, so they travel back to be
+    recorded by the parent; an exception is returned rather than raised so its timing
+    still arrives.
+    """
+    before = ocr_cache.stats_snapshot()
+    start = time.perf_counter()
+    try:
+        result, error = function(*args), None
+    except Exception as e:
+        result, error = None, e
+    return result, error, ocr_cache.stats_since(before), time.perf_counter() - start
+
+
+def _pool_result(future, deadline, stage=None, **fields):
+    """Waits for a _pool_task future until deadline and records the worker's metrics.
+
+    With a stage, the worker's run time is recorded as that pipeline stage.
+    """
+    result, error, cache_stats, duration = future.result(timeout=max(0, deadline - time.monotonic()))
+    ocr_cache.merge_stats(cache_stats)
+    if stage:
+        record_stage(stage, duration, error is not None, **fields)
+    if error is not None:
+        raise error
+    return result
+
+
+def _get_pool(max_workers):
+    """Returns the shared extraction process pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=max_workers)
+        return _pool
+
+
+def _reset_pool():
+    """Discards a broken pool so the next call starts fresh workers."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _recycle_pool(pool):
+    """Kills the workers of a pool running a task past its deadline and discards the pool.
+
+    A running task cannot be cancelled, so without this a runaway OCR would keep its
+    worker busy and later emails would queue behind it. Other callers still holding
+    the old pool see BrokenProcessPool and fall back to sequential extraction.
+    ProcessPoolExecutor.kill_workers() is used where available (Python 3.14+); older
+    versions have no public way to stop a busy worker, so their workers are found
+    through the executor's _processes map (CPython 3.8-3.13). Without either, the pool
+    is only shut down and the runaway task finishes on its own.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    kill_workers = getattr(pool, "kill_workers", None)
+    if kill_workers is not None:
+        kill_workers()
+    else:
+        processes = list((getattr(pool, "_processes", None) or {}).values())
+        pool.shutdown(wait=False, cancel_futures=True)
+        for process in processes:
+            process.kill()
+    increment("attachment_pool_recycles_total")
+
+
+def extract_texts_from_attachments(attachments):
+    """Extracts text from several attachments in parallel, returning texts in input order.
+
+    Work fans out across attachments and, for scanned PDFs, across pages. Page text is
+    reassembled in page order under the same budgets as the sequential path, with OCR
+    running at most max_workers pages ahead of it, so scans past an early stop are never
+    OCR'd. Each
+    attachment has its own deadline; an attachment that runs past it yields an error
+    string instead of blocking the whole email, and the pool is recycled once the
+    other attachments are collected.
+    """
+    settings = _settings()
+    max_workers = max(1, min(settings["max_workers"], os.cpu_count() or 1))
+    if not attachments:
+        return []
+    attachments = [_as_attachment(attachment) for attachment in attachments]
+    if not settings["parallel"] or max_workers == 1:
+        return [extract_text_from_attachment(attachment) for attachment in attachments]
+
+    timeout = settings["attachment_timeout_seconds"]
+    pool = None
+    overran = False
+    spills = ExitStack()
+    try:
+        pool = _get_pool(max_workers)
+        deadlines = [time.monotonic() + timeout for _ in attachments]
+        plan_futures = [pool.submit(_pool_task, _plan_attachment, attachment, settings) for attachment in attachments]
+
+        # Second stage: OCR scanned PDFs page by page, in order and only as far as their budgets need
+        windows = {}
+        results = [None] * len(attachments)
+        for index, future in enumerate(plan_futures):
+            try:
+                kind, value, cached_pages = _pool_result(future, deadlines[index])
+            except FutureTimeoutError:
+                overran |= not future.cancel()
+                results[index] = f"Error extracting text: timed out after {timeout} seconds"
+                continue
+            except BrokenProcessPool:
+                raise
+            except Exception as e:
+                results[index] = f"Error extracting text: {str(e)}"
+                continue
+            # Workers run in other processes, so their page counts are recorded here
+            increment("ocr_pages_total", cached_pages)
+            if kind == "text":
+                results[index] = value
+            else:
+                attachment = spills.enter_context(_on_disk(attachments[index]))
+                windows[index] = _PageWindow(pool, attachment, value, max_workers, deadlines[index])
+
+        for index, window in windows.items():
+            try:
+                results[index] = _collect_blocks(window, settings)
+            except FutureTimeoutError:
+                results[index] = f"Error extracting text: timed out after {timeout} seconds"
+            except BrokenProcessPool:
+                raise
+            except Exception as e:
+                results[index] = f"Error extracting image text: {str(e)}"
+            finally:
+                window.close()
+                overran |= window.overran
+
+        return results
+
+    except BrokenProcessPool:
+        _reset_pool()
+        return [extract_text_from_attachment(attachment) for attachment in attachments]
+    finally:
+        if overran:
+            _recycle_pool(pool)
+        spills.close()
@@ -0,0 +1,134 @@
+import contextvars
+import json
+import mailbox
+import os
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from config_loader import config
+from email_pipeline import run_email_pipeline
+
+DEFAULT_BATCH_SETTINGS = {
+    "max_concurrency": 8,
+    "max_in_flight_per_worker": 2
+}
+
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+
+def _settings():
+    """Returns batch settings from config, falling back to defaults for missing keys."""
+    return {**DEFAULT_BATCH_SETTINGS, **config.get("batch_processing", {})}
+
+
+def iter_mbox_messages(file_obj, source_name):
+    """Yields (source, raw bytes) for every message of an uploaded mbox file."""
+    fd, mbox_path = tempfile.mkstemp(suffix=".mbox", prefix="batch_")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            while chunk := file_obj.read(1024 * 1024):
+                file.write(chunk)
+        mbox = mailbox.mbox(mbox_path, create=False)
+        try:
+            for index, key in enumerate(mbox.iterkeys()):
+                yield f"{source_name}#{index + 1}", mbox.get_bytes(key)
+        finally:
+            mbox.close()
+    finally:
+        os.remove(mbox_path)
+
+
+def iter_zip_messages(file_obj, source_name):
+    """Yields (source, raw bytes) for every .eml member of an uploaded zip archive."""
+    with zipfile.ZipFile(file_obj) as archive:
+        for member in archive.infolist():
+            if member.is_dir():
+                continue
+            if member.filename.lower().endswith(".eml"):
+                yield f"{source_name}/{member.filename}", archive.read(member)
+            else:
+                yield f"{source_name}/{member.filename}", ValueError("Unsupported file in archive. Only .eml files are supported")
+
+
+def detach_uploads(uploads):
+    """Copies uploaded files into private spooled buffers that outlive the request.
+
+    Flask closes request files once the view returns, but batch results are streamed
+    after that point.
+    """
+    detached = []
+    for upload in uploads:
+        buffer = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+        shutil.copyfileobj(upload.stream, buffer)
+        buffer.seek(0)
+        detached.append((upload.filename or "upload", buffer))
+    return detached
+
+
+def iter_batch_uploads(uploads):
+    """Expands (filename, stream) pairs of .eml, .zip and .mbox files into (source, raw bytes) items.
+
+    Items that cannot be read are yielded with an exception in place of the bytes so the
+    error is reported for that email only.
+    """
+    for filename, stream in uploads:
+        lower_name = filename.lower()
+        try:
+            if lower_name.endswith(".eml"):
+                yield filename, stream.read()
+            elif lower_name.endswith(".zip"):
+                yield from iter_zip_messages(stream, filename)
+            elif lower_name.endswith(".mbox"):
+                yield from iter_mbox_messages(stream, filename)
+            else:
+                yield filename, ValueError("Invalid file format. Only .eml, .zip and .mbox files are supported")
+        except Exception as e:
+            yield filename, e
+        finally:
+            stream.close()
+
+
+def _process_item(index, source, data):
+    """Processes one batch item, turning any failure into a per-email error record."""
+    try:
+        if isinstance(data, Exception):
+            raise data
+        email_data = run_email_pipeline(data)
+        if "error" in email_data["classification_result"]:
+            return {"index": index, "source": source, "status": "error", **email_data}
+        return {"index": index, "source": source, "status": "ok", **email_data}
+    except Exception as e:
+        return {"index": index, "source": source, "status": "error", "error": str(e)}
+
+
+def process_batch(items, concurrency=None):
+    """Classifies batch items with bounded concurrency, yielding results as they complete.
+
+    At most ``concurrency * max_in_flight_per_worker`` items are read ahead, so large
+    archives are never fully expanded in memory.
+    """
+    settings = _settings()
+    concurrency = max(1, min(concurrency or settings["max_concurrency"], settings["max_concurrency"]))
+    max_in_flight = concurrency * settings["max_in_flight_per_worker"]
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch") as executor:
+        pending = set()
+        for index, (source, data) in enumerate(items):
+            # Each worker thread runs in a copy of the request context to keep its correlation id
+            pending.add(executor.submit(contextvars.copy_context().run, _process_item, index, source, data))
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def stream_ndjson(results):
+    """Serializes batch results as newline-delimited JSON."""
+    for result in results:
+        yield json.dumps(result) + "\n"
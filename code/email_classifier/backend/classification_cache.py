@@ -0,0 +1,243 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from config_loader import config, config_version
+from ai_classifier import async_compute_from_model, compute_from_model
+from telemetry import increment, run_in_executor
+
+DEFAULT_CACHE_SETTINGS = {
+    "enabled": True,
+    "memory_entries": 512,
+    "db_file": "classification_cache.sqlite3",
+    "ttl_seconds": 86400,
+    "max_disk_entries": 50000,
+    "max_disk_bytes": 100 * 1024 * 1024
+}
+
+_memory_cache = OrderedDict()
+_lock = threading.Lock()
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = set()
+_stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+
+def _settings():
+    """Returns cache settings from config, falling back to defaults for missing keys."""
+    return {**DEFAULT_CACHE_SETTINGS, **config.get("classification_cache", {})}
+
+
+def _create_schema(conn):
+    conn.executescript(
+        """CREATE TABLE IF NOT EXISTS classification_cache (
+               cache_key TEXT PRIMARY KEY,
+               result TEXT NOT NULL,
+               created_at REAL NOT NULL,
+               size INTEGER NOT NULL
+           );
+           CREATE INDEX IF NOT EXISTS idx_cache_created_at ON classification_cache (created_at);
+           CREATE TABLE IF NOT EXISTS classification_cache_totals (
+               id INTEGER PRIMARY KEY CHECK (id = 0),
+               entries INTEGER NOT NULL,
+               bytes INTEGER NOT NULL
+           );
+           INSERT OR IGNORE INTO classification_cache_totals (id, entries, bytes)
+               SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM classification_cache;
+           CREATE TRIGGER IF NOT EXISTS cache_totals_insert AFTER INSERT ON classification_cache BEGIN
+               UPDATE classification_cache_totals SET entries = entries + 1, bytes = bytes + new.size;
+           END;
+           CREATE TRIGGER IF NOT EXISTS cache_totals_update AFTER UPDATE OF size ON classification_cache BEGIN
+               UPDATE classification_cache_totals SET bytes = bytes + new.size - old.size;
+           END;
+           CREATE TRIGGER IF NOT EXISTS cache_totals_delete AFTER DELETE ON classification_cache BEGIN
+               UPDATE classification_cache_totals SET entries = entries - 1, bytes = bytes - old.size;
+           END;"""
+    )
+
+
+def _connection(settings):
+    """Returns this thread's connection to the on-disk cache tier, creating the schema on first use."""
+    db_file = settings["db_file"]
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(db_file)
+    if conn is None:
+        conn = sqlite3.connect(db_file, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with _init_lock:
+            if db_file not in _initialized:
+                _create_schema(conn)
+                _initialized.add(db_file)
+        connections[db_file] = conn
+    return conn
+
+
+def make_cache_key(email_subject, email_text, attachment_text=None, thread_context=None):
+    """Builds a content hash from subject, body, attachment text, thread summary and the active config version."""
+    digest = hashlib.sha256()
+    parts = [config_version(), email_subject or "", email_text or "", attachment_text or ""]
+    if thread_context:
+        parts.append(thread_context)
+    for part in parts:
+        encoded = part.encode("utf-8", "replace")
+        digest.update(str(len(encoded)).encode("ascii") + b":" + encoded)
+    return digest.hexdigest()
+
+
+def _memory_get(key, now):
+    with _lock:
+        entry = _memory_cache.get(key)
+        if entry is None:
+            return None
+        expires_at, payload = entry
+        if expires_at < now:
+            del _memory_cache[key]
+            return None
+        _memory_cache.move_to_end(key)
+        return payload
+
+
+def _memory_put(key, payload, expires_at, max_entries):
+    with _lock:
+        _memory_cache[key] = (expires_at, payload)
+        _memory_cache.move_to_end(key)
+        while len(_memory_cache) > max_entries:
+            _memory_cache.popitem(last=False)
+
+
+def _disk_get(key, now, settings):
+    conn = _connection(settings)
+    row = conn.execute(
+        "SELECT result, created_at FROM classification_cache WHERE cache_key = ?", (key,)
+    ).fetchone()
+    if row is None:
+        return None
+    if row[1] + settings["ttl_seconds"] < now:
+        conn.execute("DELETE FROM classification_cache WHERE cache_key = ?", (key,))
+        return None
+    return row
+
+
+def _disk_put(key, payload, now, settings):
+    """Stores one entry and evicts expired and oldest entries; returns how many were evicted.
+
+    Entry and byte totals are kept up to date by triggers, so a write never scans the table.
+    """
+    conn = _connection(settings)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            """INSERT INTO classification_cache (cache_key, result, created_at, size) VALUES (?, ?, ?, ?)
+               ON CONFLICT (cache_key) DO UPDATE SET
+               result = excluded.result, created_at = excluded.created_at, size = excluded.size""",
+            (key, payload, now, len(payload))
+        )
+        evicted = conn.execute(
+            "DELETE FROM classification_cache WHERE created_at < ?", (now - settings["ttl_seconds"],)
+        ).rowcount
+
+        # Size-based eviction: drop the oldest entries until both limits are satisfied
+        while True:
+            entries, total_bytes = conn.execute(
+                "SELECT entries, bytes FROM classification_cache_totals"
+            ).fetchone()
+            excess = entries - settings["max_disk_entries"]
+            if total_bytes > settings["max_disk_bytes"]:
+                excess = max(excess, 1)
+            if excess <= 0:
+                break
+            evicted += conn.execute(
+                """DELETE FROM classification_cache WHERE cache_key IN (
+                       SELECT cache_key FROM classification_cache ORDER BY created_at LIMIT ?
+                   )""",
+                (excess,)
+            ).rowcount
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return evicted
+
+
+def _count(stat, amount=1):
+    with _lock:
+        _stats[stat] += amount
+    increment("classification_cache_events_total", amount, event=stat)
+
+
+def _lookup(key, settings):
+    """Returns the cached classification for key from either tier, or None."""
+    now = time.time()
+    payload = _memory_get(key, now)
+    if payload is not None:
+        _count("memory_hits")
+        return json.loads(payload, object_pairs_hook=OrderedDict)
+
+    row = _disk_get(key, now, settings)
+    if row is not None:
+        payload, created_at = row
+        _count("disk_hits")
+        _memory_put(key, payload, created_at + settings["ttl_seconds"], settings["memory_entries"])
+        return json.loads(payload, object_pairs_hook=OrderedDict)
+
+    _count("misses")
+    return None
+
+
+def _store(key, result, settings):
+    # Errors are never cached so that a transient OpenAI failure is retried on re-submission
+    if "error" not in result:
+        now = time.time()
+        payload = json.dumps(result)
+        _memory_put(key, payload, now + settings["ttl_seconds"], settings["memory_entries"])
+        _count("evictions", _disk_put(key, payload, now, settings))
+        _count("stores")
+
+
+def cached_compute_from_model(email_subject, email_text, attachment_text=None, thread_context=None):
+    """Returns a cached classification when the same content was seen before, otherwise calls the model."""
+    settings = _settings()
+    if not settings["enabled"]:
+        return compute_from_model(email_subject, email_text, attachment_text, thread_context)
+
+    key = make_cache_key(email_subject, email_text, attachment_text, thread_context)
+    result = _lookup(key, settings)
+    if result is None:
+        result = compute_from_model(email_subject, email_text, attachment_text, thread_context)
+        _store(key, result, settings)
+    return result
+
+
+async def async_cached_compute_from_model(email_subject, email_text, attachment_text=None, thread_context=None, executor=None):
+    """cached_compute_from_model for the async server; cache I/O runs on executor."""
+    settings = _settings()
+    if not settings["enabled"]:
+        return await async_compute_from_model(email_subject, email_text, attachment_text, thread_context, executor)
+
+    key = make_cache_key(email_subject, email_text, attachment_text, thread_context)
+    result = await run_in_executor(executor, _lookup, key, settings)
+    if result is None:
+        result = await async_compute_from_model(email_subject, email_text, attachment_text, thread_context, executor)
+        await run_in_executor(executor, _store, key, result, settings)
+    return result
+
+
+def get_cache_stats():
+    """Returns hit/miss counters for both cache tiers."""
+    with _lock:
+        stats = dict(_stats)
+        stats["memory_entries"] = len(_memory_cache)
+    lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+    stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+    return stats
+
+
+def clear_memory_cache():
+    """Drops the in-memory tier (the on-disk tier is left untouched)."""
+    with _lock:
+        _memory_cache.clear()
@@ -1,14 +1,252 @@
-import json
-import os
-
-CONFIG_FILE = "config.json"
-
-def load_config():
-    """Loads configuration settings from a JSON file."""
-    if not os.path.exists(CONFIG_FILE):
-        raise FileNotFoundError(f"Configuration file {CONFIG_FILE} not found.")
-
-    with open(CONFIG_FILE, "r") as file:
-        return json.load(file)
-
-config = load_config()
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+# Resolved next to this module (or from $EMAIL_CLASSIFIER_CONFIG) so the working directory does not matter
+CONFIG_FILE = os.environ.get("EMAIL_CLASSIFIER_CONFIG") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.json")
+
+DEFAULT_GENERIC_REPLY_PATTERNS = [
+    r"thank you.*", r"thanks.*", r"appreciate it.*", r"noted.*",
+    r"got it.*", r"acknowledged.*", r"understood.*"
+]
+
+DEFAULT_RELOAD_SETTINGS = {
+    "watch": True,
+    "poll_interval_seconds": 2
+}
+
+UNASSIGNED = {"role": "Unassigned", "assigned_to": "General Support"}
+
+logger = logging.getLogger("email_classifier")
+_lock = threading.RLock()
+_watcher = None
+# Snapshot a request or email is pinned to, so a reload never changes config halfway through it
+_pinned = contextvars.ContextVar("pinned_config_snapshot", default=None)
+
+
+def load_config():
+    """Loads configuration settings from a JSON file."""
+    if not os.path.exists(CONFIG_FILE):
+        raise FileNotFoundError(f"Configuration file {CONFIG_FILE} not found.")
+
+    with open(CONFIG_FILE, "r") as file:
+        return json.load(file)
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    """One immutable generation of the configuration plus the structures derived from it."""
+    data: dict
+    version: str
+    generation: int
+    loaded_at: float
+    generic_reply_pattern: re.Pattern
+    routing_table: dict
+    prompt_fragments: dict
+
+
+def _routing_table(roles):
+    """Flattens roles_and_skills into {(request_type, sub_request_type or None): assignment}."""
+    table = {}
+    for request_type, entry in roles.items():
+        if not isinstance(entry, dict):
+            continue
+        if "role" in entry or "assigned_to" in entry:
+            table[(request_type, None)] = entry
+        else:
+            for sub_request_type, assignment in entry.items():
+                table[(request_type, sub_request_type)] = assignment
+    return table
+
+
+def build_snapshot(data, generation=0):
+    """Precomputes everything the request path derives from the config, once per config change."""
+    patterns = data.get("generic_reply_patterns", DEFAULT_GENERIC_REPLY_PATTERNS)
+    return ConfigSnapshot(
+        data=data,
+        version=config_version(data),
+        generation=generation,
+        loaded_at=time.time(),
+        generic_reply_pattern=re.compile("|".join(f"(?:{pattern})" for pattern in patterns)),
+        routing_table=_routing_table(data.get("roles_and_skills", {})),
+        prompt_fragments={
+            "classification_criteria": json.dumps(data.get("classification_criteria", {}), indent=4),
+            "extractable_fields": json.dumps(data.get("extractable_fields", []), indent=4)
+        }
+    )
+
+
+class LiveConfig(MutableMapping):
+    """The active configuration as a dict-like view over the current snapshot.
+
+    Readers always see one complete snapshot, the one pinned by pin_config() if any;
+    writes and reloads build a new snapshot and swap it in with a single reference
+    assignment.
+    """
+
+    def __init__(self, snapshot):
+        self._snapshot = snapshot
+
+    def snapshot(self):
+        """Returns the snapshot pinned to the current request, or the live one."""
+        return _pinned.get() or self._snapshot
+
+    def live_snapshot(self):
+        """Returns the newest snapshot, ignoring any pin."""
+        return self._snapshot
+
+    def swap(self, data):
+        """Replaces the whole configuration and returns the new snapshot."""
+        with _lock:
+            self._snapshot = build_snapshot(data, self._snapshot.generation + 1)
+            return self._snapshot
+
+    def __getitem__(self, key):
+        return self.snapshot().data[key]
+
+    def __iter__(self):
+        return iter(self.snapshot().data)
+
+    def __len__(self):
+        return len(self.snapshot().data)
+
+    def __setitem__(self, key, value):
+        self.update({key: value})
+
+    def __delitem__(self, key):
+        with _lock:
+            data = dict(self._snapshot.data)
+            del data[key]
+            self.swap(data)
+
+    def update(self, *args, **kwargs):
+        with _lock:
+            data = dict(self._snapshot.data)
+            data.update(*args, **kwargs)
+            self.swap(data)
+
+    def clear(self):
+        """Empties the configuration; use swap() to replace it in one step instead of clearing and refilling."""
+        self.swap({})
+
+    def copy(self):
+        return dict(self.snapshot().data)
+
+
+def pin_config():
+    """Pins the current snapshot for the rest of this request or email and returns a token for unpin_config().
+
+    An outer pin wins, so an email processed inside a request keeps the request's snapshot.
+    """
+    return _pinned.set(config.snapshot())
+
+
+def unpin_config(token):
+    _pinned.reset(token)
+
+
+@contextmanager
+def pinned_config():
+    """Runs the block on one config snapshot, however often config.json is reloaded meanwhile."""
+    token = pin_config()
+    try:
+        yield
+    finally:
+        unpin_config(token)
+
+
+@contextmanager
+def override_config(values):
+    """Overrides top-level config keys for the block, then restores the previous config.
+
+    Both changes are a single swap(), so other threads never see a half-restored config
+    (patch.dict restores by clearing and refilling).
+    """
+    with _lock:
+        previous = config.live_snapshot().data
+        config.swap({**previous, **values})
+    try:
+        yield config
+    finally:
+        config.swap(previous)
+
+
+def config_version(settings=None):
+    """Returns a stable hash of the configuration, used to key cached results."""
+    if settings is None or isinstance(settings, LiveConfig):
+        return (config if settings is None else settings).snapshot().version
+    canonical = json.dumps(settings, sort_keys=True, default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def current_snapshot(settings=None):
+    """Returns the active snapshot, or builds one for a plain settings dict."""
+    if settings is None or isinstance(settings, LiveConfig):
+        return (config if settings is None else settings).snapshot()
+    return build_snapshot(settings)
+
+
+def reload_config(force=False):
+    """Re-reads config.json and swaps in a new snapshot if its content changed.
+
+    Returns (snapshot, changed). Raises on a missing or malformed file, in which case
+    the running snapshot stays active.
+    """
+    global _file_state
+    state = _stat_config_file()
+    # The watcher thread and the admin endpoint may reload at once; compare and set under the lock
+    with _lock:
+        if not force and state == _file_state:
+            return config.live_snapshot(), False
+        data = load_config()
+        _file_state = state
+        if config_version(data) == config.live_snapshot().version:
+            return config.live_snapshot(), False
+        snapshot = config.swap(data)
+    logger.info("config_reloaded", extra={"fields": {"version": snapshot.version, "generation": snapshot.generation}})
+    return snapshot, True
+
+
+def _stat_config_file():
+    stat = os.stat(CONFIG_FILE)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def get_config_info():
+    """Describes the newest snapshot for the admin endpoints."""
+    snapshot = config.live_snapshot()
+    return {"version": snapshot.version, "generation": snapshot.generation,
+            "loaded_at": round(snapshot.loaded_at, 3), "config_file": CONFIG_FILE}
+
+
+def start_config_watcher():
+    """Starts a daemon thread that reloads config.json whenever it changes on disk."""
+    global _watcher
+    settings = {**DEFAULT_RELOAD_SETTINGS, **config.get("config_reload", {})}
+    if not settings["watch"] or (_watcher is not None and _watcher.is_alive()):
+        return _watcher
+
+    def watch():
+        while True:
+            time.sleep(settings["poll_interval_seconds"])
+            try:
+                reload_config()
+            except (OSError, ValueError) as e:
+                # A half-written or invalid file keeps the last good snapshot active
+                logger.warning("config_reload_failed", extra={"fields": {"error": str(e)}})
+
+    _watcher = threading.Thread(target=watch, name="config-watcher", daemon=True)
+    _watcher.start()
+    return _watcher
+
+
+_file_state = _stat_config_file() if os.path.exists(CONFIG_FILE) else None
+config = LiveConfig(build_snapshot(load_config()))
@@ -0,0 +1,142 @@
+import base64
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from config_loader import config
+import results_store
+from results_store import CONFIDENCE_BINS, INDEXED_FIELDS, query_aggregates
+
+DEFAULT_DASHBOARD_SETTINGS = {
+    "cache_entries": 256,
+    "max_page_size": 500
+}
+
+# Period name -> length of the "YYYY-MM-DD HH:00:00" bucket prefix it keeps
+PERIODS = {"hour": 13, "day": 10, "month": 7}
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def _settings():
+    """Returns dashboard settings from config, falling back to defaults for missing keys."""
+    return {**DEFAULT_DASHBOARD_SETTINGS, **config.get("dashboard", {})}
+
+
+def make_etag(kind, params, version):
+    """Builds the ETag of one view of the results, which changes whenever a result is saved."""
+    return hashlib.sha256(json.dumps([kind, params, version], sort_keys=True).encode("utf-8")).hexdigest()[:32]
+
+
+def _cached(kind, params, version, build):
+    """Returns build() for these parameters, reusing the payload computed at the same results version."""
+    # Results versions only make sense within one store file
+    key = json.dumps([kind, params, results_store.get_db_file()], sort_keys=True)
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] == version:
+            _cache.move_to_end(key)
+            return entry[1]
+    payload = build()
+    with _lock:
+        _cache[key] = (version, payload)
+        _cache.move_to_end(key)
+        while len(_cache) > _settings()["cache_entries"]:
+            _cache.popitem(last=False)
+    return payload
+
+
+def clear_cache():
+    """Drops every cached payload."""
+    with _lock:
+        _cache.clear()
+
+
+def _confidence_distribution(row):
+    """Email counts per confidence decile, plus the emails without a numeric confidence."""
+    width = 100 // CONFIDENCE_BINS
+    distribution = OrderedDict()
+    for index in range(CONFIDENCE_BINS):
+        upper = 100 if index == CONFIDENCE_BINS - 1 else (index + 1) * width - 1
+        distribution[f"{index * width}-{upper}%"] = row[f"confidence_{index}"]
+    distribution["unknown"] = row["emails"] - sum(distribution.values())
+    return distribution
+
+
+def _rates(row):
+    """Duplicate rate and average confidence of an aggregate row."""
+    scored = sum(row[f"confidence_{index}"] for index in range(CONFIDENCE_BINS))
+    return {
+        "emails": row["emails"],
+        "duplicates": row["duplicates"],
+        "duplicate_rate": round(row["duplicates"] / row["emails"], 4) if row["emails"] else 0.0,
+        "errors": row["errors"],
+        "average_confidence": round(row["confidence_total"] / scored, 2) if scored else None
+    }
+
+
+def get_summary(version, processed_from=None, processed_to=None):
+    """Returns totals, duplicate rate, confidence distribution and counts per indexed field for a time range."""
+    params = {"processed_from": processed_from, "processed_to": processed_to}
+
+    def build():
+        totals = query_aggregates(processed_from, processed_to, period_length=0)
+        empty = dict.fromkeys(["emails", "duplicates", "errors", "confidence_total"] +
+                              [f"confidence_{index}" for index in range(CONFIDENCE_BINS)], 0)
+        row = totals[0] if totals else empty
+        summary = {**_rates(row), "confidence_distribution": _confidence_distribution(row)}
+        for field in INDEXED_FIELDS:
+            summary[f"by_{field}"] = OrderedDict(
+                (group[field] or "N/A", group["emails"])
+                for group in sorted(query_aggregates(processed_from, processed_to, (field,), period_length=0),
+                                    key=lambda group: -group["emails"])
+            )
+        summary["results_version"] = version
+        return summary
+
+    return _cached("summary", params, version, build)
+
+
+def encode_cursor(values):
+    """Packs the period and group values of the last returned row into an opaque cursor."""
+    return base64.urlsafe_b64encode(json.dumps(values).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor, size):
+    """Reads a cursor of `size` values returned by get_counts; raises ValueError for anything else."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, UnicodeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(values, list) or len(values) != size or not all(isinstance(value, str) for value in values):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def get_counts(version, period="day", group_by=("request_type",), processed_from=None, processed_to=None,
+               limit=100, cursor=None):
+    """Returns one page of email counts per period and group, newest period first.
+
+    group_by is any combination of request_type, sub_request_type and assigned_to.
+    Pass the returned next_cursor to fetch the following page.
+    """
+    if period not in PERIODS:
+        raise ValueError(f"period must be one of {', '.join(PERIODS)}")
+    group_by = tuple(group_by)
+    limit = max(1, min(int(limit), _settings()["max_page_size"]))
+    params = {"period": period, "group_by": group_by, "processed_from": processed_from,
+              "processed_to": processed_to, "limit": limit, "cursor": cursor}
+
+    def build():
+        rows = query_aggregates(processed_from, processed_to, group_by, PERIODS[period],
+                                decode_cursor(cursor, len(group_by) + 1) if cursor else None, limit + 1)
+        items = [{"period": row["period"], **{field: row[field] for field in group_by}, **_rates(row)}
+                 for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = encode_cursor([last["period"]] + [last[field] for field in group_by])
+        return {"items": items, "next_cursor": next_cursor, "results_version": version}
+
+    return _cached("counts", params, version, build)
@@ -0,0 +1,227 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from config_loader import config, config_version
+from field_extractor import extract_fields, local_field_names
+
+DEFAULT_DEDUP_SETTINGS = {
+    "enabled": True,
+    "db_file": "dedup_index.sqlite3",
+    "num_perm": 128,
+    "bands": 16,
+    "shingle_size": 5,
+    "near_duplicate_threshold": 0.8,
+    # Indexed classifications are reused for this long, and only under the config version that produced them
+    "ttl_seconds": 30 * 86400
+}
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_SUBJECT_PREFIX = re.compile(r"^\s*((re|fw|fwd)\s*:\s*)+", re.IGNORECASE)
+_permutations = {}
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = set()
+
+
+def _settings():
+    """Returns dedup settings from config, falling back to defaults for missing keys."""
+    return {**DEFAULT_DEDUP_SETTINGS, **config.get("dedup_index", {})}
+
+
+def _create_schema(conn):
+    conn.executescript(
+        """CREATE TABLE IF NOT EXISTS dedup_documents (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               content_hash TEXT NOT NULL UNIQUE,
+               signature BLOB NOT NULL,
+               classification TEXT NOT NULL,
+               created_at REAL NOT NULL
+           );
+           CREATE TABLE IF NOT EXISTS dedup_buckets (
+               band INTEGER NOT NULL,
+               bucket INTEGER NOT NULL,
+               document_id INTEGER NOT NULL
+           );
+           CREATE INDEX IF NOT EXISTS idx_dedup_buckets ON dedup_buckets (band, bucket);
+           CREATE INDEX IF NOT EXISTS idx_dedup_buckets_document ON dedup_buckets (document_id);
+           CREATE INDEX IF NOT EXISTS idx_dedup_documents_created_at ON dedup_documents (created_at);"""
+    )
+    # Indexes created before classifications were tied to a config version
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(dedup_documents)")}
+    if "config_version" not in columns:
+        conn.execute("ALTER TABLE dedup_documents ADD COLUMN config_version TEXT NOT NULL DEFAULT ''")
+
+
+def _connection(settings):
+    """Returns this thread's connection to the dedup index, creating its tables on first use."""
+    db_file = settings["db_file"]
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(db_file)
+    if conn is None:
+        conn = sqlite3.connect(db_file, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with _init_lock:
+            if db_file not in _initialized:
+                _create_schema(conn)
+                _initialized.add(db_file)
+        connections[db_file] = conn
+    return conn
+
+
+def normalize_text(text):
+    """Lowercases and collapses whitespace so formatting-only changes hash identically."""
+    return " ".join((text or "").lower().split())
+
+
+def _dedup_text(email_subject, email_text, attachment_text):
+    subject = _SUBJECT_PREFIX.sub("", email_subject or "")
+    return normalize_text(f"{subject}\n{email_text}\n{attachment_text or ''}")
+
+
+def content_hash(email_subject, email_text, attachment_text=None):
+    """Exact-duplicate key: SHA-256 of the active config version and the normalized subject, body and attachment text."""
+    return _hash_text(_dedup_text(email_subject, email_text, attachment_text))
+
+
+def _hash_text(text):
+    return hashlib.sha256(f"{config_version()}\n{text}".encode("utf-8")).hexdigest()
+
+
+def _refresh_extracted_data(classification, email_text, attachment_text):
+    """Replaces the locally extractable fields of a reused classification with values from the new email.
+
+    Near-duplicates often differ only in an amount or a date, so those values must
+    come from the new text rather than the indexed email.
+    """
+    extracted_data = OrderedDict(
+        (field, value) for field, value in (classification.get("extracted_data") or {}).items()
+        if field not in local_field_names()
+    )
+    extracted_data.update(extract_fields(attachment_text, email_text))
+    classification["extracted_data"] = extracted_data
+    return classification
+
+
+def _get_permutations(num_perm):
+    """Returns the fixed (a, b) coefficients of the MinHash permutations."""
+    if num_perm not in _permutations:
+        rng = np.random.RandomState(1)
+        _permutations[num_perm] = (
+            rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64),
+            rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+        )
+    return _permutations[num_perm]
+
+
+def minhash_signature(text, num_perm=128, shingle_size=5):
+    """Computes a MinHash signature over word shingles of already normalized text."""
+    words = text.split()
+    shingles = {" ".join(words[i:i + shingle_size]) for i in range(max(1, len(words) - shingle_size + 1))}
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in shingles),
+        dtype=np.uint64, count=len(shingles)
+    )
+    a, b = _get_permutations(num_perm)
+    # One vectorized pass: (a * h + b) mod p for every permutation and shingle, then min per permutation
+    permuted = (np.outer(hashes, a) + b) % _MERSENNE_PRIME & _MAX_HASH
+    return permuted.min(axis=0)
+
+
+def _band_buckets(signature, bands):
+    rows = len(signature) // bands
+    for band in range(bands):
+        digest = hashlib.blake2b(signature[band * rows:(band + 1) * rows].tobytes(), digest_size=8).digest()
+        yield band, int.from_bytes(digest, "little", signed=True)
+
+
+def find_duplicate(email_subject, email_text, attachment_text=None):
+    """Looks up an exact or near-duplicate of the email in the index.
+
+    Returns a dict with the prior classification, the match kind ("exact" or "near")
+    and the estimated Jaccard similarity, or None when the email is new. Only documents
+    indexed under the active config version within ttl_seconds are matched.
+    """
+    settings = _settings()
+    if not settings["enabled"]:
+        return None
+
+    text = _dedup_text(email_subject, email_text, attachment_text)
+    exact_hash = _hash_text(text)
+    version, oldest = config_version(), time.time() - settings["ttl_seconds"]
+    conn = _connection(settings)
+    row = conn.execute(
+        "SELECT id, classification FROM dedup_documents WHERE content_hash = ? AND created_at >= ?",
+        (exact_hash, oldest)
+    ).fetchone()
+    if row:
+        return {"document_id": row[0], "match": "exact", "similarity": 1.0,
+                "classification": json.loads(row[1], object_pairs_hook=OrderedDict)}
+
+    signature = minhash_signature(text, settings["num_perm"], settings["shingle_size"])
+    candidates = set()
+    for band, bucket in _band_buckets(signature, settings["bands"]):
+        candidates.update(doc_id for (doc_id,) in conn.execute(
+            "SELECT document_id FROM dedup_buckets WHERE band = ? AND bucket = ?", (band, bucket)
+        ))
+
+    best = None
+    for doc_id in candidates:
+        row = conn.execute(
+            "SELECT signature, classification FROM dedup_documents WHERE id = ? AND config_version = ? AND created_at >= ?",
+            (doc_id, version, oldest)
+        ).fetchone()
+        if row is None:
+            continue
+        stored_signature, classification = row
+        similarity = float(np.mean(np.frombuffer(stored_signature, dtype=np.uint64) == signature))
+        if similarity >= settings["near_duplicate_threshold"] and (best is None or similarity > best["similarity"]):
+            best = {"document_id": doc_id, "match": "near", "similarity": round(similarity, 4),
+                    "classification": json.loads(classification, object_pairs_hook=OrderedDict)}
+    if best:
+        _refresh_extracted_data(best["classification"], email_text, attachment_text)
+    return best
+
+
+def add_document(email_subject, email_text, attachment_text, classification):
+    """Indexes a classified email so later exact and near duplicates can reuse its classification.
+
+    Documents past ttl_seconds are evicted on the way, together with their LSH buckets.
+    """
+    settings = _settings()
+    if not settings["enabled"]:
+        return None
+
+    text = _dedup_text(email_subject, email_text, attachment_text)
+    signature = minhash_signature(text, settings["num_perm"], settings["shingle_size"])
+    now = time.time()
+    conn = _connection(settings)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        expired = "SELECT id FROM dedup_documents WHERE created_at < ?"
+        conn.execute(f"DELETE FROM dedup_buckets WHERE document_id IN ({expired})", (now - settings["ttl_seconds"],))
+        conn.execute(f"DELETE FROM dedup_documents WHERE id IN ({expired})", (now - settings["ttl_seconds"],))
+        cursor = conn.execute(
+            """INSERT OR IGNORE INTO dedup_documents (content_hash, signature, classification, created_at, config_version)
+               VALUES (?, ?, ?, ?, ?)""",
+            (_hash_text(text), signature.tobytes(), json.dumps(classification), now, config_version())
+        )
+        document_id = cursor.lastrowid if cursor.rowcount else None
+        if document_id is not None:
+            conn.executemany(
+                "INSERT INTO dedup_buckets (band, bucket, document_id) VALUES (?, ?, ?)",
+                [(band, bucket, document_id) for band, bucket in _band_buckets(signature, settings["bands"])]
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return document_id
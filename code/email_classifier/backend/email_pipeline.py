@@ -0,0 +1,150 @@
+import os
+import time
+from datetime import datetime
+from email_reader import read_email, release_attachments
+from attachment_parser import extract_texts_from_attachments
+from classification_cache import async_cached_compute_from_model, cached_compute_from_model
+from dedup_index import find_duplicate, add_document
+from thread_tracker import (find_prior_state, summarize_state, delta_email_text, merge_with_prior, record_message,
+                            is_acknowledgement)
+from config_loader import pinned_config
+from file_handler import save_processed_email
+from telemetry import increment, log_event, run_in_executor, span
+
+
+def run_email_pipeline(source, store_errors=True):
+    """Parses an email (raw bytes, binary stream or path), extracts attachment text and classifies it.
+
+    Everything stays in memory; only attachments above the spill threshold touch a
+    private temp directory, which is removed before returning. The whole email is
+    processed on one config snapshot, even if config.json is reloaded meanwhile.
+    With store_errors=False a failed classification is returned but not stored, for
+    callers such as the job queue that retry it.
+    """
+    start = time.perf_counter()
+    with pinned_config():
+        parsed = _parse(source)
+        try:
+            state = _prepare_email(parsed)
+            if state["classify"]:
+                # **Process email using AI model**
+                with span("classification"):
+                    state["classification_result"] = cached_compute_from_model(*state["classify"])
+            return _finish_email(state, start, store_errors)
+        finally:
+            release_attachments(parsed["attachments"])
+
+
+async def async_run_email_pipeline(source, executor=None):
+    """run_email_pipeline for the async server.
+
+    Parsing, attachment extraction, lookups and storage run on executor (attachment
+    OCR still fans out to the extraction process pool); the model call is awaited.
+    A stream source is closed as soon as it is parsed. The config snapshot is pinned in
+    the coroutine's context, which run_in_executor carries over to the worker threads.
+    """
+    start = time.perf_counter()
+    with pinned_config():
+        parsed = await run_in_executor(executor, _parse, source)
+        if hasattr(source, "close"):
+            source.close()  # The upload is not needed once parsed; free it before the model call
+        try:
+            state = await run_in_executor(executor, _prepare_email, parsed)
+            if state["classify"]:
+                with span("classification"):
+                    state["classification_result"] = await async_cached_compute_from_model(*state["classify"], executor=executor)
+            return await run_in_executor(executor, _finish_email, state, start)
+        finally:
+            release_attachments(parsed["attachments"])
+
+
+def _parse(source):
+    with span("parse"):
+        return read_email(source)
+
+
+def _prepare_email(parsed):
+    """Runs everything up to classification: attachment text, duplicate and thread lookups.
+
+    Returns the pipeline state. state["classify"] holds the cached_compute_from_model
+    arguments when the model is needed; otherwise state["classification_result"] is set.
+    """
+    email_text = parsed["email_text"]
+    email_subject = email_text.split("\n")[0].replace("Subject: ", "").strip()
+    for attachment in parsed["attachments"]:
+        increment("attachments_total", type=os.path.splitext(attachment.filename)[1].lower().lstrip(".") or "none")
+
+    # Extract text from attachments (in parallel across attachments and scanned pages)
+    with span("attachments", count=len(parsed["attachments"])):
+        attachment_texts = extract_texts_from_attachments(parsed["attachments"])
+    combined_attachment_text = "\n".join(attachment_texts)
+
+    # Only the text is needed from here on; drop the payloads before waiting on the model
+    state = {"parsed": parsed, "email_subject": email_subject, "email_text": email_text,
+             "attachment_text": combined_attachment_text, "attachment_count": len(parsed["attachments"]),
+             "dedup_text": parsed["segments"][0],
+             "duplicate": None, "prior_state": None, "classify": None, "classification_result": None}
+    release_attachments(parsed["attachments"])
+    parsed["attachments"] = []
+
+    # Exact and near-duplicates reuse the prior classification without calling the model. Only
+    # the newest segment is compared: a reply above a long quote must not match the quoted original
+    with span("dedup_lookup"):
+        duplicate = find_duplicate(email_subject, state["dedup_text"], combined_attachment_text)
+    if duplicate:
+        increment("duplicate_matches_total", match=duplicate["match"])
+        state["duplicate"] = duplicate
+        state["classification_result"] = duplicate["classification"]
+        state["classification_result"]["DuplicateFlag"] = True
+        return state
+
+    # Replies to a known thread are classified from the newest segment plus a summary of the thread so far
+    with span("thread_lookup"):
+        prior_state = state["prior_state"] = find_prior_state(parsed)
+    if prior_state and is_acknowledgement(parsed["segments"][0]):
+        state["classification_result"] = merge_with_prior(prior_state, {**prior_state["classification"], "DuplicateFlag": True})
+        state["classification_result"]["classification_tier"] = "thread"
+    elif prior_state:
+        increment("thread_incremental_total")
+        state["classify"] = (email_subject, delta_email_text(parsed), combined_attachment_text, summarize_state(prior_state))
+    else:
+        state["classify"] = (email_subject, email_text, combined_attachment_text)
+    return state
+
+
+def _finish_email(state, start, store_errors=True):
+    """Indexes, records and stores a classified email and returns the response payload."""
+    parsed, email_subject, email_text = state["parsed"], state["email_subject"], state["email_text"]
+    duplicate, prior_state = state["duplicate"], state["prior_state"]
+    classification_result = state["classification_result"]
+    if state["classify"] and "error" not in classification_result:
+        if prior_state:
+            classification_result = merge_with_prior(prior_state, classification_result)
+        with span("dedup_index"):
+            add_document(email_subject, state["dedup_text"], state["attachment_text"], classification_result)
+    if not duplicate:
+        record_message(parsed, classification_result, prior_state)
+
+    email_data = {
+        "email_subject": email_subject,
+        "classification_result": classification_result,
+        "processed_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+    if prior_state:
+        email_data["thread"] = {"thread_id": prior_state["thread_id"], "prior_messages": prior_state["position"] + 1}
+    if duplicate:
+        email_data["duplicate_of"] = {key: duplicate[key] for key in ("document_id", "match", "similarity")}
+
+    # **Store processed email**
+    if store_errors or "error" not in classification_result:
+        with span("store"):
+            save_processed_email(email_data, email_text)
+
+    tier = "duplicate" if duplicate else classification_result.get("classification_tier", "error")
+    if "error" in classification_result:
+        increment("classification_errors_total")
+    increment("emails_processed_total", tier=tier)
+    log_event("email_processed", subject=email_subject, tier=tier,
+              request_type=classification_result.get("request_type"), error=classification_result.get("error"),
+              attachments=state["attachment_count"], duration_ms=round((time.perf_counter() - start) * 1000, 3))
+    return email_data
@@ -1,28 +1,151 @@
-import os
-from email import policy
-from email.parser import BytesParser
-from config_loader import config
-
-def extract_email_content(eml_file):
-    """Extracts text and attachments from a .eml email file."""
-    try:
-        with open(eml_file, "rb") as f:
-            msg = BytesParser(policy=policy.default).parse(f)
-
-        email_subject = msg["subject"]
-        email_body = msg.get_body(preferencelist=("plain", "html")).get_content() if msg.get_body() else ""
-
-        attachment_dir = config["attachments_dir"]
-        os.makedirs(attachment_dir, exist_ok=True)
-        extracted_attachments = []
-
-        for part in msg.iter_attachments():
-            attachment_path = os.path.join(attachment_dir, part.get_filename())
-            with open(attachment_path, "wb") as f:
-                f.write(part.get_payload(decode=True))
-            extracted_attachments.append(attachment_path)
-
-        return f"Subject: {email_subject}\nBody: {email_body}", extracted_attachments
-
-    except Exception as e:
-        return f"Error extracting email content: {str(e)}", []
+import io
+import os
+import re
+import shutil
+import tempfile
+from dataclasses import dataclass
+from email import policy
+from email.parser import BytesParser
+from config_loader import config
+
+DEFAULT_SPILL_THRESHOLD_BYTES = 20 * 1024 * 1024
+
+# Lines that introduce an earlier message in a reply: "On ... wrote:", Outlook separators and header blocks
+_REPLY_SEPARATOR = re.compile(r"^\s*(on\s.+\swrote:|-{2,}\s*original message\s*-{2,}|_{10,})\s*$", re.IGNORECASE)
+_FORWARDED_HEADER = re.compile(r"^\s*from:\s.+", re.IGNORECASE)
+_HEADER_FOLLOW_UP = re.compile(r"^\s*(sent|date|to|subject):", re.IGNORECASE)
+_QUOTE_PREFIX = re.compile(r"^((?:\s*>)+)\s?")
+_MESSAGE_ID = re.compile(r"<[^<>\s]+>")
+
+
+@dataclass
+class Attachment:
+    """An email attachment held in memory, or spilled to a private temp file when large."""
+    filename: str
+    data: bytes = None
+    path: str = None
+
+    @property
+    def size(self):
+        return len(self.data) if self.data is not None else os.path.getsize(self.path)
+
+    def open(self):
+        """Returns a binary stream over the attachment payload."""
+        if self.data is not None:
+            return io.BytesIO(self.data)
+        return open(self.path, "rb")
+
+
+def _spill_threshold():
+    return config.get("email_parsing", {}).get("spill_threshold_bytes", DEFAULT_SPILL_THRESHOLD_BYTES)
+
+
+def read_email(source):
+    """Parses an email from raw bytes, a binary stream or a .eml path without touching disk.
+
+    Returns a dict with the subject, body, the combined "Subject/Body" text used by the
+    classifier and a list of Attachment objects. Attachments larger than
+    email_parsing.spill_threshold_bytes are written to a private temp directory; call
+    release_attachments() once they are no longer needed.
+    """
+    parser = BytesParser(policy=policy.default)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        msg = parser.parsebytes(bytes(source))
+    elif isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            msg = parser.parse(f)
+    else:
+        msg = parser.parse(source)
+
+    email_subject = msg["subject"]
+    email_body = msg.get_body(preferencelist=("plain", "html")).get_content() if msg.get_body() else ""
+
+    spill_threshold = _spill_threshold()
+    spill_dir = None
+    attachments = []
+    for part in msg.iter_attachments():
+        filename = os.path.basename(part.get_filename() or "attachment")
+        payload = part.get_payload(decode=True) or b""
+        if len(payload) > spill_threshold:
+            spill_dir = spill_dir or tempfile.mkdtemp(prefix="attachments_")
+            attachment_path = os.path.join(spill_dir, f"{len(attachments)}_{filename}")
+            with open(attachment_path, "wb") as f:
+                f.write(payload)
+            attachments.append(Attachment(filename, path=attachment_path))
+        else:
+            attachments.append(Attachment(filename, data=payload))
+
+    return {
+        "subject": email_subject,
+        "body": email_body,
+        "email_text": f"Subject: {email_subject}\nBody: {email_body}",
+        "attachments": attachments,
+        "message_id": (msg["message-id"] or "").strip() or None,
+        "in_reply_to": next(iter(_MESSAGE_ID.findall(str(msg["in-reply-to"] or ""))), None),
+        "references": _MESSAGE_ID.findall(str(msg["references"] or "")),
+        "segments": split_thread_segments(email_body)
+    }
+
+
+def _starts_segment(lines, index, line):
+    if _REPLY_SEPARATOR.match(line):
+        return True
+    # Outlook-style "From: / Sent: / To: / Subject:" header blocks of the quoted message
+    return bool(_FORWARDED_HEADER.match(line)) and index > 0 and any(
+        _HEADER_FOLLOW_UP.match(following) for following in lines[index + 1:index + 4]
+    )
+
+
+def split_thread_segments(body):
+    """Splits an email body into its thread segments, newest first.
+
+    The first segment is what the sender wrote; each following segment is an earlier
+    message quoted below it, found at "On ... wrote:" lines, Outlook separators and
+    header blocks, or a deeper level of ">" quoting. Quote markers are stripped.
+    """
+    lines = (body or "").splitlines()
+    segments, current, current_depth = [], [], 0
+    attribution_only = False  # the current segment so far only holds its "On ... wrote:" line
+    for index, line in enumerate(lines):
+        quote = _QUOTE_PREFIX.match(line)
+        depth = quote.group(1).count(">") if quote else 0
+        text = line[quote.end():] if quote else line
+        if depth > current_depth and attribution_only:
+            current_depth = depth  # The quoted text belongs to the attribution line above it
+        elif current and (depth > current_depth or _starts_segment(lines, index, text)):
+            segments.append("\n".join(current).strip())
+            current = []
+        if not current:
+            current_depth = depth
+            attribution_only = bool(_REPLY_SEPARATOR.match(text))
+        elif text.strip():
+            attribution_only = False
+        current.append(text)
+    if current:
+        segments.append("\n".join(current).strip())
+    return [segment for segment in segments if segment] or [""]
+
+
+def segment_content(segment):
+    """Returns a thread segment without its leading "On ... wrote:" or forwarded header lines."""
+    lines = segment.splitlines()
+    while lines and (not lines[0].strip() or _REPLY_SEPARATOR.match(lines[0])
+                     or _FORWARDED_HEADER.match(lines[0]) or _HEADER_FOLLOW_UP.match(lines[0])):
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def release_attachments(attachments):
+    """Removes the temp files of attachments that were spilled to disk."""
+    for spill_dir in {os.path.dirname(att.path) for att in attachments if att.path}:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+
+def extract_email_content(eml_file):
+    """Extracts text and attachments from a .eml email file (path, bytes or stream)."""
+    try:
+        parsed = read_email(eml_file)
+        return parsed["email_text"], parsed["attachments"]
+
+    except Exception as e:
+        return f"Error extracting email content: {str(e)}", []
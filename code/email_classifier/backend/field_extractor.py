@@ -0,0 +1,197 @@
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from config_loader import config, config_version
+
+DEFAULT_EXTRACTION_SETTINGS = {
+    "enabled": True,
+    # extractable_fields entry -> value type; fields not listed here are left to the LLM
+    "field_types": {
+        "CUSIP": "cusip",
+        "ISIN": "isin",
+        "ABA Number": "aba",
+        "Account Number": "account",
+        "Previous Principal Balance": "amount",
+        "New Principal Balance": "amount",
+        "Interest Amount": "amount",
+        "Fees": "amount",
+        "Total Payment Amount": "amount",
+        "Expiration Date": "date"
+    },
+    # Other ways the same field is labelled in notices, in addition to its own name
+    "label_aliases": {
+        "CUSIP": ["CUSIP No", "CUSIP Number"],
+        "ISIN": ["ISIN Code"],
+        "ABA Number": ["ABA", "ABA Routing Number", "Routing Number", "Routing No"],
+        "Account Number": ["Account No", "Account", "Acct No", "Acct", "A/C"],
+        "Expiration Date": ["Expiry Date", "Maturity Date"]
+    }
+}
+
+_MONTH = r"(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.?"
+
+VALUE_PATTERNS = {
+    "cusip": r"[0-9A-Z]{8}[0-9]",
+    "isin": r"[A-Z]{2}[0-9A-Z]{9}[0-9]",
+    "aba": r"[0-9]{9}",
+    "account": r"[0-9][0-9-]{4,18}[0-9]",
+    "amount": r"(?:(?:[$€£]|usd|eur|gbp)\s?[0-9][0-9,]*(?:\.[0-9]+)?|[0-9]{1,3}(?:,[0-9]{3})+(?:\.[0-9]{2})?|[0-9]+\.[0-9]{2})(?:\s?(?:usd|eur|gbp)\b)?",
+    "date": rf"[0-9]{{1,2}}/[0-9]{{1,2}}/[0-9]{{2,4}}|[0-9]{{4}}-[0-9]{{2}}-[0-9]{{2}}|[0-9]{{1,2}}[ -]{_MONTH}[ -],?[0-9]{{4}}|{_MONTH} [0-9]{{1,2}},? [0-9]{{4}}"
+}
+
+# Between a label and its value: punctuation, "No."/"Number", "of", "is", "due on" and similar
+_SEPARATOR = r"[^\S\n]*(?:[:#=\-]|\bno\.|\bnumber\b|\bof\b|\bis\b|\bdue\b|\bon\b|[^\S\n])*"
+
+_DATE_FORMATS = ("%m/%d/%Y", "%m/%d/%y", "%Y-%m-%d", "%d %b %Y", "%b %d %Y")
+
+_engine_lock = threading.Lock()
+_engine_cache = {}
+
+
+def _settings():
+    """Returns field extraction settings from config, falling back to defaults for missing keys."""
+    return {**DEFAULT_EXTRACTION_SETTINGS, **config.get("field_extraction", {})}
+
+
+def _char_value(char):
+    return int(char) if char.isdigit() else ord(char.upper()) - 55
+
+
+def is_valid_cusip(value):
+    """Checks the CUSIP check digit (modulus 10, double-add-double)."""
+    if not re.fullmatch(r"[0-9A-Z]{8}[0-9]", value):
+        return False
+    total = 0
+    for index, char in enumerate(value[:8]):
+        digit = _char_value(char) * (2 if index % 2 else 1)
+        total += digit // 10 + digit % 10
+    return (10 - total % 10) % 10 == int(value[8])
+
+
+def is_valid_isin(value):
+    """Checks the ISIN check digit (Luhn over the letters-as-numbers expansion)."""
+    if not re.fullmatch(r"[A-Z]{2}[0-9A-Z]{9}[0-9]", value):
+        return False
+    digits = [int(digit) for digit in "".join(str(_char_value(char)) for char in value)]
+    total = 0
+    for index, digit in enumerate(reversed(digits)):
+        if index % 2:
+            digit *= 2
+        total += digit // 10 + digit % 10
+    return total % 10 == 0
+
+
+def is_valid_aba(value):
+    """Checks the ABA routing number checksum (weights 3, 7, 1)."""
+    if not re.fullmatch(r"[0-9]{9}", value) or value == "000000000":
+        return False
+    digits = [int(digit) for digit in value]
+    return (3 * (digits[0] + digits[3] + digits[6]) + 7 * (digits[1] + digits[4] + digits[7])
+            + digits[2] + digits[5] + digits[8]) % 10 == 0
+
+
+def _is_valid_date(value):
+    """Accepts dates that parse as a real calendar date in one of the supported layouts."""
+    if not re.match(r"[0-9]{4}-", value):
+        value = value.replace("-", " ")
+    # "Sept." / "September" / "Sep," all become "Sep"
+    words = [word[:3] if word[:1].isalpha() else word for word in value.replace(",", " ").replace(".", "").split()]
+    value = " ".join(words)
+    for date_format in _DATE_FORMATS:
+        try:
+            datetime.strptime(value, date_format)
+            return True
+        except ValueError:
+            continue
+    return False
+
+
+VALIDATORS = {
+    "cusip": is_valid_cusip,
+    "isin": is_valid_isin,
+    "aba": is_valid_aba,
+    "account": lambda value: 6 <= sum(char.isdigit() for char in value) <= 17,
+    "amount": lambda value: any(char.isdigit() for char in value),
+    "date": _is_valid_date
+}
+
+
+def _normalize(value_type, value):
+    return value.upper() if value_type in ("cusip", "isin") else value.strip()
+
+
+def _get_engine(settings):
+    """Compiles every labelled field into one alternation, once per config version."""
+    version = config_version()
+    with _engine_lock:
+        engine = _engine_cache.get(version)
+        if engine is None:
+            groups, alternatives = {}, []
+            for index, (field, value_type) in enumerate(settings["field_types"].items()):
+                if value_type not in VALUE_PATTERNS:
+                    continue
+                labels = sorted({field, *settings["label_aliases"].get(field, [])}, key=len, reverse=True)
+                label_pattern = "|".join(re.escape(label).replace(r"\ ", r"\s+") for label in labels)
+                groups[f"f{index}"] = (field, value_type)
+                alternatives.append(rf"\b(?:{label_pattern}){_SEPARATOR}(?P<f{index}>{VALUE_PATTERNS[value_type]})(?![0-9A-Za-z])")
+            bare_isin = next((field for field, value_type in settings["field_types"].items() if value_type == "isin"), None)
+            if bare_isin:
+                # ISINs are distinctive enough (and check-digit protected) to pick up without a label
+                groups["bare_isin"] = (bare_isin, "isin")
+                alternatives.append(rf"(?-i:\b(?P<bare_isin>{VALUE_PATTERNS['isin']})\b)")
+            engine = {"pattern": re.compile("|".join(alternatives), re.IGNORECASE), "groups": groups}
+            _engine_cache.clear()  # Only the active config version is ever needed
+            _engine_cache[version] = engine
+        return engine
+
+
+def extract_fields(*texts):
+    """Extracts regular fields (identifiers, account numbers, amounts, dates) in one pass per text.
+
+    Values must follow their label (or, for ISINs, match the ISIN format) and pass the
+    type's check-digit or format validation. The first valid value of a field wins, in
+    the order the texts are given. Returns an OrderedDict of field -> value.
+    """
+    settings = _settings()
+    found = OrderedDict()
+    if not settings["enabled"]:
+        return found
+    engine = _get_engine(settings)
+    for text in texts:
+        if not text:
+            continue
+        for match in engine["pattern"].finditer(text):
+            group = match.lastgroup
+            field, value_type = engine["groups"][group]
+            if field in found:
+                continue
+            value = _normalize(value_type, match.group(group))
+            if VALIDATORS[value_type](value):
+                found[field] = value
+    return found
+
+
+def local_field_names():
+    """Returns the names of the fields extract_fields can find with the current config."""
+    settings = _settings()
+    if not settings["enabled"]:
+        return set()
+    return {field for field, value_type in settings["field_types"].items() if value_type in VALUE_PATTERNS}
+
+
+def validate_extracted(extracted_data):
+    """Drops identifier values from an LLM response that fail their check digit.
+
+    Returns (kept, rejected) where rejected lists the field names that were removed.
+    """
+    field_types = _settings()["field_types"]
+    kept, rejected = OrderedDict(), []
+    for field, value in (extracted_data or {}).items():
+        value_type = field_types.get(field)
+        if value_type in ("cusip", "isin", "aba") and isinstance(value, str) \
+                and not VALIDATORS[value_type](_normalize(value_type, value.replace(" ", ""))):
+            rejected.append(field)
+            continue
+        kept[field] = value
+    return kept, rejected
@@ -0,0 +1,343 @@
+import argparse
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from config_loader import config
+from telemetry import log_event, new_correlation_id
+
+DEFAULT_QUEUE_SETTINGS = {
+    "db_file": "job_queue.sqlite3",
+    "workers": 2,
+    "embedded_workers": True,
+    "max_attempts": 3,
+    "retry_backoff_seconds": 5,
+    "max_queue_depth": 500,
+    "lease_seconds": 600,
+    "poll_interval_seconds": 1.0,
+    # Retry-After for a full queue when no job finished recently to estimate the drain rate from
+    "retry_after_seconds": 30
+}
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = set()
+_wakeup = threading.Event()
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class QueueFullError(Exception):
+    """Raised when the queue is deeper than max_queue_depth; callers should retry after ``retry_after`` seconds."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _settings():
+    """Returns job queue settings from config, falling back to defaults for missing keys."""
+    return {**DEFAULT_QUEUE_SETTINGS, **config.get("job_queue", {})}
+
+
+def get_connection():
+    """Returns this thread's connection to the job database, creating the schema on first use."""
+    db_file = _settings()["db_file"]
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(db_file)
+    if conn is None:
+        conn = sqlite3.connect(db_file, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        with _init_lock:
+            if db_file not in _initialized:
+                conn.executescript(
+                    """CREATE TABLE IF NOT EXISTS jobs (
+                           id TEXT PRIMARY KEY,
+                           filename TEXT,
+                           payload BLOB,
+                           status TEXT NOT NULL,
+                           attempts INTEGER NOT NULL DEFAULT 0,
+                           max_attempts INTEGER NOT NULL,
+                           available_at REAL NOT NULL,
+                           lease_expires_at REAL,
+                           worker TEXT,
+                           result TEXT,
+                           error TEXT,
+                           created_at REAL NOT NULL,
+                           updated_at REAL NOT NULL
+                       );
+                       CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, available_at);
+                       CREATE INDEX IF NOT EXISTS idx_jobs_updated_at ON jobs (status, updated_at);"""
+                )
+                _initialized.add(db_file)
+        connections[db_file] = conn
+    return conn
+
+
+def queue_depth(conn=None):
+    """Returns the number of jobs waiting or being processed."""
+    conn = conn or get_connection()
+    return conn.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')").fetchone()[0]
+
+
+def retry_after_seconds(conn=None):
+    """Estimates how long until the queue has room again, from its depth and the jobs finished in the last minute."""
+    settings = _settings()
+    conn = conn or get_connection()
+    excess = queue_depth(conn) - settings["max_queue_depth"] + 1
+    finished = conn.execute(
+        "SELECT COUNT(*) FROM jobs WHERE status IN ('done', 'dead') AND updated_at >= ?", (time.time() - 60,)
+    ).fetchone()[0]
+    if excess <= 0:
+        return 1
+    if not finished:
+        return settings["retry_after_seconds"]
+    return max(1, min(int(excess * 60 / finished + 0.999), settings["lease_seconds"]))
+
+
+def submit_job(data, filename=None):
+    """Persists a raw .eml payload as a queued job and returns its id.
+
+    Raises QueueFullError when max_queue_depth jobs are already waiting, so ingestion
+    slows down instead of growing the backlog without bound.
+    """
+    settings = _settings()
+    conn = get_connection()
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if queue_depth(conn) >= settings["max_queue_depth"]:
+            raise QueueFullError(f"Job queue is full ({settings['max_queue_depth']} jobs pending)", retry_after_seconds(conn))
+        conn.execute(
+            """INSERT INTO jobs (id, filename, payload, status, max_attempts, available_at, created_at, updated_at)
+               VALUES (?, ?, ?, 'queued', ?, ?, ?, ?)""",
+            (job_id, filename, bytes(data), settings["max_attempts"], now, now, now)
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    _wakeup.set()
+    return job_id
+
+
+def claim_job(worker_id):
+    """Leases the oldest runnable job to a worker and returns (job_id, payload), or None.
+
+    Jobs still marked running whose lease has expired (their worker crashed or the
+    process restarted) are claimed again, so in-flight work is never lost.
+    """
+    settings = _settings()
+    now = time.time()
+    conn = get_connection()
+    # A job that keeps taking its worker down is dead-lettered instead of being retried forever
+    conn.execute(
+        """UPDATE jobs SET status = 'dead', error = 'Worker lease expired on the final attempt', updated_at = ?
+           WHERE status = 'running' AND lease_expires_at < ? AND attempts >= max_attempts""",
+        (now, now)
+    )
+    row = conn.execute(
+        """UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?,
+                  lease_expires_at = ?, updated_at = ?
+           WHERE id = (SELECT id FROM jobs
+                       WHERE (status = 'queued' AND available_at <= ?) OR (status = 'running' AND lease_expires_at < ?)
+                       ORDER BY available_at LIMIT 1)
+           RETURNING id, payload""",
+        (worker_id, now + settings["lease_seconds"], now, now, now)
+    ).fetchone()
+    return (row[0], row[1]) if row else None
+
+
+def complete_job(job_id, worker_id, result):
+    """Stores a job's result and drops its payload.
+
+    Returns False when the job is no longer leased to worker_id (its lease expired and
+    another worker reclaimed it); the result is then discarded.
+    """
+    cursor = get_connection().execute(
+        """UPDATE jobs SET status = 'done', result = ?, error = NULL, payload = NULL, updated_at = ?
+           WHERE id = ? AND status = 'running' AND worker = ?""",
+        (json.dumps(result), time.time(), job_id, worker_id)
+    )
+    return cursor.rowcount == 1
+
+
+def fail_job(job_id, worker_id, error):
+    """Schedules a failed job for retry with exponential backoff, or dead-letters it after max_attempts.
+
+    Returns the new status, or None when the job is no longer leased to worker_id.
+    """
+    settings = _settings()
+    now = time.time()
+    conn = get_connection()
+    row = conn.execute(
+        "SELECT attempts, max_attempts FROM jobs WHERE id = ? AND status = 'running' AND worker = ?", (job_id, worker_id)
+    ).fetchone()
+    if row is None:
+        return None
+    attempts, max_attempts = row
+    if attempts >= max_attempts:
+        status, available_at = "dead", None
+    else:
+        status, available_at = "queued", now + settings["retry_backoff_seconds"] * 2 ** (attempts - 1)
+    cursor = conn.execute(
+        """UPDATE jobs SET status = ?, error = ?, available_at = COALESCE(?, available_at), updated_at = ?
+           WHERE id = ? AND status = 'running' AND worker = ?""",
+        (status, error, available_at, now, job_id, worker_id)
+    )
+    return status if cursor.rowcount == 1 else None
+
+
+def retry_dead_job(job_id):
+    """Moves a dead-lettered job back to the queue with a fresh attempt budget. Returns False if it is not dead."""
+    now = time.time()
+    cursor = get_connection().execute(
+        "UPDATE jobs SET status = 'queued', attempts = 0, available_at = ?, updated_at = ? WHERE id = ? AND status = 'dead'",
+        (now, now, job_id)
+    )
+    _wakeup.set()
+    return cursor.rowcount == 1
+
+
+def get_job(job_id):
+    """Returns a job's status, attempts, last error and result (once done), or None."""
+    row = get_connection().execute(
+        "SELECT id, filename, status, attempts, max_attempts, error, result, created_at, updated_at FROM jobs WHERE id = ?",
+        (job_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    return {
+        "job_id": row[0],
+        "filename": row[1],
+        "status": row[2],
+        "attempts": row[3],
+        "max_attempts": row[4],
+        "error": row[5],
+        "result": json.loads(row[6]) if row[6] else None,
+        "created_at": row[7],
+        "updated_at": row[8]
+    }
+
+
+def get_queue_stats():
+    """Returns job counts per status and the configured queue limits."""
+    settings = _settings()
+    counts = dict(get_connection().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+    oldest = get_connection().execute("SELECT MIN(created_at) FROM jobs WHERE status = 'queued'").fetchone()[0]
+    return {
+        "counts": {status: counts.get(status, 0) for status in ("queued", "running", "done", "dead")},
+        "depth": counts.get("queued", 0) + counts.get("running", 0),
+        "max_queue_depth": settings["max_queue_depth"],
+        "oldest_queued_age_seconds": round(time.time() - oldest, 3) if oldest else None,
+        "workers": _pool.size if _pool else 0
+    }
+
+
+def process_job(payload):
+    """Runs the email pipeline for one queued payload.
+
+    Failed attempts are retried, so only a successful classification is stored.
+    """
+    from email_pipeline import run_email_pipeline
+
+    return run_email_pipeline(payload, store_errors=False)
+
+
+class WorkerPool:
+    """Threads that drain the job queue until stopped."""
+
+    def __init__(self, size):
+        self.size = size
+        self.stopping = threading.Event()
+        self.threads = []
+        self.worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+
+    def start(self):
+        for index in range(self.size):
+            thread = threading.Thread(target=self._run, args=(f"{self.worker_prefix}:{index}",),
+                                      name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self, timeout=None):
+        self.stopping.set()
+        _wakeup.set()
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def _run(self, worker_id):
+        poll_interval = _settings()["poll_interval_seconds"]
+        while not self.stopping.is_set():
+            job = claim_job(worker_id)
+            if job is None:
+                _wakeup.wait(poll_interval)
+                _wakeup.clear()
+                continue
+            job_id, payload = job
+            new_correlation_id(job_id)
+            try:
+                result = process_job(payload)
+            except Exception as e:
+                status = fail_job(job_id, worker_id, f"{type(e).__name__}: {e}")
+                log_event("job_failed", logging.ERROR, job_id=job_id, status=status, error=str(e),
+                          traceback=traceback.format_exc())
+                continue
+            # The classifier reports OpenAI errors, timeouts and unparseable replies in the result
+            error = (result.get("classification_result") or {}).get("error")
+            if error:
+                status = fail_job(job_id, worker_id, f"ClassificationError: {error}")
+                log_event("job_failed", logging.ERROR, job_id=job_id, status=status, error=error)
+            elif complete_job(job_id, worker_id, result):
+                log_event("job_completed", job_id=job_id)
+            else:
+                log_event("job_lease_lost", logging.WARNING, job_id=job_id, worker=worker_id)
+
+
+def ensure_workers():
+    """Starts the in-process worker pool once, if embedded workers are enabled."""
+    global _pool
+    settings = _settings()
+    if not settings["embedded_workers"]:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool(settings["workers"])
+            _pool.start()
+        return _pool
+
+
+def stop_workers(timeout=None):
+    """Stops the in-process worker pool; unfinished jobs are picked up again after their lease expires."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.stop(timeout)
+            _pool = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a standalone worker pool that drains the email job queue.")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker threads (default: job_queue.workers)")
+    args = parser.parse_args()
+
+    pool = WorkerPool(args.workers or _settings()["workers"])
+    pool.start()
+    print(f"Draining {_settings()['db_file']} with {pool.size} workers")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pool.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import json
+import logging
+import threading
+from dataclasses import dataclass, field
+from config_loader import config
+import llm_client
+from prompt_builder import build_batch_prompt, count_tokens
+from telemetry import increment, log_event, span
+
+DEFAULT_BATCH_SETTINGS = {
+    "enabled": False,
+    "max_batch_size": 8,
+    "max_batch_tokens": 2000,
+    "max_wait_ms": 25,
+    "max_email_tokens": 250
+}
+
+
+def _settings():
+    """Returns micro-batching settings from config, falling back to defaults for missing keys."""
+    return {**DEFAULT_BATCH_SETTINGS, **config.get("llm_batching", {})}
+
+
+@dataclass
+class _PendingEmail:
+    email: dict
+    tokens: int
+    done: threading.Event = field(default_factory=threading.Event)
+    result: dict = None
+
+
+@dataclass
+class _Batch:
+    items: list = field(default_factory=list)
+    tokens: int = 0
+    closed: threading.Event = field(default_factory=threading.Event)
+
+
+class MicroBatcher:
+    """Packs concurrent classification requests for short emails into shared completions.
+
+    The first caller to join an empty batch leads it: it waits up to max_wait_ms for
+    others to join (or until the count or token cap closes the batch early), sends one
+    chat completion for everyone and hands each caller its own result. Followers block
+    until then. No background thread is involved.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._open = None
+
+    def submit(self, email, tokens, settings):
+        """Classifies one email as part of a batch; returns its parsed result, or None to fall back."""
+        item = _PendingEmail(email, tokens)
+        with self._lock:
+            batch, leader = self._open, False
+            if batch is None or len(batch.items) >= settings["max_batch_size"] \
+                    or batch.tokens + tokens > settings["max_batch_tokens"]:
+                if batch is not None:
+                    batch.closed.set()
+                batch = self._open = _Batch()
+                leader = True
+            batch.items.append(item)
+            batch.tokens += tokens
+            if len(batch.items) >= settings["max_batch_size"] or batch.tokens >= settings["max_batch_tokens"]:
+                self._open = None
+                batch.closed.set()
+
+        if not leader:
+            item.done.wait()
+            return item.result
+
+        batch.closed.wait(settings["max_wait_ms"] / 1000)
+        with self._lock:
+            if self._open is batch:
+                self._open = None
+        try:
+            _run_batch(batch.items)
+        finally:
+            for pending in batch.items:
+                pending.done.set()
+        return item.result
+
+
+def _parse_batch_response(content):
+    """Returns {id: result} from a JSON array response (or an object wrapping one)."""
+    cleaned = content.replace("```json", "").replace("```", "").strip()
+    parsed = json.loads(cleaned)
+    if isinstance(parsed, dict):
+        parsed = next((value for value in parsed.values() if isinstance(value, list)), [])
+    return {str(entry["id"]): entry for entry in parsed if isinstance(entry, dict) and "id" in entry}
+
+
+def _run_batch(items):
+    """Sends one completion for the whole batch and stores each email's result on its item.
+
+    A batch of one, an API error or an unparseable response leaves results as None so
+    that callers fall back to their own single-email request.
+    """
+    if len(items) < 2:
+        return
+    emails = [{**item.email, "id": str(index)} for index, item in enumerate(items, start=1)]
+    prompt, stats = build_batch_prompt(emails)
+    increment("llm_prompt_tokens_total", stats["prompt_tokens"])
+    try:
+        with span("llm_batch_call", emails=len(items)):
+            response = llm_client.chat_completion(
+                messages=[
+                    {"role": "system",
+                     "content": "You are an AI email classifier. Always respond in pure JSON format without markdown (` ``` `)."},
+                    {"role": "user", "content": prompt}
+                ],
+                estimated_prompt_tokens=stats["prompt_tokens"],
+                expected_responses=len(items)
+            )
+        content = response.choices[0].message.content.strip()
+        results = _parse_batch_response(content)
+    except Exception as e:
+        increment("llm_batch_fallbacks_total", len(items))
+        log_event("llm_batch_failed", logging.WARNING, emails=len(items), error=str(e))
+        return
+
+    response_tokens = getattr(getattr(response, "usage", None), "completion_tokens", None)
+    increment("llm_response_tokens_total", response_tokens if isinstance(response_tokens, int) else count_tokens(content))
+    increment("llm_batches_total")
+    for email, item in zip(emails, items):
+        item.result = results.get(email["id"])
+    missing = sum(item.result is None for item in items)
+    increment("llm_batched_emails_total", len(items) - missing)
+    increment("llm_batch_fallbacks_total", missing)
+
+
+_batcher = MicroBatcher()
+
+
+def classify(email_subject, email_text, attachment_text=None, thread_context=None, fields=None):
+    """Classifies a short email through the shared micro-batcher.
+
+    fields lists the extractable fields still needed from the model (None for all).
+    Returns the model's parsed result for this email, or None when the email is not
+    eligible or its batch could not be answered, in which case the caller should send
+    its own request.
+    """
+    settings = _settings()
+    if not settings["enabled"]:
+        return None
+    tokens = count_tokens(email_subject) + count_tokens(email_text) + count_tokens(attachment_text) + count_tokens(thread_context)
+    if tokens > settings["max_email_tokens"]:
+        return None
+    email = {"subject": email_subject, "body": email_text, "attachments": attachment_text,
+             "thread_context": thread_context, "fields": fields}
+    return _batcher.submit(email, tokens, settings)
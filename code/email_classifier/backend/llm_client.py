@@ -0,0 +1,362 @@
+import abc
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+import openai
+from config_loader import config
+from prompt_builder import count_tokens
+
+DEFAULT_LLM_SETTINGS = {
+    "backend": "openai",
+    "base_url": None,
+    "model": "gpt-3.5-turbo",
+    "timeout_seconds": 60,
+    "requests_per_minute": 3500,
+    "tokens_per_minute": 90000,
+    "max_retries": 5,
+    "backoff_base_seconds": 0.5,
+    "backoff_max_seconds": 30,
+    "expected_completion_tokens": 400,
+    "stub_latency_ms": 0
+}
+
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError)
+
+_backend = None
+_backend_lock = threading.Lock()
+_scheduler = None
+_scheduler_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {"requests": 0, "retries": 0, "rate_limited": 0, "failures": 0, "throttle_wait_seconds": 0.0}
+
+
+def _settings():
+    """Returns LLM client settings from config, falling back to defaults for missing keys."""
+    return {**DEFAULT_LLM_SETTINGS, **config.get("llm", {})}
+
+
+class TokenBucket:
+    """Thread-safe token bucket that refills continuously up to its capacity."""
+
+    def __init__(self, capacity, refill_per_second):
+        self.capacity = float(capacity)
+        self.refill_per_second = float(refill_per_second)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+
+    def reserve(self, amount):
+        """Takes ``amount`` tokens, going into debt if needed, and returns how long to wait."""
+        amount = min(float(amount), self.capacity)
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens -= amount
+            return max(0.0, -self.tokens / self.refill_per_second)
+
+    def adjust(self, amount):
+        """Gives back (negative amount) or charges extra tokens once the real usage is known."""
+        with self.lock:
+            self._refill(time.monotonic())
+            self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class RateLimitScheduler:
+    """Paces requests to stay under the requests-per-minute and tokens-per-minute limits."""
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = TokenBucket(requests_per_minute, requests_per_minute / 60)
+        self.tokens = TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+
+    def acquire(self, estimated_tokens):
+        """Blocks until both budgets allow the request and returns the time spent waiting."""
+        wait = self.reserve(estimated_tokens)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def reserve(self, estimated_tokens):
+        """Takes one request and the estimated tokens from the budgets and returns how long to wait."""
+        return max(self.requests.reserve(1), self.tokens.reserve(estimated_tokens))
+
+    def settle(self, estimated_tokens, actual_tokens):
+        """Corrects the token budget with the usage reported by the API."""
+        if actual_tokens is not None:
+            self.tokens.adjust(actual_tokens - estimated_tokens)
+
+
+class LLMBackend(abc.ABC):
+    """Interface for chat completion backends.
+
+    ``create_chat_completion`` must return an object shaped like the OpenAI response:
+    ``response.choices[0].message.content`` and optionally ``response.usage.total_tokens``.
+    """
+
+    @abc.abstractmethod
+    def create_chat_completion(self, model, messages, **kwargs):
+        """Sends one chat completion request and returns the response."""
+
+    async def acreate_chat_completion(self, model, messages, **kwargs):
+        """Async variant; backends without a native async client run the blocking call in a thread."""
+        return await asyncio.to_thread(self.create_chat_completion, model, messages, **kwargs)
+
+
+class OpenAIBackend(LLMBackend):
+    """OpenAI (or any OpenAI-compatible server via base_url) through one pooled client.
+
+    The client keeps its HTTP connection pool for the life of the process; retries
+    are handled by chat_completion so the SDK's own retries are disabled.
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.client = openai.OpenAI(**self._client_options())
+        self.async_client = None
+
+    def _client_options(self):
+        return {
+            "api_key": config.get("OPENAI_API_KEY") or None,
+            "base_url": self.settings["base_url"] or None,
+            "timeout": self.settings["timeout_seconds"],
+            "max_retries": 0
+        }
+
+    def create_chat_completion(self, model, messages, **kwargs):
+        return self.client.chat.completions.create(model=model, messages=messages, **kwargs)
+
+    async def acreate_chat_completion(self, model, messages, **kwargs):
+        # Created on first use so that it binds to the serving event loop
+        if self.async_client is None:
+            self.async_client = openai.AsyncOpenAI(**self._client_options())
+        return await self.async_client.chat.completions.create(model=model, messages=messages, **kwargs)
+
+
+class StubBackend(LLMBackend):
+    """Deterministic offline backend for tests and load runs.
+
+    Picks the first classification_criteria label mentioned in the email section of the
+    prompt and answers after a fixed latency, without any network access.
+    """
+
+    def __init__(self, latency_ms=0):
+        self.latency_ms = latency_ms
+
+    def create_chat_completion(self, model, messages, **kwargs):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        prompt = messages[-1]["content"]
+        return make_completion_response(stub_classification(prompt), count_tokens(prompt))
+
+    async def acreate_chat_completion(self, model, messages, **kwargs):
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        prompt = messages[-1]["content"]
+        return make_completion_response(stub_classification(prompt), count_tokens(prompt))
+
+
+def stub_classification(prompt):
+    """Returns the JSON content a deterministic stub answers with for a prompt.
+
+    Batched prompts (several "#### **Email <id>**" sections) get a JSON array with one
+    object per email.
+    """
+    if "### **Emails to Analyze**" in prompt:
+        sections = prompt.split("### **Emails to Analyze**")[-1].split("#### **Email ")[1:]
+        return json.dumps([
+            {"id": section.split("**", 1)[0], **_stub_result(section.lower())} for section in sections
+        ])
+    return json.dumps(_stub_result(prompt.split("### **Email to Analyze**")[-1].lower()))
+
+
+def _stub_result(email_section):
+    request_type, sub_request_type = next(iter(config["classification_criteria"].items()))
+    sub_request_type = sub_request_type[0] if sub_request_type else "N/A"
+    for candidate, sub_types in config["classification_criteria"].items():
+        matching_subs = [sub for sub in sub_types if sub.lower() in email_section]
+        if candidate.lower() in email_section or matching_subs:
+            request_type = candidate
+            sub_request_type = matching_subs[0] if matching_subs else (sub_types[0] if sub_types else "N/A")
+            break
+    amounts = re.findall(r"(?:usd|\$)\s?[\d,]+(?:\.\d{2})?", email_section)
+    return {
+        "request_type": request_type,
+        "sub_request_type": sub_request_type,
+        "DuplicateFlag": False,
+        "confidence_score": "80%",
+        "context": "Deterministic stub classification.",
+        "extracted_data": {"Total Payment Amount": amounts[0].upper()} if amounts else {}
+    }
+
+
+def make_completion_response(content, prompt_tokens):
+    """Wraps content in an object shaped like an OpenAI chat completion."""
+    completion_tokens = count_tokens(content)
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(role="assistant", content=content), finish_reason="stop")],
+        usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                              total_tokens=prompt_tokens + completion_tokens)
+    )
+
+
+def _build_backend(settings):
+    if settings["backend"] == "stub":
+        return StubBackend(settings["stub_latency_ms"])
+    if settings["backend"] == "openai":
+        return OpenAIBackend(settings)
+    raise ValueError(f"Unknown LLM backend: {settings['backend']}")
+
+
+def get_backend():
+    """Returns the process-wide backend, creating it on first use."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = _build_backend(_settings())
+        return _backend
+
+
+def set_backend(backend):
+    """Replaces the process-wide backend (e.g. with a StubBackend in tests)."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+def reset_client():
+    """Drops the shared backend and scheduler so they are rebuilt from the current config."""
+    global _scheduler
+    set_backend(None)
+    with _scheduler_lock:
+        _scheduler = None
+
+
+def get_scheduler():
+    """Returns the process-wide rate limit scheduler."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            settings = _settings()
+            _scheduler = RateLimitScheduler(settings["requests_per_minute"], settings["tokens_per_minute"])
+        return _scheduler
+
+
+def _retry_delay(error, attempt, settings):
+    """Full-jitter exponential backoff, honouring Retry-After when the API sends one."""
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), settings["backoff_max_seconds"])
+        except ValueError:
+            pass
+    return random.uniform(0, min(settings["backoff_max_seconds"], settings["backoff_base_seconds"] * 2 ** attempt))
+
+
+def _count(stat, amount=1):
+    with _stats_lock:
+        _stats[stat] += amount
+
+
+def _usage_tokens(response):
+    total = getattr(getattr(response, "usage", None), "total_tokens", None)
+    return total if isinstance(total, int) else None
+
+
+class _Attempts:
+    """Pacing, retry and counter bookkeeping for one chat completion.
+
+    Shared by chat_completion and async_chat_completion, which only differ in how they
+    wait and how they call the backend.
+    """
+
+    def __init__(self, messages, model, estimated_prompt_tokens, expected_responses):
+        self.settings = _settings()
+        self.backend = get_backend()
+        self.scheduler = get_scheduler()
+        self.model = model or self.settings["model"]
+        if estimated_prompt_tokens is None:
+            estimated_prompt_tokens = sum(count_tokens(message["content"]) for message in messages)
+        self.estimated_tokens = estimated_prompt_tokens + expected_responses * self.settings["expected_completion_tokens"]
+        self.attempt = 0
+
+    def start(self):
+        """Reserves the RPM/TPM budget for the next attempt and returns how long to wait before sending it."""
+        wait = self.scheduler.reserve(self.estimated_tokens)
+        _count("throttle_wait_seconds", wait)
+        _count("requests")
+        return wait
+
+    def retry_delay(self, error):
+        """Returns the backoff before retrying after error, or re-raises it once max_retries is exhausted."""
+        if isinstance(error, openai.RateLimitError):
+            _count("rate_limited")
+        if self.attempt >= self.settings["max_retries"]:
+            _count("failures")
+            raise error
+        _count("retries")
+        delay = _retry_delay(error, self.attempt, self.settings)
+        self.attempt += 1
+        return delay
+
+    def finish(self, response):
+        """Settles the token budget with the reported usage and returns the response."""
+        self.scheduler.settle(self.estimated_tokens, _usage_tokens(response))
+        return response
+
+
+def chat_completion(messages, model=None, estimated_prompt_tokens=None, expected_responses=1, **kwargs):
+    """Sends a chat completion through the shared backend with rate limiting and retries.
+
+    expected_responses scales the completion token estimate for prompts that ask for
+    several answers at once (micro-batches).
+
+    Requests are paced by the RPM/TPM token buckets, and rate limit, connection,
+    timeout and 5xx errors are retried with jittered exponential backoff. The last
+    error is re-raised once max_retries is exhausted.
+    """
+    attempts = _Attempts(messages, model, estimated_prompt_tokens, expected_responses)
+    while True:
+        wait = attempts.start()
+        if wait:
+            time.sleep(wait)
+        try:
+            response = attempts.backend.create_chat_completion(attempts.model, messages, **kwargs)
+        except RETRYABLE_ERRORS as e:
+            time.sleep(attempts.retry_delay(e))
+            continue
+        return attempts.finish(response)
+
+
+async def async_chat_completion(messages, model=None, estimated_prompt_tokens=None, expected_responses=1, **kwargs):
+    """Awaitable chat_completion for the async server: same pacing, retries and counters.
+
+    Throttling and backoff waits yield to the event loop, and the request itself goes
+    through the backend's async client, so an in-flight call holds no thread.
+    """
+    attempts = _Attempts(messages, model, estimated_prompt_tokens, expected_responses)
+    while True:
+        wait = attempts.start()
+        if wait:
+            await asyncio.sleep(wait)
+        try:
+            response = await attempts.backend.acreate_chat_completion(attempts.model, messages, **kwargs)
+        except RETRYABLE_ERRORS as e:
+            await asyncio.sleep(attempts.retry_delay(e))
+            continue
+        return attempts.finish(response)
+
+
+def get_llm_stats():
+    """Returns request, retry and throttling counters of the shared client."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["throttle_wait_seconds"] = round(stats["throttle_wait_seconds"], 3)
+    stats["backend"] = _settings()["backend"]
+    return stats
@@ -0,0 +1,78 @@
+import argparse
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from llm_client import StubBackend
+
+
+class StubCompletionHandler(BaseHTTPRequestHandler):
+    """Serves POST /v1/chat/completions in the OpenAI format from a StubBackend."""
+
+    backend = StubBackend()
+    rate_limit_every = 0
+    _counter = itertools.count(1)
+
+    def do_POST(self):
+        if self.path.rstrip("/") not in ("/v1/chat/completions", "/chat/completions"):
+            self._send(404, {"error": {"message": "Not found"}})
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.rate_limit_every and next(self._counter) % self.rate_limit_every == 0:
+            self._send(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+                       {"retry-after": "0"})
+            return
+
+        response = self.backend.create_chat_completion(body.get("model"), body.get("messages", []))
+        self._send(200, {
+            "id": f"chatcmpl-stub-{time.time_ns()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": response.choices[0].message.content}}],
+            "usage": vars(response.usage)
+        })
+
+    def _send(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # Keep load runs quiet
+
+
+def start_stub_server(port=0, latency_ms=0, rate_limit_every=0):
+    """Starts the stub server in a daemon thread and returns it; the base_url is http://127.0.0.1:<port>/v1."""
+    handler = type("ConfiguredStubHandler", (StubCompletionHandler,), {
+        "backend": StubBackend(latency_ms), "rate_limit_every": rate_limit_every, "_counter": itertools.count(1)
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub server for tests and load runs.")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-ms", type=float, default=0, help="fixed latency added to every completion")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="answer every Nth request with HTTP 429")
+    args = parser.parse_args()
+
+    server = start_stub_server(args.port, args.latency_ms, args.rate_limit_every)
+    print(f"Stub LLM server listening on http://127.0.0.1:{server.server_address[1]}/v1")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
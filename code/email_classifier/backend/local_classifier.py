@@ -0,0 +1,277 @@
+import argparse
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter, deque
+import numpy as np
+from config_loader import config
+
+DEFAULT_CASCADE_SETTINGS = {
+    "enabled": True,
+    "model_file": "local_classifier.npz",
+    "confidence_threshold": 0.9,
+    "temperature": 0.05,
+    "max_features": 20000,
+    "min_examples_per_label": 5
+}
+
+_TOKEN_PATTERN = re.compile(r"[a-z][a-z0-9&+\-]+")
+_LATENCY_SAMPLES = 1000
+
+_model = None
+_model_mtime = None
+_model_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_stats = {"local": 0, "escalated": 0, "compared": 0, "agreed": 0}
+_latencies = {"local": deque(maxlen=_LATENCY_SAMPLES), "llm": deque(maxlen=_LATENCY_SAMPLES)}
+
+
+def _settings():
+    """Returns cascade settings from config, falling back to defaults for missing keys."""
+    return {**DEFAULT_CASCADE_SETTINGS, **config.get("local_classifier", {})}
+
+
+def tokenize(text):
+    """Returns lowercase word unigrams and bigrams."""
+    words = _TOKEN_PATTERN.findall((text or "").lower())
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+
+def label_key(request_type, sub_request_type):
+    """Joins a RequestType and SubRequestType into a single label ("N/A" counts as no sub-type)."""
+    if sub_request_type and sub_request_type != "N/A":
+        return f"{request_type} / {sub_request_type}"
+    return request_type
+
+
+def _valid_labels():
+    """Returns every label allowed by classification_criteria in config."""
+    labels = set()
+    for request_type, sub_types in config["classification_criteria"].items():
+        labels.add(label_key(request_type, None))
+        labels.update(label_key(request_type, sub_type) for sub_type in sub_types)
+    return labels
+
+
+class TfidfCentroidModel:
+    """Nearest-centroid classifier over L2-normalized TF-IDF vectors."""
+
+    def __init__(self, vocabulary, idf, centroids, labels):
+        self.vocabulary = vocabulary
+        self.idf = idf
+        self.centroids = centroids
+        self.labels = labels
+
+    def vectorize(self, text):
+        counts = Counter(token for token in tokenize(text) if token in self.vocabulary)
+        vector = np.zeros(len(self.vocabulary), dtype=np.float32)
+        if counts:
+            indices = np.fromiter((self.vocabulary[token] for token in counts), dtype=np.int64, count=len(counts))
+            values = np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+            vector[indices] = (1 + np.log(values)) * self.idf[indices]
+            norm = np.linalg.norm(vector)
+            if norm:
+                vector /= norm
+        return vector
+
+    def predict(self, text, temperature):
+        """Returns (label, confidence) where confidence is a softmax over centroid similarities."""
+        similarities = self.centroids @ self.vectorize(text)
+        scaled = (similarities - similarities.max()) / temperature
+        probabilities = np.exp(scaled) / np.exp(scaled).sum()
+        best = int(np.argmax(probabilities))
+        return self.labels[best], float(probabilities[best])
+
+    def save(self, path):
+        """Writes the model next to its final path and swaps it in atomically."""
+        vocabulary = sorted(self.vocabulary, key=self.vocabulary.get)
+        temp_path = f"{path}.tmp.npz"
+        np.savez_compressed(temp_path, vocabulary=np.array(json.dumps(vocabulary)), idf=self.idf,
+                            centroids=self.centroids, labels=np.array(json.dumps(self.labels)))
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            vocabulary = json.loads(str(data["vocabulary"]))
+            return cls({token: index for index, token in enumerate(vocabulary)}, data["idf"],
+                       data["centroids"], json.loads(str(data["labels"])))
+
+
+def train_model(examples, max_features=20000, min_examples_per_label=5):
+    """Trains a TfidfCentroidModel from (text, label) pairs.
+
+    Labels with fewer than min_examples_per_label examples are left out, so they always
+    escalate to the LLM. Returns None when no label has enough examples.
+    """
+    label_counts = Counter(label for _, label in examples)
+    examples = [(text, label) for text, label in examples if label_counts[label] >= min_examples_per_label]
+    if not examples:
+        return None
+
+    document_frequency = Counter()
+    for text, _ in examples:
+        document_frequency.update(set(tokenize(text)))
+    vocabulary = {token: index for index, (token, _) in enumerate(document_frequency.most_common(max_features))}
+    idf = np.zeros(len(vocabulary), dtype=np.float32)
+    for token, index in vocabulary.items():
+        idf[index] = math.log((1 + len(examples)) / (1 + document_frequency[token])) + 1
+
+    labels = sorted({label for _, label in examples})
+    label_index = {label: index for index, label in enumerate(labels)}
+    model = TfidfCentroidModel(vocabulary, idf, np.zeros((len(labels), len(vocabulary)), dtype=np.float32), labels)
+    for text, label in examples:
+        model.centroids[label_index[label]] += model.vectorize(text)
+    norms = np.linalg.norm(model.centroids, axis=1, keepdims=True)
+    model.centroids /= np.where(norms == 0, 1, norms)
+    return model
+
+
+def load_training_examples():
+    """Returns (text, label) pairs from stored history, skipping emails the local tier labelled itself."""
+    from results_store import iter_training_examples
+
+    valid_labels = _valid_labels()
+    examples = []
+    for text, result in iter_training_examples():
+        if result.get("classification_tier") == "local" or result.get("DuplicateFlag"):
+            continue
+        label = label_key(result.get("request_type"), result.get("sub_request_type"))
+        if label in valid_labels:
+            examples.append((text, label))
+    return examples
+
+
+def get_model():
+    """Returns the trained model, reloading it when the model file changes on disk."""
+    global _model, _model_mtime
+    path = _settings()["model_file"]
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    with _model_lock:
+        if _model is None or mtime != _model_mtime:
+            _model = TfidfCentroidModel.load(path)
+            _model_mtime = mtime
+        return _model
+
+
+def predict(email_subject, email_text):
+    """Runs the local tier and returns its prediction, or None when no model is trained.
+
+    The prediction dict holds request_type, sub_request_type, confidence (0-1),
+    whether it clears the escalation threshold, and the local latency in ms.
+    email_text already starts with its "Subject:" line, so it is scored as is, the
+    same text the model was trained on.
+    """
+    settings = _settings()
+    if not settings["enabled"]:
+        return None
+    model = get_model()
+    if model is None:
+        return None
+
+    start = time.perf_counter()
+    label, confidence = model.predict(email_text, settings["temperature"])
+    latency_ms = (time.perf_counter() - start) * 1000
+    request_type, _, sub_request_type = label.partition(" / ")
+    return {
+        "request_type": request_type,
+        "sub_request_type": sub_request_type or None,
+        "confidence": confidence,
+        "confident": confidence >= settings["confidence_threshold"],
+        "latency_ms": latency_ms
+    }
+
+
+def record_local(prediction):
+    """Counts an email answered by the local tier."""
+    with _stats_lock:
+        _stats["local"] += 1
+        _latencies["local"].append(prediction["latency_ms"])
+
+
+def record_escalation(prediction, llm_result, llm_latency_ms):
+    """Counts an email escalated to the LLM and whether the local tier agreed with it."""
+    with _stats_lock:
+        _stats["escalated"] += 1
+        _latencies["llm"].append(llm_latency_ms)
+        if prediction is not None:
+            _latencies["local"].append(prediction["latency_ms"])
+            if "error" not in llm_result:
+                _stats["compared"] += 1
+                predicted_label = label_key(prediction["request_type"], prediction["sub_request_type"])
+                if predicted_label == label_key(llm_result.get("request_type"), llm_result.get("sub_request_type")):
+                    _stats["agreed"] += 1
+
+
+def _latency_summary(samples):
+    if not samples:
+        return {"count": 0, "p50_ms": None, "p95_ms": None}
+    values = np.array(samples)
+    return {"count": len(values), "p50_ms": round(float(np.percentile(values, 50)), 3),
+            "p95_ms": round(float(np.percentile(values, 95)), 3)}
+
+
+def get_cascade_report():
+    """Returns the escalation rate, local/LLM agreement and per-tier latency."""
+    with _stats_lock:
+        stats = dict(_stats)
+        latencies = {tier: list(samples) for tier, samples in _latencies.items()}
+    total = stats["local"] + stats["escalated"]
+    return {
+        "model_loaded": get_model() is not None,
+        "confidence_threshold": _settings()["confidence_threshold"],
+        "emails": total,
+        "handled_locally": stats["local"],
+        "escalated": stats["escalated"],
+        "escalation_rate": round(stats["escalated"] / total, 4) if total else None,
+        "agreement_with_llm": round(stats["agreed"] / stats["compared"], 4) if stats["compared"] else None,
+        "agreement_samples": stats["compared"],
+        "latency": {tier: _latency_summary(samples) for tier, samples in latencies.items()}
+    }
+
+
+def evaluate(model, examples, threshold, temperature):
+    """Offline report: escalation rate and agreement with the stored LLM labels at a threshold."""
+    confident = agreed = 0
+    for text, label in examples:
+        predicted, confidence = model.predict(text, temperature)
+        if confidence >= threshold:
+            confident += 1
+            agreed += predicted == label
+    return {
+        "examples": len(examples),
+        "escalation_rate": round(1 - confident / len(examples), 4) if examples else None,
+        "agreement_when_local": round(agreed / confident, 4) if confident else None
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the local cascade classifier from stored classification history.")
+    parser.add_argument("--holdout", type=float, default=0.2, help="fraction of history held out for the evaluation report")
+    args = parser.parse_args()
+
+    settings = _settings()
+    examples = load_training_examples()
+    split = int(len(examples) * (1 - args.holdout))
+    train, holdout = examples[:split], examples[split:]
+
+    model = train_model(train, settings["max_features"], settings["min_examples_per_label"])
+    if model is None:
+        print(f"Not enough history to train ({len(examples)} usable examples).")
+        return
+    print(json.dumps(evaluate(model, holdout, settings["confidence_threshold"], settings["temperature"]), indent=4))
+
+    # The deployed model is trained on the full history
+    model = train_model(examples, settings["max_features"], settings["min_examples_per_label"])
+    model.save(settings["model_file"])
+    print(f"Saved model with {len(model.labels)} labels to {settings['model_file']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from email import policy
+from email.parser import BytesHeaderParser
+from config_loader import config
+from telemetry import log_event, new_correlation_id
+
+DEFAULT_INGEST_SETTINGS = {
+    "db_file": "mail_ingest.sqlite3",
+    "concurrency": 4,
+    "max_attempts": 3,
+    "checkpoint_every": 50
+}
+
+_FROM_LINE = re.compile(rb"^From ")
+_QUOTED_FROM_LINE = re.compile(rb"^>+From ")
+_HEAD_BYTES = 4096
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = set()
+
+
+def _settings():
+    """Returns mail ingestion settings from config, falling back to defaults for missing keys."""
+    return {**DEFAULT_INGEST_SETTINGS, **config.get("mail_ingest", {})}
+
+
+def _create_schema(conn):
+    conn.executescript(
+        """CREATE TABLE IF NOT EXISTS mbox_checkpoints (
+               path TEXT PRIMARY KEY,
+               byte_offset INTEGER NOT NULL,
+               head_hash TEXT NOT NULL,
+               updated_at REAL NOT NULL
+           );
+           CREATE TABLE IF NOT EXISTS ingested_messages (
+               message_key TEXT PRIMARY KEY,
+               source TEXT NOT NULL,
+               status TEXT NOT NULL,
+               attempts INTEGER NOT NULL,
+               error TEXT,
+               updated_at REAL NOT NULL
+           );
+           CREATE TABLE IF NOT EXISTS maildir_files (
+               maildir TEXT NOT NULL,
+               unique_name TEXT NOT NULL,
+               message_key TEXT NOT NULL,
+               PRIMARY KEY (maildir, unique_name)
+           );"""
+    )
+
+
+def _connection(settings):
+    """Returns this thread's connection to the checkpoint database, creating its tables on first use."""
+    db_file = settings["db_file"]
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(db_file)
+    if conn is None:
+        conn = sqlite3.connect(db_file, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with _init_lock:
+            if db_file not in _initialized:
+                _create_schema(conn)
+                _initialized.add(db_file)
+        connections[db_file] = conn
+    return conn
+
+
+def iter_mbox(path, start_offset=0):
+    """Streams (start_offset, end_offset, raw bytes) for each message of an mbox file.
+
+    The file is read line by line from start_offset, so only one message is held in
+    memory at a time. ">From " quoting (mboxo/mboxrd) is undone on the way out.
+    """
+    with open(path, "rb") as file:
+        file.seek(start_offset)
+        offset = start_offset
+        message_start, lines = None, []
+        previous_blank = True
+        for line in iter(file.readline, b""):
+            if previous_blank and _FROM_LINE.match(line):
+                if message_start is not None:
+                    yield message_start, offset, _finish_message(lines)
+                message_start, lines = offset, []
+            elif message_start is not None:
+                lines.append(line[1:] if _QUOTED_FROM_LINE.match(line) else line)
+            offset += len(line)
+            previous_blank = line in (b"\n", b"\r\n")
+        if message_start is not None:
+            yield message_start, offset, _finish_message(lines)
+
+
+def _finish_message(lines):
+    # The blank line before the next "From " separator belongs to the mbox format, not the message
+    if lines and lines[-1] in (b"\n", b"\r\n"):
+        lines = lines[:-1]
+    return b"".join(lines)
+
+
+def _maildir_files(path):
+    """Lists (unique name, file path) for every message in a Maildir's new/ and cur/ folders without opening them."""
+    for folder in ("new", "cur"):
+        directory = os.path.join(path, folder)
+        if not os.path.isdir(directory):
+            continue
+        for name in sorted(entry.name for entry in os.scandir(directory) if entry.is_file() and not entry.name.startswith(".")):
+            # Flags after ":2," change when mail is read; the part before it is stable
+            yield name.split(":", 1)[0], os.path.join(directory, name)
+
+
+def iter_maildir(path, skip=frozenset()):
+    """Streams (unique name, raw bytes) for every message in a Maildir; names in skip are not read."""
+    for name, file_path in _maildir_files(path):
+        if name in skip:
+            continue
+        with open(file_path, "rb") as file:
+            yield name, file.read()
+
+
+def message_key(raw_bytes):
+    """Identifies a message by its Message-ID header, or by a hash of its content when it has none."""
+    headers = BytesHeaderParser(policy=policy.default).parsebytes(raw_bytes)
+    message_id = (headers.get("Message-ID") or "").strip()
+    return message_id or f"sha256:{hashlib.sha256(raw_bytes).hexdigest()}"
+
+
+def _head_hash(path, byte_offset):
+    """Hashes the start of the already processed region, which only changes if the file was replaced."""
+    with open(path, "rb") as file:
+        return hashlib.sha256(file.read(min(_HEAD_BYTES, byte_offset))).hexdigest()
+
+
+def _load_checkpoint(conn, path):
+    """Returns the offset to resume an mbox from, restarting when the file was rotated or truncated."""
+    row = conn.execute("SELECT byte_offset, head_hash FROM mbox_checkpoints WHERE path = ?", (path,)).fetchone()
+    if row is None:
+        return 0
+    byte_offset, head_hash = row
+    if os.path.getsize(path) < byte_offset or _head_hash(path, byte_offset) != head_hash:
+        return 0
+    return byte_offset
+
+
+def _save_checkpoint(conn, path, byte_offset):
+    conn.execute(
+        "INSERT OR REPLACE INTO mbox_checkpoints (path, byte_offset, head_hash, updated_at) VALUES (?, ?, ?, ?)",
+        (path, byte_offset, _head_hash(path, byte_offset), time.time())
+    )
+
+
+def _is_done(conn, key, max_attempts):
+    row = conn.execute("SELECT status, attempts FROM ingested_messages WHERE message_key = ?", (key,)).fetchone()
+    return row is not None and (row[0] == "ok" or row[1] >= max_attempts)
+
+
+def _done_maildir_names(conn, path, max_attempts):
+    """Returns the unique names of a Maildir's files whose message needs no more processing."""
+    rows = conn.execute(
+        """SELECT f.unique_name FROM maildir_files f JOIN ingested_messages m ON m.message_key = f.message_key
+           WHERE f.maildir = ? AND (m.status = 'ok' OR m.attempts >= ?)""",
+        (path, max_attempts)
+    ).fetchall()
+    return {row[0] for row in rows}
+
+
+def _remember_maildir_file(conn, path, name, key):
+    conn.execute("INSERT OR REPLACE INTO maildir_files (maildir, unique_name, message_key) VALUES (?, ?, ?)",
+                 (path, name, key))
+
+
+def _record_result(conn, key, source, result):
+    """Stores the outcome of one processing attempt for a message."""
+    status = result["status"]
+    error = result.get("error") or (result.get("classification_result") or {}).get("error")
+    conn.execute(
+        """INSERT INTO ingested_messages (message_key, source, status, attempts, error, updated_at)
+           VALUES (?, ?, ?, 1, ?, ?)
+           ON CONFLICT (message_key) DO UPDATE SET
+               source = excluded.source, status = excluded.status, attempts = attempts + 1,
+               error = excluded.error, updated_at = excluded.updated_at""",
+        (key, source, status, error, time.time())
+    )
+
+
+def _advance_checkpoint(order, finished, checkpoint):
+    """Moves the checkpoint past the leading run of finished messages only, so nothing unfinished is skipped."""
+    while order and order[0][0] in finished:
+        sequence, end_offset = order.popleft()
+        finished.discard(sequence)
+        if end_offset is not None:
+            checkpoint = end_offset
+    return checkpoint
+
+
+def ingest(kind, path, concurrency=None, limit=None):
+    """Classifies new messages from an mbox file or Maildir and checkpoints progress.
+
+    Messages already recorded as processed (by Message-ID, or content hash when there
+    is none) are skipped; Maildir files seen before are skipped by unique name without
+    being read. For mbox files the byte offset of the last fully processed
+    message is checkpointed, so a re-run seeks straight past old mail. Messages that
+    keep failing are given up on after max_attempts runs. Returns a summary dict.
+    """
+    from batch_processor import process_batch
+
+    settings = _settings()
+    path = os.path.abspath(path)
+    concurrency = concurrency or settings["concurrency"]
+    summary = {"source": path, "kind": kind, "processed": 0, "errors": 0, "skipped": 0, "start_offset": 0}
+
+    conn = _connection(settings)
+    if kind == "mbox":
+        summary["start_offset"] = _load_checkpoint(conn, path)
+        messages = ((f"offset:{start}", end, raw) for start, end, raw in iter_mbox(path, summary["start_offset"]))
+    else:
+        known = _done_maildir_names(conn, path, settings["max_attempts"])
+        summary["skipped"] = sum(name in known for name, _ in _maildir_files(path))
+        messages = ((f"maildir:{name}", None, raw) for name, raw in iter_maildir(path, known))
+
+    order = deque()   # (sequence, end_offset) of messages not yet below the checkpoint
+    finished = set()  # sequences that no longer need processing
+    pending = {}      # source label -> (sequence, key)
+
+    def items():
+        for sequence, (position, end_offset, raw) in enumerate(messages):
+            if limit is not None and summary["processed"] + summary["errors"] + len(pending) >= limit:
+                return
+            key = message_key(raw)
+            if kind == "maildir":
+                _remember_maildir_file(conn, path, position.split(":", 1)[1], key)
+            order.append((sequence, end_offset))
+            if _is_done(conn, key, settings["max_attempts"]):
+                summary["skipped"] += 1
+                finished.add(sequence)
+                continue
+            source = f"{os.path.basename(path)}:{position}"
+            pending[source] = (sequence, key)
+            yield source, raw
+
+    checkpoint = summary["start_offset"]
+    completed = 0
+    for result in process_batch(items(), concurrency):
+        sequence, key = pending.pop(result["source"])
+        _record_result(conn, key, result["source"], result)
+        summary["processed" if result["status"] == "ok" else "errors"] += 1
+        if result["status"] == "ok" or _is_done(conn, key, settings["max_attempts"]):
+            finished.add(sequence)
+        completed += 1
+
+        checkpoint = _advance_checkpoint(order, finished, checkpoint)
+        if kind == "mbox" and completed % settings["checkpoint_every"] == 0:
+            _save_checkpoint(conn, path, checkpoint)
+
+    checkpoint = _advance_checkpoint(order, finished, checkpoint)
+    if kind == "mbox":
+        _save_checkpoint(conn, path, checkpoint)
+    summary["checkpoint_offset"] = checkpoint if kind == "mbox" else None
+
+    log_event("mail_ingest_completed", **summary)
+    return summary
+
+
+def detect_kind(path):
+    """Maildirs are directories with cur/ and new/ folders; anything else is read as an mbox file."""
+    if os.path.isdir(path):
+        if os.path.isdir(os.path.join(path, "cur")) or os.path.isdir(os.path.join(path, "new")):
+            return "maildir"
+        raise ValueError(f"{path} is a directory but not a Maildir")
+    return "mbox"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classify new mail from mbox files or Maildirs (safe to run from cron).")
+    parser.add_argument("paths", nargs="+", help="mbox files or Maildir directories")
+    parser.add_argument("--concurrency", type=int, default=None, help="emails classified in parallel")
+    parser.add_argument("--limit", type=int, default=None, help="stop after this many new messages per source")
+    args = parser.parse_args()
+
+    new_correlation_id()
+    for path in args.paths:
+        print(json.dumps(ingest(detect_kind(path), path, args.concurrency, args.limit)))
+
+
+if __name__ == "__main__":
+    main()
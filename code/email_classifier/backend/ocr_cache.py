@@ -0,0 +1,197 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from config_loader import config
+from telemetry import increment
+
+DEFAULT_OCR_CACHE_SETTINGS = {
+    "enabled": True,
+    "memory_entries": 2048,
+    "db_file": "ocr_cache.sqlite3",
+    "ttl_seconds": 30 * 86400,
+    "max_disk_entries": 200000,
+    "max_disk_bytes": 200 * 1024 * 1024
+}
+
+_memory_cache = OrderedDict()
+_lock = threading.Lock()
+_stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = set()
+
+
+def _settings():
+    """Returns OCR cache settings from config, falling back to defaults for missing keys."""
+    return {**DEFAULT_OCR_CACHE_SETTINGS, **config.get("ocr_cache", {})}
+
+
+def _create_schema(conn):
+    # Entry and byte totals are kept by triggers so eviction never scans the table
+    conn.executescript(
+        """CREATE TABLE IF NOT EXISTS ocr_cache (
+               image_hash TEXT PRIMARY KEY,
+               text TEXT NOT NULL,
+               created_at REAL NOT NULL
+           );
+           CREATE INDEX IF NOT EXISTS idx_ocr_cache_created_at ON ocr_cache (created_at);
+           CREATE TABLE IF NOT EXISTS ocr_cache_totals (
+               id INTEGER PRIMARY KEY CHECK (id = 0),
+               entries INTEGER NOT NULL,
+               bytes INTEGER NOT NULL
+           );
+           INSERT OR IGNORE INTO ocr_cache_totals (id, entries, bytes)
+               SELECT 0, COUNT(*), COALESCE(SUM(length(text)), 0) FROM ocr_cache;
+           CREATE TRIGGER IF NOT EXISTS ocr_totals_insert AFTER INSERT ON ocr_cache BEGIN
+               UPDATE ocr_cache_totals SET entries = entries + 1, bytes = bytes + length(new.text);
+           END;
+           CREATE TRIGGER IF NOT EXISTS ocr_totals_update AFTER UPDATE OF text ON ocr_cache BEGIN
+               UPDATE ocr_cache_totals SET bytes = bytes + length(new.text) - length(old.text);
+           END;
+           CREATE TRIGGER IF NOT EXISTS ocr_totals_delete AFTER DELETE ON ocr_cache BEGIN
+               UPDATE ocr_cache_totals SET entries = entries - 1, bytes = bytes - length(old.text);
+           END;"""
+    )
+
+
+def _connection(settings):
+    """Returns this thread's connection to the on-disk OCR cache, creating the table on first use.
+
+    Connections are keyed by process id as well: an extraction pool worker forked from a
+    thread that already had one must not reuse the parent's connection.
+    """
+    key = (os.getpid(), settings["db_file"])
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(key)
+    if conn is None:
+        conn = sqlite3.connect(settings["db_file"], timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with _init_lock:
+            if settings["db_file"] not in _initialized:
+                _create_schema(conn)
+                _initialized.add(settings["db_file"])
+        connections[key] = conn
+    return conn
+
+
+def image_key(image_bytes):
+    """Content hash of an embedded image, identical for every copy of a logo or letterhead."""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def _count(stat, amount=1):
+    with _lock:
+        _stats[stat] += amount
+    increment("ocr_cache_lookups_total", amount, result=stat)
+
+
+def _memory_put(key, text, max_entries):
+    with _lock:
+        _memory_cache[key] = text
+        _memory_cache.move_to_end(key)
+        while len(_memory_cache) > max_entries:
+            _memory_cache.popitem(last=False)
+
+
+def get_cached_text(key):
+    """Returns the cached OCR text for an image hash, or None on a miss."""
+    settings = _settings()
+    if not settings["enabled"]:
+        return None
+    with _lock:
+        text = _memory_cache.get(key)
+        if text is not None:
+            _memory_cache.move_to_end(key)
+    if text is not None:
+        _count("memory_hits")
+        return text
+
+    row = _connection(settings).execute(
+        "SELECT text FROM ocr_cache WHERE image_hash = ? AND created_at >= ?",
+        (key, time.time() - settings["ttl_seconds"])
+    ).fetchone()
+    _count("disk_hits" if row else "misses")
+    if row is None:
+        return None
+    _memory_put(key, row[0], settings["memory_entries"])
+    return row[0]
+
+
+def store_text(key, text):
+    """Stores the OCR text of an image in both cache tiers, evicting expired and oldest disk entries."""
+    settings = _settings()
+    if not settings["enabled"]:
+        return
+    _memory_put(key, text, settings["memory_entries"])
+    now = time.time()
+    conn = _connection(settings)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            """INSERT INTO ocr_cache (image_hash, text, created_at) VALUES (?, ?, ?)
+               ON CONFLICT (image_hash) DO UPDATE SET text = excluded.text, created_at = excluded.created_at""",
+            (key, text, now)
+        )
+        evicted = conn.execute("DELETE FROM ocr_cache WHERE created_at < ?", (now - settings["ttl_seconds"],)).rowcount
+        while True:
+            entries, total_bytes = conn.execute("SELECT entries, bytes FROM ocr_cache_totals").fetchone()
+            excess = entries - settings["max_disk_entries"]
+            if total_bytes > settings["max_disk_bytes"]:
+                excess = max(excess, 1)
+            if excess <= 0:
+                break
+            evicted += conn.execute(
+                "DELETE FROM ocr_cache WHERE image_hash IN (SELECT image_hash FROM ocr_cache ORDER BY created_at LIMIT ?)",
+                (excess,)
+            ).rowcount
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    if evicted:
+        _count("evictions", evicted)
+
+
+def clear_memory_cache():
+    """Empties the in-memory tier (the SQLite tier is kept)."""
+    with _lock:
+        _memory_cache.clear()
+
+
+def stats_snapshot():
+    """Returns a copy of the lookup counters, to diff against after work done in a pool worker."""
+    with _lock:
+        return dict(_stats)
+
+
+def stats_since(snapshot):
+    """Returns the counter increments since stats_snapshot() was taken."""
+    with _lock:
+        return {stat: value - snapshot.get(stat, 0) for stat, value in _stats.items() if value != snapshot.get(stat, 0)}
+
+
+def merge_stats(delta):
+    """Adds the counters a pool worker reported for its lookups to this process's counters and metrics."""
+    for stat, amount in (delta or {}).items():
+        _count(stat, amount)
+
+
+def get_ocr_cache_stats():
+    """Returns hit/miss counters of OCR cache lookups (including pool workers') and the size of the disk tier."""
+    with _lock:
+        stats = dict(_stats)
+        stats["memory_entries"] = len(_memory_cache)
+    lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+    stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else None
+    settings = _settings()
+    if settings["enabled"]:
+        stats["disk_entries"], stats["disk_bytes"] = _connection(settings).execute(
+            "SELECT entries, bytes FROM ocr_cache_totals"
+        ).fetchone()
+    return stats
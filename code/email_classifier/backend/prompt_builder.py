@@ -0,0 +1,263 @@
+import json
+import re
+import threading
+from collections import deque
+from config_loader import config, current_snapshot
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken is optional; fall back to a character-based estimate
+    tiktoken = None
+
+DEFAULT_PROMPT_SETTINGS = {
+    "max_prompt_tokens": 3000,
+    "max_body_tokens": 1200,
+    "chunk_tokens": 150,
+    "encoding": "cl100k_base"
+}
+
+PROMPT_HEADER = """You are an AI email classifier specializing in financial transactions.
+
+### **Task**
+1. **Context-Based Classification:** Identify the **RequestType** and **SubRequestType**.
+2. **Context-Based Data Extraction:** Extract relevant financial details based on **RequestType**.
+3. **Priority Handling:** Prefer email content for classification, use attachments for numerical data.
+4. **Duplicate Detection:** If latest response in thread contains generic text (e.g., "Thank you"), mark `"DuplicateFlag": true`.
+5. **Assign Request:** Route the request to the appropriate **team or person**.
+6. **Confidence Scoring:** Provide a **confidence score (0-100%)**.
+"""
+
+RESPONSE_FORMAT = """### **Expected JSON Response Format**
+You **must** return a **pure JSON** response with **no markdown formatting** or extra characters:
+{{
+    "request_type": "<RequestType>",
+    "sub_request_type": "<SubRequestType>",
+    "DuplicateFlag": {duplicate_flag},
+    "confidence_score": "<Confidence Score in %>",
+    "assigned_to": "<Team or Individual>",
+    "role": "<Role Responsible>",
+    "context": "<Explanation based on email and attachments>",
+    "extracted_data": {{
+        "<Relevant Field 1>": "<Value>",
+        "<Relevant Field 2>": "<Value>"
+    }}
+}}
+"""
+
+BATCH_RESPONSE_FORMAT = """### **Expected JSON Response Format**
+Classify every email above on its own. You **must** return a **pure JSON array** with exactly one object per email, carrying the email's id, and **no markdown formatting** or extra characters:
+[
+    {
+        "id": "<Email id>",
+        "request_type": "<RequestType>",
+        "sub_request_type": "<SubRequestType>",
+        "confidence_score": "<Confidence Score in %>",
+        "context": "<Explanation based on email and attachments>",
+        "extracted_data": {
+            "<Relevant Field 1>": "<Value>"
+        }
+    }
+]
+"""
+
+_AMOUNT_PATTERN = re.compile(r"(\$|usd|eur|gbp)\s?\d|\d[\d,]*\.\d{2}\b|\b\d{9}\b|\b[A-Z]{2}[A-Z0-9]{9}\d\b", re.IGNORECASE)
+_TERM_PATTERN = re.compile(r"[a-z]+")
+_STOP_TERMS = {"name", "number", "amount", "new", "previous", "date"}
+
+_static_cache = {}
+_static_lock = threading.Lock()
+_encoder = None
+_stats_lock = threading.Lock()
+_stats = {"requests": 0, "prompt_tokens": 0, "tokens_saved": 0, "truncated_requests": 0}
+_recent = deque(maxlen=100)
+
+
+def _settings():
+    """Returns prompt builder settings from config, falling back to defaults for missing keys."""
+    return {**DEFAULT_PROMPT_SETTINGS, **config.get("prompt_builder", {})}
+
+
+def count_tokens(text):
+    """Counts tokens with tiktoken when installed, otherwise estimates ~4 characters per token."""
+    global _encoder
+    if not text:
+        return 0
+    if tiktoken is not None:
+        if _encoder is None:
+            _encoder = tiktoken.get_encoding(_settings()["encoding"])
+        return len(_encoder.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def get_static_prompt(fields=None):
+    """Returns the static prompt prefix and field relevance terms, built once per config version.
+
+    fields narrows the Extractable Fields section to the ones still needed from the
+    model (the rest were extracted locally); None lists every configured field.
+    """
+    snapshot = current_snapshot(config)
+    key = (snapshot.version, None if fields is None else tuple(fields))
+    with _static_lock:
+        static = _static_cache.get(key)
+        if static is None:
+            fragments = snapshot.prompt_fragments
+            field_list = fragments["extractable_fields"] if fields is None else json.dumps(list(fields), indent=4)
+            prefix = (
+                f"{PROMPT_HEADER}\n"
+                f"### **Classification Criteria**\n{fragments['classification_criteria']}\n\n"
+                f"### **Extractable Fields**\n{field_list}\n\n"
+            )
+            terms = {term for field in (snapshot.data.get("extractable_fields", []) if fields is None else fields)
+                     for term in _TERM_PATTERN.findall(field.lower())} - _STOP_TERMS
+            static = {"prefix": prefix, "prefix_tokens": count_tokens(prefix), "field_terms": terms}
+            if any(cached_key[0] != snapshot.version for cached_key in _static_cache):
+                _static_cache.clear()  # Only the active config version is ever needed
+            _static_cache[key] = static
+        return static
+
+
+def _iter_lines(text, max_chars):
+    """Yields the lines of text, cutting very long lines (e.g. unwrapped PDF text) into windows."""
+    for line in text.splitlines():
+        for start in range(0, max(len(line), 1), max_chars):
+            yield line[start:start + max_chars]
+
+
+def _split_chunks(text, chunk_tokens):
+    """Splits text on line boundaries into chunks of roughly chunk_tokens tokens."""
+    chunks, current, current_tokens = [], [], 0
+    for line in _iter_lines(text, chunk_tokens * 4):
+        line_tokens = count_tokens(line)
+        if current and current_tokens + line_tokens > chunk_tokens:
+            chunks.append("\n".join(current))
+            current, current_tokens = [], 0
+        current.append(line)
+        current_tokens += line_tokens
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+def _chunk_score(chunk, field_terms):
+    """Scores how likely a chunk is to hold extractable field values."""
+    lowered = chunk.lower()
+    return sum(lowered.count(term) for term in field_terms) + 2 * len(_AMOUNT_PATTERN.findall(chunk))
+
+
+def select_relevant_text(text, budget_tokens, field_terms, chunk_tokens):
+    """Keeps the chunks most relevant to the extractable fields within a token budget.
+
+    Chunks are ranked by relevance but emitted in their original order, with an
+    [...] marker at every gap, so the model still reads a coherent document.
+    """
+    if count_tokens(text) <= budget_tokens:
+        return text
+    if budget_tokens <= 0:
+        return ""
+
+    chunks = _split_chunks(text, chunk_tokens)
+    ranked = sorted(range(len(chunks)), key=lambda index: (-_chunk_score(chunks[index], field_terms), index))
+    selected, used = set(), 0
+    for index in ranked:
+        tokens = count_tokens(chunks[index])
+        if used + tokens <= budget_tokens:
+            selected.add(index)
+            used += tokens
+
+    parts, previous = [], -1
+    for index in sorted(selected):
+        if index != previous + 1:
+            parts.append("[...]")
+        parts.append(chunks[index])
+        previous = index
+    if previous != len(chunks) - 1:
+        parts.append("[...]")
+    return "\n".join(parts)
+
+
+def build_prompt(email_subject, email_text, attachment_text, is_duplicate, thread_context=None, fields=None):
+    """Builds the classification prompt within the configured token budget.
+
+    thread_context is a short summary of earlier messages in the thread, sent instead
+    of the quoted history when only the newest reply is being classified. fields limits
+    extraction to the given extractable fields. Returns (prompt, stats) where stats
+    reports the prompt size and the tokens saved by trimming the email body and attachments.
+    """
+    settings = _settings()
+    static = get_static_prompt(fields)
+    response_format = RESPONSE_FORMAT.format(duplicate_flag=str(is_duplicate).lower())
+
+    body = select_relevant_text(email_text or "", settings["max_body_tokens"], static["field_terms"], settings["chunk_tokens"])
+    history = f"**Thread History:** {thread_context}\n" if thread_context else ""
+    fixed_tokens = (static["prefix_tokens"] + count_tokens(response_format) + count_tokens(email_subject)
+                    + count_tokens(body) + count_tokens(history) + 30)
+    attachment_budget = settings["max_prompt_tokens"] - fixed_tokens
+    attachments = select_relevant_text(attachment_text or "", attachment_budget, static["field_terms"], settings["chunk_tokens"])
+
+    prompt = (
+        f"{static['prefix']}"
+        f"### **Email to Analyze**\n"
+        f"**Subject:** {email_subject}\n"
+        f"{history}"
+        f"**Email Content:** {body}\n"
+        f"**Attachment Content:** {attachments or 'No Attachment'}\n\n"
+        f"{response_format}"
+    )
+
+    original_tokens = count_tokens(email_text) + count_tokens(attachment_text)
+    kept_tokens = count_tokens(body) + count_tokens(attachments)
+    stats = {
+        "prompt_tokens": count_tokens(prompt),
+        "tokens_saved": max(0, original_tokens - kept_tokens),
+        "truncated": kept_tokens < original_tokens
+    }
+    _record(stats)
+    return prompt, stats
+
+
+def build_batch_prompt(emails):
+    """Builds one prompt that classifies several short emails behind a single static prefix.
+
+    emails is a list of dicts with id, subject, body, attachments and optionally
+    thread_context and fields (the extractable fields still needed for that email, None
+    for all). The prompt lists the union of the fields the emails still need.
+    Emails are expected to be short enough to need no trimming.
+    Returns (prompt, stats) like build_prompt.
+    """
+    if any(email.get("fields") is None for email in emails):
+        fields = None
+    else:
+        fields = list(dict.fromkeys(field for email in emails for field in email["fields"]))
+    static = get_static_prompt(fields)
+    sections = []
+    for email in emails:
+        history = f"**Thread History:** {email['thread_context']}\n" if email.get("thread_context") else ""
+        sections.append(
+            f"#### **Email {email['id']}**\n"
+            f"**Subject:** {email['subject']}\n"
+            f"{history}"
+            f"**Email Content:** {email['body']}\n"
+            f"**Attachment Content:** {email['attachments'] or 'No Attachment'}\n"
+        )
+    prompt = f"{static['prefix']}### **Emails to Analyze**\n" + "\n".join(sections) + "\n" + BATCH_RESPONSE_FORMAT
+    stats = {"prompt_tokens": count_tokens(prompt), "tokens_saved": 0, "truncated": False, "emails": len(emails)}
+    _record(stats)
+    return prompt, stats
+
+
+def _record(stats):
+    with _stats_lock:
+        _stats["requests"] += 1
+        _stats["prompt_tokens"] += stats["prompt_tokens"]
+        _stats["tokens_saved"] += stats["tokens_saved"]
+        _stats["truncated_requests"] += stats["truncated"]
+        _recent.append(stats)
+
+
+def get_prompt_stats():
+    """Returns aggregate prompt size and tokens saved, plus the most recent requests."""
+    with _stats_lock:
+        stats = dict(_stats)
+        stats["recent"] = list(_recent)
+    stats["average_prompt_tokens"] = round(stats["prompt_tokens"] / stats["requests"], 1) if stats["requests"] else None
+    return stats
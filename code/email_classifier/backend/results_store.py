@@ -0,0 +1,334 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from config_loader import config
+
+DEFAULT_STORE_SETTINGS = {
+    "db_file": "processed_emails.sqlite3",
+    "max_page_size": 200
+}
+
+INDEXED_FIELDS = ("request_type", "sub_request_type", "assigned_to")
+
+# Confidence deciles kept per aggregate row: confidence_0 counts 0-9%, ..., confidence_9 counts 90-100%
+CONFIDENCE_BINS = 10
+_CONFIDENCE_COLUMNS = [f"confidence_{index}" for index in range(CONFIDENCE_BINS)]
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = set()
+
+
+def _settings():
+    """Returns results store settings from config, falling back to defaults for missing keys."""
+    return {**DEFAULT_STORE_SETTINGS, **config.get("results_store", {})}
+
+
+def get_db_file():
+    """Returns the path of the results database in use."""
+    return _settings()["db_file"]
+
+
+def _create_schema(conn):
+    conn.executescript(
+        """CREATE TABLE IF NOT EXISTS processed_emails (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               email_subject TEXT,
+               request_type TEXT,
+               sub_request_type TEXT,
+               assigned_to TEXT,
+               processed_at TEXT,
+               record TEXT NOT NULL,
+               email_text TEXT
+           );
+           CREATE INDEX IF NOT EXISTS idx_results_request_type ON processed_emails (request_type, id);
+           CREATE INDEX IF NOT EXISTS idx_results_sub_request_type ON processed_emails (sub_request_type, id);
+           CREATE INDEX IF NOT EXISTS idx_results_assigned_to ON processed_emails (assigned_to, id);
+           CREATE INDEX IF NOT EXISTS idx_results_processed_at ON processed_emails (processed_at, id);"""
+    )
+    # Stores created before email_text was kept for training the local classifier
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(processed_emails)")}
+    if "email_text" not in columns:
+        conn.execute("ALTER TABLE processed_emails ADD COLUMN email_text TEXT")
+    _create_aggregate_schema(conn)
+
+
+def _create_aggregate_schema(conn):
+    """Creates the per-hour aggregate table and fills it from existing records on first use.
+
+    The backfill runs once per database, recorded by a marker row written in the same
+    transaction, so processes opening the store at the same time cannot count records twice.
+    """
+    confidence_columns = ",".join(f"\n               {column} INTEGER NOT NULL DEFAULT 0" for column in _CONFIDENCE_COLUMNS)
+    conn.executescript(
+        f"""CREATE TABLE IF NOT EXISTS result_aggregates (
+               bucket TEXT NOT NULL,
+               request_type TEXT NOT NULL,
+               sub_request_type TEXT NOT NULL,
+               assigned_to TEXT NOT NULL,
+               emails INTEGER NOT NULL DEFAULT 0,
+               duplicates INTEGER NOT NULL DEFAULT 0,
+               errors INTEGER NOT NULL DEFAULT 0,
+               confidence_total REAL NOT NULL DEFAULT 0,{confidence_columns},
+               PRIMARY KEY (bucket, request_type, sub_request_type, assigned_to)
+           );
+           CREATE TABLE IF NOT EXISTS result_aggregates_backfill (
+               id INTEGER PRIMARY KEY CHECK (id = 0),
+               completed_at REAL NOT NULL
+           );"""
+    )
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if conn.execute("SELECT 1 FROM result_aggregates_backfill").fetchone() is None:
+            # Rebuilt from scratch: results saved since the table was created are already counted
+            conn.execute("DELETE FROM result_aggregates")
+            for (record,) in conn.execute("SELECT record FROM processed_emails ORDER BY id").fetchall():
+                _update_aggregates(conn, json.loads(record))
+            conn.execute("INSERT INTO result_aggregates_backfill (id, completed_at) VALUES (0, ?)", (time.time(),))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def parse_confidence(value):
+    """Returns a confidence score ("92%", 92 or 0.92) as a percentage, or None when it is not a number."""
+    if isinstance(value, str):
+        text = value.strip()
+        try:
+            return max(0.0, min(float(text.rstrip("%")), 100.0)) if text.endswith("%") else parse_confidence(float(text))
+        except ValueError:
+            return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return max(0.0, min(value * 100 if value <= 1 else float(value), 100.0))
+    return None
+
+
+def time_bucket(processed_at):
+    """Truncates a processed_at timestamp ("YYYY-MM-DD HH:MM:SS") to its hour."""
+    return f"{processed_at[:13]}:00:00" if processed_at and len(processed_at) >= 13 else "unknown"
+
+
+def _update_aggregates(conn, email_data):
+    """Adds one record to its hourly aggregate row, inside the caller's transaction."""
+    result = email_data.get("classification_result") or {}
+    confidence = parse_confidence(result.get("confidence_score"))
+    confidence_bins = [0] * CONFIDENCE_BINS
+    if confidence is not None:
+        confidence_bins[min(int(confidence // (100 / CONFIDENCE_BINS)), CONFIDENCE_BINS - 1)] = 1
+    key = [time_bucket(email_data.get("processed_at"))] + [str(result.get(field) or "") for field in INDEXED_FIELDS]
+    counts = [1, int(bool(result.get("DuplicateFlag")) or "duplicate_of" in email_data), int("error" in result),
+              confidence or 0.0] + confidence_bins
+    counted = ["emails", "duplicates", "errors", "confidence_total"] + _CONFIDENCE_COLUMNS
+    conn.execute(
+        f"""INSERT INTO result_aggregates (bucket, {", ".join(INDEXED_FIELDS)}, {", ".join(counted)})
+            VALUES ({", ".join("?" * (len(key) + len(counts)))})
+            ON CONFLICT (bucket, {", ".join(INDEXED_FIELDS)}) DO UPDATE SET
+            {", ".join(f"{column} = {column} + excluded.{column}" for column in counted)}""",
+        key + counts
+    )
+
+
+def _import_legacy_json(conn):
+    """One-time import of records from the old processed_emails.json file."""
+    legacy_file = config.get("processed_emails_file")
+    if not legacy_file or not os.path.exists(legacy_file):
+        return
+    if conn.execute("SELECT 1 FROM processed_emails LIMIT 1").fetchone():
+        return
+    with open(legacy_file, "r") as file:
+        try:
+            records = json.load(file)
+        except json.JSONDecodeError:
+            return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for record in records:
+            _insert(conn, record)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def get_connection():
+    """Returns this thread's connection to the results database, creating the schema on first use."""
+    db_file = get_db_file()
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(db_file)
+    if conn is None:
+        conn = sqlite3.connect(db_file, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with _init_lock:
+            if db_file not in _initialized:
+                _create_schema(conn)
+                _import_legacy_json(conn)
+                _initialized.add(db_file)
+        connections[db_file] = conn
+    return conn
+
+
+def _insert(conn, email_data, email_text=None):
+    result = email_data.get("classification_result") or {}
+    cursor = conn.execute(
+        """INSERT INTO processed_emails
+               (email_subject, request_type, sub_request_type, assigned_to, processed_at, record, email_text)
+           VALUES (?, ?, ?, ?, ?, ?, ?)""",
+        (
+            email_data.get("email_subject"),
+            result.get("request_type"),
+            result.get("sub_request_type"),
+            result.get("assigned_to"),
+            email_data.get("processed_at"),
+            json.dumps(email_data),
+            email_text
+        )
+    )
+    _update_aggregates(conn, email_data)
+    return cursor.lastrowid
+
+
+def save_result(email_data, email_text=None):
+    """Appends one processed email record and returns its id.
+
+    ``email_text`` is kept out of the returned record and only used as training data
+    for the local classifier. Each insert is its own short transaction, which also
+    updates the record's hourly aggregate row; SQLite's WAL mode serializes concurrent
+    writers from any thread or process without rewriting existing records.
+    """
+    conn = get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        record_id = _insert(conn, email_data, email_text)
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return record_id
+
+
+def _row_to_record(row):
+    record = json.loads(row[1])
+    record["id"] = row[0]
+    return record
+
+
+def query_results(filters=None, limit=50, cursor=None):
+    """Returns a page of processed emails, newest first, filtered on the indexed fields.
+
+    ``filters`` may contain request_type, sub_request_type, assigned_to and the
+    processed_from / processed_to bounds on processed_at. Pagination is keyset based:
+    pass the returned ``next_cursor`` to fetch the following page, which keeps every
+    page an index range scan regardless of how deep the caller pages.
+    """
+    filters = filters or {}
+    limit = max(1, min(int(limit), _settings()["max_page_size"]))
+
+    clauses, params = [], []
+    for field in INDEXED_FIELDS:
+        if filters.get(field):
+            clauses.append(f"{field} = ?")
+            params.append(filters[field])
+    if filters.get("processed_from"):
+        clauses.append("processed_at >= ?")
+        params.append(filters["processed_from"])
+    if filters.get("processed_to"):
+        clauses.append("processed_at <= ?")
+        params.append(filters["processed_to"])
+    if cursor is not None:
+        clauses.append("id < ?")
+        params.append(int(cursor))
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    rows = get_connection().execute(
+        f"SELECT id, record FROM processed_emails {where} ORDER BY id DESC LIMIT ?",
+        params + [limit + 1]
+    ).fetchall()
+
+    items = [_row_to_record(row) for row in rows[:limit]]
+    next_cursor = items[-1]["id"] if len(rows) > limit else None
+    return {"items": items, "next_cursor": next_cursor}
+
+
+def get_result(record_id):
+    """Returns a single processed email by id, or None."""
+    row = get_connection().execute(
+        "SELECT id, record FROM processed_emails WHERE id = ?", (record_id,)
+    ).fetchone()
+    return _row_to_record(row) if row else None
+
+
+def iter_results():
+    """Yields every stored record in insertion order without loading them all at once."""
+    for row in get_connection().execute("SELECT id, record FROM processed_emails ORDER BY id"):
+        yield _row_to_record(row)
+
+
+def iter_training_examples():
+    """Yields (email_text, classification_result) for stored emails that kept their text."""
+    for email_text, record in get_connection().execute(
+        "SELECT email_text, record FROM processed_emails WHERE email_text IS NOT NULL AND request_type IS NOT NULL ORDER BY id"
+    ):
+        yield email_text, json.loads(record).get("classification_result") or {}
+
+
+def get_results_version():
+    """Returns the id of the newest stored record (0 when empty); it changes whenever a result is saved."""
+    return get_connection().execute("SELECT COALESCE(MAX(id), 0) FROM processed_emails").fetchone()[0]
+
+
+def query_aggregates(processed_from=None, processed_to=None, group_by=(), period_length=13, cursor=None, limit=None):
+    """Sums the hourly aggregate rows, optionally per period and per indexed field.
+
+    period_length truncates the hourly bucket ("YYYY-MM-DD HH:00:00"): 13 keeps hours,
+    10 days and 7 months; 0 sums over the whole range. Rows come back newest period
+    first, then by group values. ``cursor`` is the [period, *group values] of the last
+    row already returned. Each row holds the group values, emails, duplicates, errors,
+    confidence_total and one count per confidence decile; the work is proportional to
+    the number of aggregate rows, not to the number of stored emails.
+    """
+    unknown = set(group_by) - set(INDEXED_FIELDS)
+    if unknown:
+        raise ValueError(f"Cannot group by {', '.join(sorted(unknown))}")
+    period_length = int(period_length)
+    names = (["period"] if period_length else []) + list(group_by)
+    keys = ([f"substr(bucket, 1, {period_length}) AS period"] if period_length else []) + list(group_by)
+    counted = ["emails", "duplicates", "errors", "confidence_total"] + _CONFIDENCE_COLUMNS
+    clauses, params = [], []
+    if processed_from:
+        clauses.append("bucket >= ?")
+        params.append(processed_from[:13])
+    if processed_to:
+        clauses.append("bucket <= ?")
+        params.append(processed_to)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    grouping = f"GROUP BY {', '.join(names)}" if names else ""
+
+    outer, order = [], []
+    if period_length:
+        order.append("period DESC")
+    order += [f"{field} ASC" for field in group_by]
+    if cursor is not None and names:
+        groups = ", ".join(group_by)
+        after_groups = f"({groups}) > ({', '.join('?' * len(group_by))})" if group_by else None
+        if period_length:
+            outer.append(f"(period < ? OR (period = ? AND {after_groups}))" if after_groups else "period < ?")
+            params += [cursor[0], cursor[0]] + list(cursor[1:]) if after_groups else [cursor[0]]
+        else:
+            outer.append(after_groups)
+            params += list(cursor)
+
+    rows = get_connection().execute(
+        f"""SELECT * FROM (
+                SELECT {", ".join(keys + [f"SUM({column}) AS {column}" for column in counted])}
+                FROM result_aggregates {where} {grouping}
+            ) WHERE emails > 0 {"".join(f" AND {condition}" for condition in outer)}
+            {f"ORDER BY {', '.join(order)}" if order else ""} {"LIMIT ?" if limit else ""}""",
+        params + ([limit] if limit else [])
+    ).fetchall()
+    return [dict(zip(names + counted, row)) for row in rows]
@@ -0,0 +1,199 @@
+import asyncio
+import contextvars
+import json
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from config_loader import config
+
+DEFAULT_TELEMETRY_SETTINGS = {
+    "log_level": "INFO",
+    "latency_buckets_seconds": [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+}
+
+METRIC_HELP = {
+    "email_stage_duration_seconds": ("histogram", "Duration of each email processing stage."),
+    "http_request_duration_seconds": ("histogram", "Duration of HTTP requests by endpoint and status."),
+    "email_stage_errors_total": ("counter", "Stages that raised an exception."),
+    "emails_processed_total": ("counter", "Emails run through the pipeline, by classification tier."),
+    "classification_errors_total": ("counter", "Classifications that returned an error."),
+    "attachments_total": ("counter", "Attachments processed, by file type."),
+    "ocr_pages_total": ("counter", "PDF pages without a usable text layer that went through OCR."),
+    "attachment_early_stops_total": ("counter", "Attachments whose extraction stopped early, by budget or reason."),
+    "ocr_cache_lookups_total": ("counter", "OCR cache lookups by result (memory_hits, disk_hits, misses) and evictions."),
+    "attachment_pool_recycles_total": ("counter", "Extraction pools killed because a running task overran its deadline."),
+    "llm_prompt_tokens_total": ("counter", "Prompt tokens sent to the LLM."),
+    "llm_response_tokens_total": ("counter", "Completion tokens returned by the LLM."),
+    "llm_batches_total": ("counter", "Chat completions that classified a micro-batch of short emails."),
+    "llm_batched_emails_total": ("counter", "Emails answered from a micro-batch completion."),
+    "llm_batch_fallbacks_total": ("counter", "Batched emails that fell back to their own completion."),
+    "classification_cache_events_total": ("counter", "Classification cache lookups by outcome."),
+    "duplicate_matches_total": ("counter", "Emails answered from the dedup index, by match kind."),
+    "extracted_fields_total": ("counter", "Extracted field values by source; rejected counts model identifiers with a bad check digit."),
+    "thread_incremental_total": ("counter", "Replies classified from their newest segment and a thread summary.")
+}
+
+correlation_id = contextvars.ContextVar("correlation_id", default=None)
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+logger = logging.getLogger("email_classifier")
+
+
+def _settings():
+    """Returns telemetry settings from config, falling back to defaults for missing keys."""
+    return {**DEFAULT_TELEMETRY_SETTINGS, **config.get("telemetry", {})}
+
+
+class JsonLogFormatter(logging.Formatter):
+    """Formats records as one JSON object per line, tagged with the request's correlation id."""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+            "correlation_id": correlation_id.get()
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging():
+    """Attaches the JSON handler to the email_classifier logger once."""
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(JsonLogFormatter())
+        logger.addHandler(handler)
+        logger.propagate = False
+    logger.setLevel(_settings()["log_level"])
+
+
+def log_event(event, level=logging.INFO, **fields):
+    """Writes a structured log line with arbitrary key/value fields."""
+    logger.log(level, event, extra={"fields": fields})
+
+
+def new_correlation_id(value=None):
+    """Sets the correlation id for the current request or job and returns it."""
+    value = value or uuid.uuid4().hex
+    correlation_id.set(value)
+    return value
+
+
+def run_in_executor(executor, function, *args):
+    """Runs function on executor from a coroutine, carrying the correlation id over to the worker thread."""
+    context = contextvars.copy_context()
+    return asyncio.get_running_loop().run_in_executor(executor, context.run, function, *args)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def increment(name, amount=1, **labels):
+    """Adds to a labelled counter."""
+    if not amount:
+        return
+    key = (name, _label_key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, value, **labels):
+    """Records a value (in seconds) in a labelled latency histogram."""
+    buckets = _settings()["latency_buckets_seconds"]
+    key = (name, _label_key(labels))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {"buckets": list(buckets), "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+        for index, bound in enumerate(histogram["buckets"]):
+            if value <= bound:
+                histogram["counts"][index] += 1
+                break
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+
+def record_stage(stage, duration, failed=False, **fields):
+    """Records one finished stage: its latency, whether it raised, and a debug log line.
+
+    Used directly for stages timed in another process, such as OCR in the extraction pool.
+    """
+    if failed:
+        increment("email_stage_errors_total", stage=stage)
+    observe("email_stage_duration_seconds", duration, stage=stage)
+    log_event("stage_completed", logging.DEBUG, stage=stage, duration_ms=round(duration * 1000, 3), **fields)
+
+
+@contextmanager
+def span(stage, **fields):
+    """Times one pipeline stage into email_stage_duration_seconds and logs it at debug level.
+
+    Exceptions are counted in email_stage_errors_total and re-raised.
+    """
+    start = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except Exception:
+        failed = True
+        raise
+    finally:
+        record_stage(stage, time.perf_counter() - start, failed, **fields)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (f'{name}="{_escape(value)}"' for name, value in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+def render_prometheus():
+    """Renders every counter and histogram in the Prometheus text exposition format."""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: {**value, "counts": list(value["counts"])} for key, value in _histograms.items()}
+
+    lines = []
+    for name in sorted({key[0] for key in counters} | {key[0] for key in histograms}):
+        kind, help_text = METRIC_HELP.get(name, ("counter" if any(key[0] == name for key in counters) else "histogram", name))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        for (metric, labels), histogram in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(histogram["buckets"], histogram["counts"]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {round(histogram['sum'], 6)}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def reset_metrics():
+    """Clears all counters and histograms."""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+configure_logging()
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from config_loader import config, current_snapshot
+from dedup_index import normalize_text
+from email_reader import segment_content
+
+DEFAULT_THREAD_SETTINGS = {
+    "enabled": True,
+    "db_file": "thread_state.sqlite3",
+    "summary_max_chars": 600,
+    # Longest reply, without greeting and signature, that can count as a bare acknowledgement
+    "acknowledgement_max_chars": 40
+}
+
+_GREETING = re.compile(r"^(hi|hello|hey|dear|good (morning|afternoon|evening))\b[^.!?]*,?$", re.IGNORECASE)
+_SIGN_OFF = re.compile(r"^(--\s*|(best|kind|warm|many thanks and)?\s*regards\b.*|best\b,?|cheers\b.*|sincerely\b.*"
+                       r"|sent from my .*)$", re.IGNORECASE)
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized = set()
+
+
+def _settings():
+    """Returns thread tracking settings from config, falling back to defaults for missing keys."""
+    return {**DEFAULT_THREAD_SETTINGS, **config.get("thread_tracking", {})}
+
+
+def _create_schema(conn):
+    conn.executescript(
+        """CREATE TABLE IF NOT EXISTS thread_messages (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               message_id TEXT UNIQUE,
+               segment_hash TEXT NOT NULL,
+               thread_id TEXT NOT NULL,
+               position INTEGER NOT NULL,
+               classification TEXT NOT NULL,
+               created_at REAL NOT NULL
+           );
+           CREATE INDEX IF NOT EXISTS idx_thread_segment_hash ON thread_messages (segment_hash);"""
+    )
+
+
+def _connection(settings):
+    """Returns this thread's connection to the thread state store, creating its table on first use."""
+    db_file = settings["db_file"]
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(db_file)
+    if conn is None:
+        conn = sqlite3.connect(db_file, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with _init_lock:
+            if db_file not in _initialized:
+                _create_schema(conn)
+                _initialized.add(db_file)
+        connections[db_file] = conn
+    return conn
+
+
+def segment_hash(segment):
+    """Content key of a thread segment; quoting, attribution lines and re-wrapping in later replies do not change it."""
+    return hashlib.sha256(normalize_text(segment_content(segment)).encode("utf-8")).hexdigest()
+
+
+def is_acknowledgement(segment):
+    """True when a reply segment, without its greeting and signature, is only a short generic reply ("Thanks, noted.")."""
+    lines = [line.strip() for line in segment_content(segment).splitlines() if line.strip()]
+    for index, line in enumerate(lines):
+        if _SIGN_OFF.match(line):
+            lines = lines[:index]
+            break
+    if lines and _GREETING.match(lines[0]):
+        lines = lines[1:]
+    text = " ".join(lines).lower()
+    if not text or len(text) > _settings()["acknowledgement_max_chars"]:
+        return False
+    # Every sentence must be generic: "Thanks. Please move the date." is a new request
+    pattern = current_snapshot(config).generic_reply_pattern
+    return all(pattern.fullmatch(sentence.strip()) for sentence in re.split(r"[.!?;]+", text) if sentence.strip())
+
+
+def _row_to_state(row):
+    return {"thread_id": row[0], "position": row[1],
+            "classification": json.loads(row[2], object_pairs_hook=OrderedDict)}
+
+
+def find_prior_state(parsed):
+    """Returns the stored state of the newest earlier message in this email's thread, or None.
+
+    Earlier messages are matched by In-Reply-To and References first, then by the
+    content of the quoted segments for mail clients that drop those headers.
+    """
+    settings = _settings()
+    if not settings["enabled"] or len(parsed["segments"]) < 2:
+        return None
+
+    message_ids = [parsed["in_reply_to"]] if parsed["in_reply_to"] else []
+    message_ids += [ref for ref in reversed(parsed["references"]) if ref not in message_ids]
+    conn = _connection(settings)
+    for message_id in message_ids:
+        row = conn.execute(
+            "SELECT thread_id, position, classification FROM thread_messages WHERE message_id = ?", (message_id,)
+        ).fetchone()
+        if row:
+            return _row_to_state(row)
+    for segment in parsed["segments"][1:]:
+        row = conn.execute(
+            """SELECT thread_id, position, classification FROM thread_messages
+               WHERE segment_hash = ? ORDER BY id DESC LIMIT 1""", (segment_hash(segment),)
+        ).fetchone()
+        if row:
+            return _row_to_state(row)
+    return None
+
+
+def summarize_state(state):
+    """Compact description of the thread so far, used in place of the quoted history in the prompt."""
+    result = state["classification"]
+    extracted = "; ".join(f"{field}: {value}" for field, value in (result.get("extracted_data") or {}).items())
+    summary = (
+        f"{state['position'] + 1} earlier message(s) in this thread. "
+        f"Latest classification: {result.get('request_type')} / {result.get('sub_request_type')} "
+        f"(confidence {result.get('confidence_score')}). "
+        f"Extracted so far: {extracted or 'nothing'}."
+    )
+    return summary[:_settings()["summary_max_chars"]]
+
+
+def delta_email_text(parsed):
+    """The classifier input for an incremental reply: the subject and only the newest segment."""
+    return f"Subject: {parsed['subject']}\nBody: {parsed['segments'][0]}"
+
+
+def merge_with_prior(state, result):
+    """Carries forward extracted fields from earlier messages that the new reply did not restate."""
+    extracted = dict(state["classification"].get("extracted_data") or {})
+    extracted.update(result.get("extracted_data") or {})
+    result["extracted_data"] = extracted
+    return result
+
+
+def record_message(parsed, classification, prior_state=None):
+    """Stores this message's classification so later replies in the thread can build on it.
+
+    Emails with no Message-ID, reply headers or quoted segments cannot be matched by a
+    later reply, so nothing is written for them.
+    """
+    settings = _settings()
+    if not settings["enabled"] or "error" in classification:
+        return
+    if not (parsed["message_id"] or parsed["in_reply_to"] or parsed["references"] or len(parsed["segments"]) > 1):
+        return
+    thread_id = prior_state["thread_id"] if prior_state else (
+        (parsed["references"] or [None])[0] or parsed["in_reply_to"] or parsed["message_id"] or segment_hash(parsed["segments"][-1])
+    )
+    position = prior_state["position"] + 1 if prior_state else len(parsed["segments"]) - 1
+    _connection(settings).execute(
+        """INSERT OR REPLACE INTO thread_messages (message_id, segment_hash, thread_id, position, classification, created_at)
+           VALUES (?, ?, ?, ?, ?, ?)""",
+        (parsed["message_id"], segment_hash(parsed["segments"][0]), thread_id, position,
+         json.dumps(classification), time.time())
+    )
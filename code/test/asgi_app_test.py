@@ -0,0 +1,169 @@
+import pytest
+import asyncio
+import io
+import json
+import time
+from email.message import EmailMessage
+from unittest.mock import patch
+import asgi_app
+import llm_client
+from app import app as flask_app
+from asgi_app import app
+from config_loader import config, override_config
+from llm_client import StubBackend
+
+BOUNDARY = "----email-classifier-test"
+
+
+def make_eml(subject, body):
+    msg = EmailMessage()
+    msg["Subject"] = subject
+    msg["From"] = "agency@bank.example"
+    msg.set_content(body)
+    return msg.as_bytes()
+
+
+def multipart(filename, content, field="email_file"):
+    return (f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"{field}\"; filename=\"{filename}\"\r\n"
+            f"Content-Type: application/octet-stream\r\n\r\n").encode() + content + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+async def call(method, path, body=b"", content_type=None, chunk_size=1024):
+    """Sends one request through the ASGI app, delivering the body in chunks; returns (status, headers, body)."""
+    headers = [(b"content-type", content_type.encode())] if content_type else []
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)] or [b""]
+    messages = [{"type": "http.request", "body": chunk, "more_body": index < len(chunks) - 1}
+                for index, chunk in enumerate(chunks)]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": method, "path": path, "query_string": b"", "headers": headers,
+             "http_version": "1.1", "scheme": "http", "server": ("testserver", 80)}
+    await app(scope, receive, send)
+    response_body = b"".join(message.get("body", b"") for message in sent[1:])
+    return sent[0]["status"], dict(sent[0]["headers"]), response_body
+
+
+def post_email(filename, content):
+    return call("POST", "/process-email", multipart(filename, content), f"multipart/form-data; boundary={BOUNDARY}")
+
+
+@pytest.fixture(autouse=True)
+def stub_pipeline(tmp_path):
+    """Runs the pipeline against temporary stores, no caches and a stub LLM."""
+    llm_client.set_backend(StubBackend(latency_ms=200))
+    asgi_app._shutdown_executor()
+    with override_config({"thread_tracking": {"db_file": str(tmp_path / "threads.sqlite3")},
+                          "dedup_index": {"enabled": False},
+                          "results_store": {"db_file": str(tmp_path / "results.sqlite3")},
+                          "classification_cache": {"enabled": False}}), \
+            patch("ai_classifier.local_classifier.predict", return_value=None):
+        yield
+    asgi_app._shutdown_executor()
+
+
+def test_process_email_matches_flask_contract():
+    """Test that the async endpoint answers with the same JSON as the Flask endpoint."""
+    eml = make_eml("LC fee", "Please pay the Letter of Credit Fee of USD 1,200.00.")
+    status, headers, body = asyncio.run(post_email("notice.eml", eml))
+
+    with flask_app.test_client() as client:
+        expected = client.post("/process-email", data={"email_file": (io.BytesIO(eml), "notice.eml")},
+                               content_type="multipart/form-data").get_json()
+
+    result = json.loads(body)
+    assert status == 200 and headers[b"content-type"] == b"application/json"
+    assert b"x-request-id" in headers
+    assert result["classification_result"] == expected["classification_result"]
+    assert result["classification_result"]["request_type"] == "Fee Payment"
+    assert result.keys() == expected.keys()
+
+
+def test_upload_errors_match_flask():
+    """Test the missing file and wrong extension responses."""
+    status, _, body = asyncio.run(call("POST", "/process-email", b"", "multipart/form-data; boundary=x"))
+    assert status == 400 and json.loads(body) == {"error": "No email file provided"}
+
+    status, _, body = asyncio.run(post_email("notes.txt", b"hello"))
+    assert status == 400 and json.loads(body) == {"error": "Invalid file format. Only .eml files are supported"}
+
+
+def test_llm_waits_overlap_on_one_event_loop():
+    """Test that concurrent requests wait for the LLM together instead of one executor thread each."""
+    emails = [make_eml(f"Fee {index}", f"The Amendment Fees for deal {index} are due.") for index in range(40)]
+
+    async def run_all():
+        return await asyncio.gather(*(post_email(f"{index}.eml", eml) for index, eml in enumerate(emails)))
+
+    with override_config({"async_server": {"executor_workers": 2}}):
+        start = time.perf_counter()
+        responses = asyncio.run(run_all())
+        elapsed = time.perf_counter() - start
+
+    assert [status for status, _, _ in responses] == [200] * 40
+    # 40 stub calls of 200 ms each on 2 threads would take at least 4 seconds
+    assert elapsed < 2
+
+
+def test_lifespan_startup_starts_background_services():
+    """Test that the ASGI server starts the config watcher and job workers on startup."""
+    messages = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message["type"])
+
+    with patch("asgi_app.start_background_services") as mock_start:
+        asyncio.run(app({"type": "lifespan"}, receive, send))
+
+    mock_start.assert_called_once_with()
+    assert sent == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
+
+
+def test_flask_routes_share_body_limit_and_in_flight_cap():
+    """Test that requests passed to Flask are size capped and count toward max_in_flight."""
+    with override_config({"async_server": {"max_upload_bytes": 1024, "upload_spool_bytes": 256}}):
+        status, _, body = asyncio.run(call("POST", "/jobs", multipart("big.eml", b"x" * 4096),
+                                           f"multipart/form-data; boundary={BOUNDARY}"))
+        assert status == 413 and "exceeds 1024 bytes" in json.loads(body)["error"]
+
+        # A body over the spool size still reaches Flask intact
+        status, _, body = asyncio.run(call("POST", "/process-emails", multipart("notes.txt", b"y" * 600, "other"),
+                                           f"multipart/form-data; boundary={BOUNDARY}"))
+        assert status == 400 and json.loads(body) == {"error": "No email files provided"}
+
+    with override_config({"async_server": {"max_in_flight": 1}}), patch.object(asgi_app, "_in_flight", 1):
+        status, headers, _ = asyncio.run(call("GET", "/llm-stats"))
+    assert status == 503 and headers[b"retry-after"] == b"1"
+
+
+def test_streamed_batch_response_completes():
+    """Test that /process-emails streams every NDJSON line and finishes the response through the ASGI app."""
+    body = b"".join((f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"email_files\"; filename=\"{index}.eml\"\r\n"
+                     f"Content-Type: message/rfc822\r\n\r\n").encode() + make_eml(f"Fee {index}", "The Amendment Fees are due.") + b"\r\n"
+                    for index in range(2)) + f"--{BOUNDARY}--\r\n".encode()
+    status, headers, response = asyncio.run(call("POST", "/process-emails", body,
+                                                 f"multipart/form-data; boundary={BOUNDARY}"))
+
+    lines = [json.loads(line) for line in response.splitlines()]
+    assert status == 200 and headers[b"content-type"] == b"application/x-ndjson"
+    assert len(lines) == 2 and all("error" not in line for line in lines)
+
+
+def test_other_routes_are_served_by_flask():
+    """Test that the remaining endpoints go through the Flask app unchanged."""
+    status, headers, body = asyncio.run(call("GET", "/llm-stats"))
+    assert status == 200
+    assert json.loads(body)["backend"] == llm_client.get_llm_stats()["backend"]
+
+
+if __name__ == "__main__":
+    pytest.main()
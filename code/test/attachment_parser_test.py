@@ -0,0 +1,320 @@
+import pytest
+import time
+import docx
+import fitz
+from PIL import Image
+from unittest.mock import Mock, patch
+import attachment_parser
+import ocr_cache
+from attachment_parser import extract_text_from_attachment, extract_texts_from_attachments
+from config_loader import config, override_config
+from email_reader import Attachment
+
+
+def create_text_pdf(path, pages):
+    """Creates a PDF with a text layer, one string per page."""
+    doc = fitz.open()
+    for text in pages:
+        doc.new_page().insert_text((72, 72), text)
+    doc.save(path)
+    doc.close()
+
+
+def create_scanned_pdf(path, page_count):
+    """Creates an image-only PDF with one image per page."""
+    image_path = path.parent / "scan.png"
+    Image.new("RGB", (40, 40), "white").save(image_path)
+    doc = fitz.open()
+    for _ in range(page_count):
+        doc.new_page().insert_image(fitz.Rect(0, 0, 40, 40), filename=str(image_path))
+    doc.save(path)
+    doc.close()
+
+
+def create_mixed_pdf(path, page_count):
+    """Creates a PDF whose odd pages have a text layer and even pages are scans of the same image."""
+    image_path = path.parent / "scan.png"
+    Image.new("RGB", (40, 40), "white").save(image_path)
+    doc = fitz.open()
+    for page_num in range(page_count):
+        page = doc.new_page()
+        if page_num % 2 == 0:
+            page.insert_text((72, 72), f"Deal Name: Alpha, page {page_num + 1} of the notice")
+        else:
+            page.insert_image(fitz.Rect(0, 0, 40, 40), filename=str(image_path))
+    doc.save(path)
+    doc.close()
+
+
+@pytest.fixture(autouse=True)
+def fresh_ocr_cache(tmp_path):
+    """Gives every test an empty OCR cache so patched OCR output does not leak between tests."""
+    ocr_cache.clear_memory_cache()
+    with override_config({"ocr_cache": {"db_file": str(tmp_path / "ocr_cache.sqlite3")}}):
+        yield
+    ocr_cache.clear_memory_cache()
+
+
+@pytest.fixture
+def parallel_pool():
+    """Enables the process pool with two workers and tears it down afterwards."""
+    attachment_parser._reset_pool()
+    with override_config({"attachment_extraction": {"parallel": True, "max_workers": 2, "attachment_timeout_seconds": 30}}), \
+            patch("attachment_parser.os.cpu_count", return_value=4):
+        yield
+    attachment_parser._reset_pool()
+
+
+def test_parallel_extraction_keeps_input_order(tmp_path, parallel_pool):
+    """Test that text, DOCX and unsupported attachments come back in input order."""
+    pdf_path = tmp_path / "notice.pdf"
+    create_text_pdf(pdf_path, ["Deal Name: Alpha", "Total Payment Amount: 5000"])
+    docx_path = tmp_path / "letter.docx"
+    document = docx.Document()
+    document.add_paragraph("Letter of Credit Fee")
+    document.save(docx_path)
+
+    texts = extract_texts_from_attachments([str(pdf_path), str(docx_path), str(tmp_path / "logo.png")])
+
+    assert "Deal Name: Alpha" in texts[0] and "Total Payment Amount: 5000" in texts[0]
+    assert texts[1] == "Letter of Credit Fee"
+    assert texts[2] == "Unsupported file format"
+    assert texts == [extract_text_from_attachment(str(path)) for path in (pdf_path, docx_path, tmp_path / "logo.png")]
+
+
+def test_in_memory_attachments_match_files(tmp_path):
+    """Test that attachments held as bytes extract the same text as files on disk."""
+    pdf_path = tmp_path / "notice.pdf"
+    create_text_pdf(pdf_path, ["ISIN: US0378331005"])
+    docx_path = tmp_path / "letter.docx"
+    document = docx.Document()
+    document.add_paragraph("Ongoing Fee")
+    document.save(docx_path)
+
+    for path in (pdf_path, docx_path):
+        in_memory = Attachment(path.name.upper(), data=path.read_bytes())
+        assert extract_text_from_attachment(in_memory) == extract_text_from_attachment(str(path))
+
+
+def test_scanned_pages_are_reassembled_in_page_order(tmp_path, parallel_pool):
+    """Test that per-page OCR results are joined in page order."""
+    pdf_path = tmp_path / "scanned.pdf"
+    create_scanned_pdf(pdf_path, 3)
+
+    with patch("attachment_parser.pytesseract.image_to_string", return_value="Principal 100"):
+        text = extract_texts_from_attachments([str(pdf_path)])[0]
+
+    positions = [text.index(f"[Page {page}, Image 1]") for page in (1, 2, 3)]
+    assert positions == sorted(positions)
+    assert text.count("Principal 100") == 3
+
+
+def test_scan_plan_carries_no_image_bytes(tmp_path, parallel_pool):
+    """Test that the plan lists scanned pages by index and each OCR task reads its own page's images."""
+    pdf_path = tmp_path / "scanned.pdf"
+    create_scanned_pdf(pdf_path, 3)
+    in_memory = Attachment("scanned.pdf", data=pdf_path.read_bytes())
+
+    kind, pages, _ = attachment_parser._plan_attachment(in_memory, attachment_parser._settings())
+    assert kind == "pages" and pages == [(0, ""), (1, ""), (2, "")]
+
+    with patch("attachment_parser.pytesseract.image_to_string", return_value="Principal 100"):
+        text = extract_texts_from_attachments([in_memory])[0]
+    assert text.count("Principal 100") == 3
+
+
+def test_attachment_timeout(tmp_path, parallel_pool):
+    """Test that a slow attachment yields an error instead of blocking the email."""
+    pdf_path = tmp_path / "slow.pdf"
+    create_scanned_pdf(pdf_path, 1)
+
+    with patch("attachment_parser.pytesseract.image_to_string", side_effect=lambda image: time.sleep(3)), \
+            patch.dict(config["attachment_extraction"], {"attachment_timeout_seconds": 0.5}):
+        text = extract_texts_from_attachments([str(pdf_path)])[0]
+
+    assert text.startswith("Error extracting text: timed out")
+
+
+def test_overrunning_workers_are_recycled(tmp_path, parallel_pool):
+    """Test that runaway OCR tasks are killed so the next email does not queue behind them."""
+    scans = [tmp_path / "slow-1.pdf", tmp_path / "slow-2.pdf"]
+    for path in scans:
+        create_scanned_pdf(path, 1)
+    pdf_path = tmp_path / "notice.pdf"
+    create_text_pdf(pdf_path, ["Deal Name: Alpha"])
+
+    with patch("attachment_parser.pytesseract.image_to_string", side_effect=lambda image: time.sleep(60)), \
+            patch.dict(config["attachment_extraction"], {"attachment_timeout_seconds": 0.5}):
+        texts = extract_texts_from_attachments([str(path) for path in scans])
+    assert all(text.startswith("Error extracting text: timed out") for text in texts)
+
+    # Both workers were stuck in OCR; a fresh pool answers straight away
+    start = time.perf_counter()
+    assert extract_texts_from_attachments([str(pdf_path)]) == ["Deal Name: Alpha"]
+    assert time.perf_counter() - start < 10
+
+
+def test_recycle_prefers_public_kill_workers():
+    """Test that recycling uses kill_workers() when the executor has it and still shuts down a pool without either API."""
+    pool = Mock(spec=["kill_workers", "shutdown"])
+    attachment_parser._recycle_pool(pool)
+    pool.kill_workers.assert_called_once_with()
+    pool.shutdown.assert_not_called()
+
+    pool = Mock(spec=["shutdown"])
+    attachment_parser._recycle_pool(pool)
+    pool.shutdown.assert_called_once_with(wait=False, cancel_futures=True)
+
+
+def test_mixed_pdf_uses_text_layer_and_ocr_per_page(tmp_path):
+    """Test that text pages keep their text layer and only scanned pages are OCR'd."""
+    pdf_path = tmp_path / "mixed.pdf"
+    create_mixed_pdf(pdf_path, 4)
+
+    with patch("attachment_parser.pytesseract.image_to_string", return_value="Principal 100") as mock_ocr:
+        text = extract_text_from_attachment(str(pdf_path))
+
+    assert "page 1 of the notice" in text and "page 3 of the notice" in text
+    assert "[Page 2, Image 1]" in text and "[Page 4, Image 1]" in text
+    assert text.index("page 3") < text.index("[Page 4, Image 1]")
+    # The same image on pages 2 and 4 is only OCR'd once
+    assert mock_ocr.call_count == 1
+
+
+def test_ocr_cache_survives_memory_eviction(tmp_path):
+    """Test that repeated images are served from the SQLite tier once the memory tier is empty."""
+    pdf_path = tmp_path / "scanned.pdf"
+    create_scanned_pdf(pdf_path, 1)
+
+    with patch("attachment_parser.pytesseract.image_to_string", return_value="Principal 100") as mock_ocr:
+        first = extract_text_from_attachment(str(pdf_path))
+        ocr_cache.clear_memory_cache()
+        second = extract_text_from_attachment(str(pdf_path))
+
+    assert first == second
+    assert mock_ocr.call_count == 1
+
+
+def test_ocr_cache_evicts_oldest_entries(tmp_path):
+    """Test that the SQLite tier keeps at most max_disk_entries and reports its size."""
+    with patch.dict(config["ocr_cache"], {"max_disk_entries": 2}):
+        for index in range(4):
+            ocr_cache.store_text(f"image-{index}", f"text {index}")
+        ocr_cache.clear_memory_cache()
+        stats = ocr_cache.get_ocr_cache_stats()
+
+        assert (stats["disk_entries"], stats["disk_bytes"]) == (2, 12)
+        assert ocr_cache.get_cached_text("image-0") is None
+        assert ocr_cache.get_cached_text("image-3") == "text 3"
+
+
+def test_pool_worker_cache_lookups_are_counted(tmp_path, parallel_pool):
+    """Test that OCR cache lookups made in pool workers show up in the API process's stats."""
+    pdf_path = tmp_path / "scanned.pdf"
+    create_scanned_pdf(pdf_path, 2)
+    before = ocr_cache.get_ocr_cache_stats()
+
+    with patch("attachment_parser.pytesseract.image_to_string", return_value="Principal 100"):
+        extract_texts_from_attachments([str(pdf_path)])
+
+    after = ocr_cache.get_ocr_cache_stats()
+    # The plan checks both pages, then each page task looks its image up again
+    assert after["misses"] - before["misses"] >= 2
+    assert after["disk_entries"] == 1
+
+
+def test_parallel_matches_sequential_for_mixed_pdf(tmp_path, parallel_pool):
+    """Test that the process pool assembles mixed PDFs exactly like the sequential path."""
+    pdf_path = tmp_path / "mixed.pdf"
+    create_mixed_pdf(pdf_path, 3)
+
+    with patch("attachment_parser.pytesseract.image_to_string", return_value="Principal 100"):
+        parallel = extract_texts_from_attachments([str(pdf_path)])[0]
+        sequential = extract_text_from_attachment(str(pdf_path))
+
+    assert parallel == sequential
+
+
+def test_docx_tables_are_extracted_in_document_order(tmp_path):
+    """Test that DOCX table rows are streamed between the paragraphs around them."""
+    docx_path = tmp_path / "notice.docx"
+    document = docx.Document()
+    document.add_paragraph("Payment details:")
+    table = document.add_table(rows=2, cols=2)
+    for row, (label, value) in zip(table.rows, [("Fees", "USD 2,500.00"), ("Total Payment Amount", "USD 1,250,000.00")]):
+        row.cells[0].text, row.cells[1].text = label, value
+    document.add_paragraph("Regards")
+    document.save(docx_path)
+
+    text = extract_text_from_attachment(str(docx_path))
+
+    assert text == "Payment details:\nFees | USD 2,500.00\nTotal Payment Amount | USD 1,250,000.00\nRegards"
+
+
+def test_page_and_byte_budgets(tmp_path):
+    """Test that pages past max_pages are not read and text is cut at max_text_bytes."""
+    pdf_path = tmp_path / "long.pdf"
+    create_text_pdf(pdf_path, [f"Schedule page {page} of the facility agreement" for page in range(1, 11)])
+
+    with override_config({"attachment_extraction": {"max_pages": 3, "early_stop": False}}):
+        text = extract_text_from_attachment(str(pdf_path))
+    assert "Schedule page 3" in text and "Schedule page 4" not in text
+
+    with override_config({"attachment_extraction": {"max_text_bytes": 60, "early_stop": False}}):
+        text = extract_text_from_attachment(str(pdf_path))
+    assert len(text.encode("utf-8")) <= 60 and text.startswith("Schedule page 1")
+
+
+def test_early_stop_skips_ocr_of_later_pages(tmp_path, parallel_pool):
+    """Test that extraction stops once enough text is collected and later scans are never OCR'd."""
+    pdf_path = tmp_path / "mixed.pdf"
+    create_mixed_pdf(pdf_path, 6)
+    settings = {**config["attachment_extraction"], "early_stop_min_bytes": 30, "early_stop_idle_bytes": 30}
+
+    with override_config({"attachment_extraction": settings}), \
+            patch("attachment_parser.pytesseract.image_to_string", return_value="Principal 100") as mock_ocr:
+        sequential = extract_text_from_attachment(str(pdf_path))
+        parallel = extract_texts_from_attachments([str(pdf_path)])[0]
+
+    assert sequential == parallel == "Deal Name: Alpha, page 1 of the notice"
+    assert mock_ocr.call_count == 0
+
+
+def test_early_stop_on_scanned_pages_bounds_parallel_ocr(tmp_path, parallel_pool):
+    """Test that a fully scanned PDF stops OCR'ing once its budget is reached, in pool workers too."""
+    pdf_path = tmp_path / "scanned.pdf"
+    doc = fitz.open()
+    for page_num in range(10):
+        # A different image per page, so the OCR cache cannot hide repeated work
+        image_path = tmp_path / f"scan-{page_num}.png"
+        Image.new("RGB", (40, 40), (page_num * 20, 255, 255)).save(image_path)
+        doc.new_page().insert_image(fitz.Rect(0, 0, 40, 40), filename=str(image_path))
+    doc.save(pdf_path)
+    doc.close()
+    settings = {**config["attachment_extraction"], "early_stop_min_bytes": 30, "early_stop_idle_bytes": 30}
+    calls_file = tmp_path / "ocr_calls.log"
+
+    def ocr(image):
+        # Pool workers are separate processes, so calls are counted in a file
+        with open(calls_file, "a") as calls:
+            calls.write("call\n")
+        return "Principal repayment notice for the facility"
+
+    with override_config({"attachment_extraction": settings}), \
+            patch("attachment_parser.pytesseract.image_to_string", side_effect=ocr):
+        sequential = extract_text_from_attachment(str(pdf_path))
+        sequential_calls = len(calls_file.read_text().splitlines())
+        ocr_cache.clear_memory_cache()
+        with override_config({"ocr_cache": {"db_file": str(tmp_path / "pool_ocr_cache.sqlite3")}}):
+            parallel = extract_texts_from_attachments([str(pdf_path)])[0]
+        parallel_calls = len(calls_file.read_text().splitlines()) - sequential_calls
+
+    assert sequential == parallel
+    assert "[Page 1, Image 1]" in parallel and "[Page 2, Image 1]" not in parallel
+    assert sequential_calls == 1
+    # Only the first window of max_workers pages was ever handed to the pool
+    assert 1 <= parallel_calls <= 2
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,95 @@
+import pytest
+import io
+import json
+import threading
+import time
+import zipfile
+from email.message import EmailMessage
+from unittest.mock import patch
+from werkzeug.datastructures import FileStorage
+from batch_processor import detach_uploads, iter_batch_uploads, process_batch, stream_ndjson
+
+
+def make_eml(subject):
+    """Builds raw .eml bytes with the given subject."""
+    msg = EmailMessage()
+    msg["Subject"] = subject
+    msg["From"] = "agent@bank.example"
+    msg.set_content("Please process the payment.")
+    return msg.as_bytes()
+
+
+def fake_process(data):
+    """Stands in for the real pipeline, failing for emails whose subject contains 'broken'."""
+    if b"broken" in data:
+        raise ValueError("Cannot parse email")
+    return {"email_subject": "ok", "classification_result": {"request_type": "Fee Payment"}, "processed_at": "now"}
+
+
+def test_batch_errors_stay_per_email():
+    """Test that one failing email does not fail the rest of the batch."""
+    items = [("a.eml", make_eml("first")), ("b.eml", make_eml("broken")), ("c.eml", make_eml("third"))]
+    with patch("batch_processor.run_email_pipeline", side_effect=fake_process):
+        results = sorted(process_batch(items, concurrency=2), key=lambda r: r["index"])
+
+    assert [r["status"] for r in results] == ["ok", "error", "ok"]
+    assert results[1]["error"] == "Cannot parse email"
+    assert results[1]["source"] == "b.eml"
+
+
+def test_batch_respects_concurrency():
+    """Test that no more than the requested number of emails run at once."""
+    active, peak, lock = [0], [0], threading.Lock()
+
+    def slow_process(data):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.02)
+        with lock:
+            active[0] -= 1
+        return fake_process(data)
+
+    items = [(f"{i}.eml", make_eml(str(i))) for i in range(12)]
+    with patch("batch_processor.run_email_pipeline", side_effect=slow_process):
+        results = list(process_batch(items, concurrency=3))
+
+    assert len(results) == 12
+    assert 1 < peak[0] <= 3
+
+
+def test_zip_and_mbox_uploads_are_expanded():
+    """Test that archives are split into individual emails."""
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("one.eml", make_eml("one"))
+        zf.writestr("two.eml", make_eml("two"))
+        zf.writestr("notes.txt", b"not an email")
+    archive.seek(0)
+
+    mbox = b"".join(b"From agent@bank.example Thu Jan  1 00:00:00 2025\n" + make_eml(s) + b"\n" for s in ("x", "y"))
+
+    uploads = [
+        FileStorage(stream=archive, filename="batch.zip"),
+        FileStorage(stream=io.BytesIO(mbox), filename="inbox.mbox"),
+        FileStorage(stream=io.BytesIO(b"%PDF"), filename="invoice.pdf")
+    ]
+    items = list(iter_batch_uploads(detach_uploads(uploads)))
+
+    sources = [source for source, _ in items]
+    assert sources == ["batch.zip/one.eml", "batch.zip/two.eml", "batch.zip/notes.txt",
+                       "inbox.mbox#1", "inbox.mbox#2", "invoice.pdf"]
+    assert isinstance(items[2][1], Exception)
+    assert b"Subject: y" in items[4][1]
+    assert isinstance(items[5][1], Exception)
+
+
+def test_stream_ndjson():
+    """Test that every result becomes one JSON line."""
+    lines = list(stream_ndjson([{"index": 0}, {"index": 1}]))
+    assert [json.loads(line) for line in lines] == [{"index": 0}, {"index": 1}]
+    assert all(line.endswith("\n") for line in lines)
+
+
+if __name__ == "__main__":
+    pytest.main()
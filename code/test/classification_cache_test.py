@@ -0,0 +1,90 @@
+import pytest
+import sqlite3
+from collections import OrderedDict
+from unittest.mock import patch
+import classification_cache
+from classification_cache import cached_compute_from_model, clear_memory_cache, get_cache_stats
+from config_loader import config, override_config
+
+MOCK_RESULT = OrderedDict([
+    ("request_type", "Fee Payment"),
+    ("sub_request_type", "Letter of Credit Fee"),
+    ("DuplicateFlag", False),
+    ("confidence_score", "90%")
+])
+
+
+@pytest.fixture
+def cache_settings(tmp_path):
+    """Points the on-disk tier at a temporary database and starts from an empty memory tier."""
+    settings = {"enabled": True, "db_file": str(tmp_path / "cache.sqlite3"), "max_disk_entries": 2}
+    with override_config({"classification_cache": settings}):
+        clear_memory_cache()
+        yield settings
+        clear_memory_cache()
+
+
+def test_resubmission_is_served_from_cache(cache_settings):
+    """Test that identical content only reaches the model once."""
+    with patch("classification_cache.compute_from_model", return_value=MOCK_RESULT) as mock_model:
+        first = cached_compute_from_model("LC Fee", "Please pay the fee.", "Invoice")
+        second = cached_compute_from_model("LC Fee", "Please pay the fee.", "Invoice")
+
+    assert mock_model.call_count == 1
+    assert first == second
+    assert list(second.keys()) == list(MOCK_RESULT.keys())
+
+
+def test_disk_tier_survives_memory_eviction(cache_settings):
+    """Test that the persistent tier answers after the memory tier is dropped."""
+    with patch("classification_cache.compute_from_model", return_value=MOCK_RESULT) as mock_model:
+        cached_compute_from_model("LC Fee", "Please pay the fee.")
+        clear_memory_cache()
+        hits_before = get_cache_stats()["disk_hits"]
+        assert cached_compute_from_model("LC Fee", "Please pay the fee.")["request_type"] == "Fee Payment"
+
+    assert mock_model.call_count == 1
+    assert get_cache_stats()["disk_hits"] == hits_before + 1
+
+
+def test_errors_are_not_cached(cache_settings):
+    """Test that error payloads are retried instead of being cached."""
+    with patch("classification_cache.compute_from_model", return_value={"error": "boom"}) as mock_model:
+        cached_compute_from_model("Subject", "Body")
+        cached_compute_from_model("Subject", "Body")
+
+    assert mock_model.call_count == 2
+
+
+def test_config_change_invalidates_key():
+    """Test that the cache key includes the active config version."""
+    key = classification_cache.make_cache_key("Subject", "Body", "Attachment")
+    with override_config({"extractable_fields": ["Deal Name"]}):
+        assert classification_cache.make_cache_key("Subject", "Body", "Attachment") != key
+
+
+def test_disk_tier_size_eviction(cache_settings):
+    """Test that the on-disk tier keeps at most max_disk_entries rows."""
+    with patch("classification_cache.compute_from_model", return_value=MOCK_RESULT):
+        for index in range(4):
+            cached_compute_from_model(f"Subject {index}", "Body")
+
+    with sqlite3.connect(cache_settings["db_file"]) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM classification_cache").fetchone()[0] == 2
+
+
+def test_disk_tier_byte_eviction_keeps_running_totals(cache_settings):
+    """Test that max_disk_bytes evicts the oldest entries and the totals match the stored rows."""
+    with override_config({"classification_cache": {**cache_settings, "max_disk_entries": 100, "max_disk_bytes": 300}}), \
+            patch("classification_cache.compute_from_model", return_value=MOCK_RESULT):
+        for index in range(5):
+            cached_compute_from_model(f"Subject {index}", "Body")
+
+    with sqlite3.connect(cache_settings["db_file"]) as conn:
+        entries, total_bytes = conn.execute("SELECT COUNT(*), SUM(size) FROM classification_cache").fetchone()
+        assert conn.execute("SELECT entries, bytes FROM classification_cache_totals").fetchone() == (entries, total_bytes)
+    assert entries == 2 and total_bytes <= 300
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,122 @@
+import pytest
+import json
+import os
+from unittest.mock import patch
+import config_loader
+from ai_classifier import assign_request, detect_duplicate
+from app import app
+from config_loader import config, config_version, override_config, pinned_config, reload_config
+
+
+@pytest.fixture
+def config_file(tmp_path):
+    """Points the loader at a copy of config.json and restores the active snapshot afterwards."""
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps(config.copy()))
+    with patch("config_loader.CONFIG_FILE", str(path)), patch("config_loader._file_state", None), \
+            patch.object(config, "_snapshot", config.snapshot()):
+        yield path
+
+
+def rewrite(path, **changes):
+    data = json.loads(path.read_text())
+    data.update(changes)
+    path.write_text(json.dumps(data))
+    # Make sure the change is visible even on filesystems with coarse mtimes
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+def test_reload_swaps_snapshot_and_derived_structures(config_file):
+    """Test that an edited file produces a new snapshot with rebuilt routing and reply patterns."""
+    before = config.snapshot()
+    rewrite(config_file, roles_and_skills={"Adjustment": {"role": "Analyst", "assigned_to": "Ops Desk"}},
+            generic_reply_patterns=["cheers.*"])
+
+    snapshot, changed = reload_config()
+
+    assert changed is True
+    assert snapshot.generation == before.generation + 1
+    assert config_version() != before.version
+    assert assign_request("Adjustment", None) == {"role": "Analyst", "assigned_to": "Ops Desk"}
+    assert detect_duplicate("Cheers, all good") is True
+    assert detect_duplicate("Thanks a lot") is False
+    assert reload_config() == (snapshot, False)
+
+
+def test_invalid_file_keeps_last_good_snapshot(config_file):
+    """Test that a malformed config is rejected without touching the running snapshot."""
+    before = config.snapshot()
+    config_file.write_text("{ not json")
+
+    with pytest.raises(ValueError):
+        reload_config(force=True)
+    assert config.snapshot() is before
+
+
+def test_nested_routing_uses_flat_table():
+    """Test that sub-request types route through the precomputed table."""
+    snapshot = config_loader.current_snapshot()
+    assert snapshot.routing_table[("Closing Notice", "Amendment Fees")]["assigned_to"] == "Legal Team"
+    assert assign_request("Closing Notice", "Amendment Fees")["assigned_to"] == "Legal Team"
+    assert assign_request("Closing Notice", "Unknown Fee") == {"role": "Unassigned", "assigned_to": "General Support"}
+
+
+def test_patched_config_rebuilds_snapshot():
+    """Test that writes through the mapping swap in a new snapshot and are undone cleanly."""
+    version = config_version()
+    with override_config({"extractable_fields": ["Deal Name"]}):
+        assert config_version() != version
+        assert config_loader.current_snapshot().prompt_fragments["extractable_fields"] == '[\n    "Deal Name"\n]'
+    assert config_version() == version
+
+
+def test_override_restore_never_swaps_in_an_empty_config():
+    """Test that override_config restores the previous config in one swap, while clear() really empties it."""
+    with patch("config_loader.build_snapshot", wraps=config_loader.build_snapshot) as mock_build:
+        with override_config({"extractable_fields": ["Deal Name"]}):
+            pass
+    assert mock_build.call_count == 2
+    assert all(call.args[0] for call in mock_build.call_args_list)
+    assert "roles_and_skills" in config
+
+    previous = config.live_snapshot().data
+    try:
+        config.clear()
+        assert len(config) == 0
+    finally:
+        config.swap(previous)
+
+
+def test_pinned_config_ignores_reloads_until_released():
+    """Test that a pinned email keeps its snapshot while writes and reloads replace the live one."""
+    with pinned_config():
+        version = config_version()
+        with override_config({"generic_reply_patterns": ["cheers.*"]}):
+            assert config_version() == version
+            assert detect_duplicate("Thanks a lot") is True
+            assert config.live_snapshot().version != version
+        with override_config({"generic_reply_patterns": ["cheers.*"]}), pinned_config():
+            # An outer pin wins
+            assert config_version() == version
+    with override_config({"generic_reply_patterns": ["cheers.*"]}):
+        assert detect_duplicate("Thanks a lot") is False
+
+
+def test_admin_reload_endpoint(config_file):
+    """Test the admin endpoints report the active snapshot and reload on demand."""
+    client = app.test_client()
+    generation = client.get("/admin/config").get_json()["generation"]
+    rewrite(config_file, generic_reply_patterns=["ok.*"])
+
+    response = client.post("/admin/reload-config")
+    assert response.status_code == 200
+    assert response.get_json()["changed"] is True
+    assert response.get_json()["generation"] == generation + 1
+
+    config_file.write_text("{ not json")
+    assert client.post("/admin/reload-config").status_code == 500
+
+
+if __name__ == "__main__":
+    pytest.main()
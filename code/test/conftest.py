@@ -0,0 +1,10 @@
+import pytest
+import llm_client
+
+
+@pytest.fixture(autouse=True)
+def fresh_llm_client():
+    """Rebuilds the shared LLM client around every test so each one picks up its own patched backend and limits."""
+    llm_client.reset_client()
+    yield
+    llm_client.reset_client()
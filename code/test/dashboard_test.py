@@ -0,0 +1,99 @@
+import pytest
+import dashboard
+from app import app
+from config_loader import override_config
+from results_store import save_result
+
+
+def make_record(hour, request_type="Fee Payment", assigned_to="Accounts Payable Team", confidence="90%"):
+    """Builds a processed email record as produced by the pipeline."""
+    return {
+        "email_subject": f"Notice {hour}",
+        "classification_result": {
+            "request_type": request_type,
+            "sub_request_type": "Ongoing Fee",
+            "assigned_to": assigned_to,
+            "confidence_score": confidence
+        },
+        "processed_at": f"2025-03-{10 + hour // 24:02d} {hour % 24:02d}:15:00"
+    }
+
+
+@pytest.fixture
+def client(tmp_path):
+    """Flask test client backed by a fresh results store."""
+    dashboard.clear_cache()
+    with override_config({"results_store": {"db_file": str(tmp_path / "results.sqlite3")},
+                          "processed_emails_file": str(tmp_path / "processed_emails.json")}):
+        with app.test_client() as client:
+            yield client
+    dashboard.clear_cache()
+
+
+def test_summary(client):
+    """Test totals, duplicate rate, confidence distribution and per-field counts."""
+    for hour in range(3):
+        save_result(make_record(hour))
+    duplicate = make_record(30, "Adjustment", "John Doe", None)
+    duplicate["classification_result"]["DuplicateFlag"] = True
+    save_result(duplicate)
+
+    summary = client.get("/dashboard/summary").get_json()
+    assert (summary["emails"], summary["duplicates"], summary["duplicate_rate"]) == (4, 1, 0.25)
+    assert summary["average_confidence"] == 90.0
+    assert summary["confidence_distribution"]["90-100%"] == 3
+    assert summary["confidence_distribution"]["unknown"] == 1
+    assert summary["by_request_type"] == {"Fee Payment": 3, "Adjustment": 1}
+    assert summary["by_assigned_to"] == {"Accounts Payable Team": 3, "John Doe": 1}
+
+    limited = client.get("/dashboard/summary?processed_from=2025-03-11").get_json()
+    assert limited["emails"] == 1 and limited["by_request_type"] == {"Adjustment": 1}
+
+
+def test_counts_cursor_pagination(client):
+    """Test walking hourly counts page by page, newest period first."""
+    for hour in range(5):
+        save_result(make_record(hour))
+        save_result(make_record(hour, "Adjustment"))
+
+    seen, cursor = [], None
+    while True:
+        page = client.get("/dashboard/counts", query_string={
+            "period": "hour", "group_by": "request_type", "limit": 3, **({"cursor": cursor} if cursor else {})
+        }).get_json()
+        seen += [(item["period"], item["request_type"]) for item in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert seen == [(f"2025-03-10 {hour:02d}", request_type)
+                    for hour in range(4, -1, -1) for request_type in ("Adjustment", "Fee Payment")]
+
+    day = client.get("/dashboard/counts?period=day&group_by=request_type,assigned_to").get_json()["items"]
+    assert [(item["request_type"], item["emails"]) for item in day] == [("Adjustment", 5), ("Fee Payment", 5)]
+
+
+def test_invalid_parameters(client):
+    """Test that a bad period, grouping or cursor is a 400."""
+    for query in ("period=week", "group_by=email_subject", "cursor=not-a-cursor"):
+        response = client.get(f"/dashboard/counts?{query}")
+        assert response.status_code == 400 and "error" in response.get_json()
+
+
+def test_etag_revalidation(client):
+    """Test that an unchanged view answers 304 and a new save changes the ETag."""
+    save_result(make_record(1))
+    for path in ("/dashboard/summary", "/dashboard/counts?period=day", "/processed-emails?limit=5"):
+        first = client.get(path)
+        assert first.status_code == 200 and first.headers["Cache-Control"] == "no-cache"
+        etag = first.headers["ETag"]
+        assert client.get(path, headers={"If-None-Match": etag}).status_code == 304
+
+    save_result(make_record(2))
+    response = client.get("/dashboard/summary", headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.get_json()["emails"] == 2
+    assert response.headers["ETag"] != etag
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,113 @@
+import pytest
+import threading
+from collections import OrderedDict
+from email.message import EmailMessage
+from unittest.mock import patch
+from config_loader import config, override_config
+import dedup_index
+from dedup_index import find_duplicate, add_document
+from email_pipeline import run_email_pipeline
+
+NOTICE = """Please be advised that the Letter of Credit fee for the period ending March 31
+is now due. The total payment amount of USD 12,500.00 will be debited from account
+ending 4471 on the value date. Contact the agency desk with any questions regarding
+this fee notice or the underlying facility agreement."""
+
+CLASSIFICATION = OrderedDict([
+    ("request_type", "Fee Payment"),
+    ("sub_request_type", "Letter of Credit Fee"),
+    ("DuplicateFlag", False)
+])
+
+
+@pytest.fixture
+def index(tmp_path):
+    """Points the dedup index, thread store and results store at temporary databases."""
+    with override_config({"dedup_index": {"db_file": str(tmp_path / "dedup.sqlite3")},
+                          "thread_tracking": {"db_file": str(tmp_path / "threads.sqlite3")},
+                          "results_store": {"db_file": str(tmp_path / "results.sqlite3")},
+                          "classification_cache": {"enabled": False}}):
+        yield tmp_path
+
+
+def test_exact_duplicate(index):
+    """Test that identical content, modulo whitespace and case, is an exact match."""
+    add_document("LC Fee Notice", NOTICE, "", CLASSIFICATION)
+    match = find_duplicate("LC Fee Notice", NOTICE.upper().replace("\n", "  "), "")
+    assert match["match"] == "exact"
+    assert match["classification"]["sub_request_type"] == "Letter of Credit Fee"
+
+
+def test_near_duplicate_with_changed_footer(index):
+    """Test that a re-forwarded notice with a different footer is a near-duplicate."""
+    add_document("LC Fee Notice", NOTICE + "\nRegards, Agency Desk", "", CLASSIFICATION)
+    match = find_duplicate("FW: LC Fee Notice", NOTICE + "\nSent from my phone", "")
+    assert match["match"] == "near"
+    assert match["similarity"] >= 0.8
+
+
+def test_unrelated_email_is_not_a_duplicate(index):
+    """Test that a different email does not match."""
+    add_document("LC Fee Notice", NOTICE, "", CLASSIFICATION)
+    assert find_duplicate("Principal repayment", "We will repay principal of USD 1,000,000 on Friday.", "") is None
+
+
+def test_config_change_and_expiry_invalidate_matches(index):
+    """Test that classifications are only reused under the config version and TTL they were indexed with."""
+    add_document("LC Fee Notice", NOTICE, "", CLASSIFICATION)
+    with override_config({"roles_and_skills": {"Loan Servicing": ["Fee Payment"]}}):
+        assert find_duplicate("LC Fee Notice", NOTICE, "") is None
+        assert find_duplicate("FW: LC Fee Notice", NOTICE + "\nSent from my phone", "") is None
+    assert find_duplicate("LC Fee Notice", NOTICE, "")["match"] == "exact"
+
+    with patch.dict(config["dedup_index"], {"ttl_seconds": 0}):
+        assert find_duplicate("LC Fee Notice", NOTICE, "") is None
+
+
+def test_near_duplicate_fields_come_from_the_new_email(index):
+    """Test that a near-duplicate with a different amount reports its own amount."""
+    stored = OrderedDict(CLASSIFICATION, extracted_data=OrderedDict([
+        ("Deal Name", "Alpha"), ("Total Payment Amount", "USD 12,500.00")]))
+    add_document("LC Fee Notice", NOTICE, "", stored)
+
+    match = find_duplicate("LC Fee Notice", NOTICE.replace("12,500.00", "13,750.00"), "")
+
+    assert match["match"] == "near"
+    assert match["classification"]["extracted_data"]["Total Payment Amount"] == "USD 13,750.00"
+    assert match["classification"]["extracted_data"]["Deal Name"] == "Alpha"
+
+
+def test_index_reuses_one_wal_connection_per_thread(index):
+    """Test that lookups and writes on one thread share a single WAL-mode connection."""
+    settings = dedup_index._settings()
+    add_document("LC Fee Notice", NOTICE, "", CLASSIFICATION)
+    find_duplicate("LC Fee Notice", NOTICE, "")
+    conn = dedup_index._connection(settings)
+
+    assert dedup_index._connection(settings) is conn
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    other = []
+    thread = threading.Thread(target=lambda: other.append(dedup_index._connection(settings)))
+    thread.start()
+    thread.join()
+    assert other[0] is not conn
+
+
+def test_pipeline_skips_model_for_duplicates(index):
+    """Test that the second copy of an email is flagged without calling the model."""
+    msg = EmailMessage()
+    msg["Subject"] = "LC Fee Notice"
+    msg.set_content(NOTICE)
+
+    with patch("email_pipeline.cached_compute_from_model", return_value=CLASSIFICATION.copy()) as mock_model:
+        first = run_email_pipeline(msg.as_bytes())
+        second = run_email_pipeline(msg.as_bytes())
+
+    assert mock_model.call_count == 1
+    assert first["classification_result"]["DuplicateFlag"] is False
+    assert second["classification_result"]["DuplicateFlag"] is True
+    assert second["duplicate_of"]["match"] == "exact"
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -1,68 +1,76 @@
-import pytest
-import os
-from email.parser import BytesParser
-from email.policy import default
-from extract_email_content import extract_email_content  # Import function from your module
-
-def create_test_eml(file_path, subject="Test Email", body="This is a test email.", attachment_name=None, attachment_content=b"Test attachment"):
-    """Creates a sample .eml file for testing."""
-    from email.message import EmailMessage
-    
-    msg = EmailMessage()
-    msg['Subject'] = subject
-    msg.set_content(body)
-    
-    if attachment_name:
-        msg.add_attachment(attachment_content, maintype='application', subtype='octet-stream', filename=attachment_name)
-    
-    with open(file_path, "wb") as f:
-        f.write(msg.as_bytes())
-
-test_eml_file = "test_email.eml"
-
-@pytest.fixture
-def setup_eml_file():
-    """Fixture to create and clean up a test .eml file."""
-    create_test_eml(test_eml_file)
-    yield test_eml_file
-    os.remove(test_eml_file)
-
-def test_extract_email_content(setup_eml_file):
-    """Test extracting email content from a valid .eml file."""
-    email_text, attachments = extract_email_content(setup_eml_file)
-    assert "Subject: Test Email" in email_text
-    assert "Body: This is a test email." in email_text
-    assert len(attachments) == 0  # No attachments in this case
-
-def test_extract_email_with_attachment():
-    """Test extracting email with an attachment."""
-    attachment_name = "test_attachment.txt"
-    attachment_content = b"This is attachment content."
-    test_eml_with_attachment = "test_email_with_attachment.eml"
-    
-    create_test_eml(test_eml_with_attachment, attachment_name=attachment_name, attachment_content=attachment_content)
-    
-    email_text, attachments = extract_email_content(test_eml_with_attachment)
-    assert "Subject: Test Email" in email_text
-    assert "Body: This is a test email." in email_text
-    assert len(attachments) == 1
-    assert os.path.exists(attachments[0])  # Ensure attachment file was created
-    
-    # Cleanup
-    os.remove(test_eml_with_attachment)
-    os.remove(attachments[0])
-
-def test_invalid_file():
-    """Test handling of an invalid .eml file."""
-    invalid_file = "invalid.eml"
-    with open(invalid_file, "w") as f:
-        f.write("This is not a valid email file.")
-    
-    email_text, attachments = extract_email_content(invalid_file)
-    assert "Error extracting email content" in email_text
-    assert len(attachments) == 0
-    
-    os.remove(invalid_file)
-
-if __name__ == "__main__":
-    pytest.main()
+import pytest
+import os
+from email.message import EmailMessage
+from config_loader import override_config
+from email_reader import extract_email_content, read_email, release_attachments
+
+def create_test_eml(file_path, subject="Test Email", body="This is a test email.", attachment_name=None, attachment_content=b"Test attachment"):
+    """Creates a sample .eml file for testing."""
+    msg = EmailMessage()
+    msg['Subject'] = subject
+    msg.set_content(body)
+    
+    if attachment_name:
+        msg.add_attachment(attachment_content, maintype='application', subtype='octet-stream', filename=attachment_name)
+    
+    with open(file_path, "wb") as f:
+        f.write(msg.as_bytes())
+
+@pytest.fixture
+def setup_eml_file(tmp_path):
+    """Fixture to create a test .eml file in a temporary directory."""
+    test_eml_file = str(tmp_path / "test_email.eml")
+    create_test_eml(test_eml_file)
+    return test_eml_file
+
+def test_extract_email_content(setup_eml_file):
+    """Test extracting email content from a valid .eml file."""
+    email_text, attachments = extract_email_content(setup_eml_file)
+    assert "Subject: Test Email" in email_text
+    assert "Body: This is a test email." in email_text
+    assert len(attachments) == 0  # No attachments in this case
+
+def test_extract_email_with_attachment(tmp_path):
+    """Test extracting email with an attachment."""
+    attachment_name = "test_attachment.txt"
+    attachment_content = b"This is attachment content."
+    test_eml_with_attachment = str(tmp_path / "test_email_with_attachment.eml")
+    
+    create_test_eml(test_eml_with_attachment, attachment_name=attachment_name, attachment_content=attachment_content)
+    
+    email_text, attachments = extract_email_content(test_eml_with_attachment)
+    assert "Subject: Test Email" in email_text
+    assert "Body: This is a test email." in email_text
+    assert len(attachments) == 1
+    assert attachments[0].filename == attachment_name
+    assert attachments[0].data == attachment_content  # Attachment stays in memory
+    assert attachments[0].path is None
+
+def test_read_email_from_bytes_spills_large_attachments():
+    """Test parsing raw bytes and spilling attachments above the threshold to a temp dir."""
+    msg = EmailMessage()
+    msg['Subject'] = "Spill Test"
+    msg.set_content("Body text")
+    msg.add_attachment(b"small", maintype='application', subtype='pdf', filename="small.pdf")
+    msg.add_attachment(b"x" * 64, maintype='application', subtype='pdf', filename="large.pdf")
+
+    with override_config({"email_parsing": {"spill_threshold_bytes": 32}}):
+        parsed = read_email(memoryview(msg.as_bytes()))
+
+    small, large = parsed["attachments"]
+    assert parsed["email_text"].startswith("Subject: Spill Test")
+    assert small.data == b"small" and small.path is None
+    assert large.data is None and os.path.exists(large.path)
+    assert large.open().read() == b"x" * 64
+
+    release_attachments(parsed["attachments"])
+    assert not os.path.exists(large.path)
+
+def test_invalid_file(tmp_path):
+    """Test handling of an .eml file that cannot be read."""
+    email_text, attachments = extract_email_content(str(tmp_path / "missing.eml"))
+    assert "Error extracting email content" in email_text
+    assert len(attachments) == 0
+
+if __name__ == "__main__":
+    pytest.main()
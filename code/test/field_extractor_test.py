@@ -0,0 +1,79 @@
+import pytest
+import json
+from unittest.mock import patch
+from ai_classifier import compute_from_model
+from field_extractor import extract_fields, is_valid_aba, is_valid_cusip, is_valid_isin, validate_extracted
+from llm_client import make_completion_response
+
+NOTICE = """PRINCIPAL PAYMENT NOTICE
+CUSIP No.: 037833100
+Total Payment Amount: USD 1,250,000.00
+Fees of $2,500.00 are due on the value date.
+Expiration Date: 15 Sept. 2026
+Remit to ABA Routing Number 021000021, Account Number 4471-0098-12"""
+
+
+def test_check_digits():
+    """Test CUSIP, ISIN and ABA check digit validation."""
+    assert is_valid_cusip("037833100") and not is_valid_cusip("037833101")
+    assert is_valid_isin("US0378331005") and not is_valid_isin("US0378331006")
+    assert is_valid_aba("021000021") and not is_valid_aba("021000022")
+
+
+def test_extracts_labelled_fields():
+    """Test that labelled values are found in one pass and returned as written."""
+    assert extract_fields(NOTICE) == {
+        "CUSIP": "037833100",
+        "Total Payment Amount": "USD 1,250,000.00",
+        "Fees": "$2,500.00",
+        "Expiration Date": "15 Sept. 2026",
+        "ABA Number": "021000021",
+        "Account Number": "4471-0098-12"
+    }
+
+
+def test_invalid_values_are_not_extracted():
+    """Test that wrong check digits and impossible dates are left for the model."""
+    fields = extract_fields("CUSIP 037833101, ABA 021000022, Expiration Date: 02/30/2026. See ISIN US0378331005.")
+    assert fields == {"ISIN": "US0378331005"}
+
+
+def test_first_text_wins():
+    """Test that values from earlier texts (attachments) take precedence over later ones (body)."""
+    assert extract_fields("Fees: $100.00", "Fees: $900.00") == {"Fees": "$100.00"}
+
+
+def test_model_is_asked_only_for_missing_fields():
+    """Test that locally extracted fields are left out of the prompt and override the model's values."""
+    model_output = {
+        "request_type": "Money Movement - Inbound",
+        "sub_request_type": "Principal",
+        "confidence_score": "91%",
+        "extracted_data": {"Deal Name": "Atlas Term Loan B", "CUSIP": "999999999", "ISIN": "US0000000001"}
+    }
+    with patch("ai_classifier.local_classifier.predict", return_value=None), \
+            patch("ai_classifier.llm_client.chat_completion",
+                  return_value=make_completion_response(json.dumps(model_output), 100)) as mock_completion:
+        result = compute_from_model("Principal payment", "Please see the attached notice.", NOTICE)
+
+    prompt = mock_completion.call_args.kwargs["messages"][1]["content"]
+    field_section = prompt.split("### **Extractable Fields**")[1].split("###")[0]
+    assert '"Deal Name"' in field_section
+    assert '"CUSIP"' not in field_section and '"ABA Number"' not in field_section
+
+    extracted = result["extracted_data"]
+    assert extracted["Deal Name"] == "Atlas Term Loan B"
+    assert extracted["CUSIP"] == "037833100"
+    assert "ISIN" not in extracted  # the model's ISIN fails its check digit
+    assert extracted["Account Number"] == "4471-0098-12"
+
+
+def test_validate_extracted_keeps_unchecked_fields():
+    """Test that only identifier fields with check digits are filtered."""
+    kept, rejected = validate_extracted({"ABA Number": "021000022", "Deal Name": "Atlas", "Fees": "n/a"})
+    assert kept == {"Deal Name": "Atlas", "Fees": "n/a"}
+    assert rejected == ["ABA Number"]
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,135 @@
+import pytest
+import time
+from unittest.mock import patch
+from config_loader import override_config
+from job_queue import (QueueFullError, WorkerPool, claim_job, complete_job, fail_job, get_job,
+                       get_queue_stats, retry_dead_job, submit_job)
+from results_store import iter_results
+
+
+def run_pool_until(job_ids, statuses, timeout=5):
+    """Runs a two-thread worker pool until every job reaches one of statuses."""
+    pool = WorkerPool(2)
+    pool.start()
+    deadline = time.time() + timeout
+    while time.time() < deadline and any(get_job(job_id)["status"] not in statuses for job_id in job_ids):
+        time.sleep(0.05)
+    pool.stop(timeout=5)
+
+
+@pytest.fixture(autouse=True)
+def queue_db(tmp_path):
+    """Points the job queue at a fresh database with immediate retries."""
+    settings = {"db_file": str(tmp_path / "jobs.sqlite3"), "embedded_workers": False, "max_attempts": 2,
+                "retry_backoff_seconds": 0, "max_queue_depth": 3, "poll_interval_seconds": 0.05}
+    with override_config({"job_queue": settings}):
+        yield settings
+
+
+def test_job_lifecycle():
+    """Test that a submitted job is claimed once, completed and returned with its result."""
+    job_id = submit_job(b"Subject: Test\n\nBody", "test.eml")
+    assert get_job(job_id)["status"] == "queued"
+
+    claimed_id, payload = claim_job("worker-1")
+    assert (claimed_id, payload) == (job_id, b"Subject: Test\n\nBody")
+    assert claim_job("worker-2") is None
+
+    assert complete_job(job_id, "worker-1", {"email_subject": "Test"}) is True
+    job = get_job(job_id)
+    assert job["status"] == "done"
+    assert job["attempts"] == 1
+    assert job["result"] == {"email_subject": "Test"}
+
+
+def test_failed_job_is_retried_then_dead_lettered():
+    """Test that failures are retried up to max_attempts and then dead-lettered."""
+    job_id = submit_job(b"bad", "bad.eml")
+    claim_job("worker-1")
+    assert fail_job(job_id, "worker-1", "ValueError: boom") == "queued"
+    claim_job("worker-1")
+    assert fail_job(job_id, "worker-1", "ValueError: boom") == "dead"
+    assert claim_job("worker-1") is None
+    assert get_job(job_id)["error"] == "ValueError: boom"
+
+    assert retry_dead_job(job_id) is True
+    assert get_job(job_id)["status"] == "queued"
+    assert retry_dead_job(job_id) is False
+
+
+def test_expired_lease_is_reclaimed(queue_db):
+    """Test that a job left running by a crashed worker is picked up again."""
+    job_id = submit_job(b"Subject: Test\n\nBody")
+    with patch.dict(queue_db, {"lease_seconds": -1}):
+        claim_job("crashed-worker")
+    assert claim_job("worker-2")[0] == job_id
+    assert get_job(job_id)["attempts"] == 2
+
+    # The crashed worker finishing late must not overwrite the new owner's job
+    assert complete_job(job_id, "crashed-worker", {"email_subject": "stale"}) is False
+    assert fail_job(job_id, "crashed-worker", "TimeoutError") is None
+    assert get_job(job_id)["status"] == "running"
+    assert complete_job(job_id, "worker-2", {"email_subject": "Test"}) is True
+    assert get_job(job_id)["result"] == {"email_subject": "Test"}
+
+
+def test_backpressure_when_queue_is_full():
+    """Test that submissions are rejected once max_queue_depth jobs are pending."""
+    for _ in range(3):
+        submit_job(b"email")
+    with pytest.raises(QueueFullError) as full:
+        submit_job(b"email")
+    assert get_queue_stats()["depth"] == 3
+    # Nothing finished recently, so the configured default applies
+    assert full.value.retry_after == 30
+
+    # Three jobs finished in the last minute: one slot frees up in about 20 seconds
+    for worker in ("worker-1", "worker-2", "worker-3"):
+        job_id, _ = claim_job(worker)
+        complete_job(job_id, worker, {})
+    for _ in range(3):
+        submit_job(b"email")
+    with pytest.raises(QueueFullError) as full:
+        submit_job(b"email")
+    assert full.value.retry_after == 20
+
+
+def test_worker_pool_drains_queue():
+    """Test that the worker pool processes queued jobs in the background."""
+    job_ids = [submit_job(f"Subject: {i}".encode()) for i in range(3)]
+    with patch("job_queue.process_job", side_effect=lambda payload: {"email_subject": payload.decode()}):
+        run_pool_until(job_ids, ("done",))
+
+    assert [get_job(job_id)["result"]["email_subject"] for job_id in job_ids] == ["Subject: 0", "Subject: 1", "Subject: 2"]
+
+
+def test_classification_errors_are_retried_then_dead_lettered():
+    """Test that an error reported by the model (OpenAI failure, timeout, bad JSON) fails the job."""
+    job_id = submit_job(b"Subject: Test\n\nBody")
+    result = {"email_subject": "Test", "classification_result": {"error": "Request timed out."}}
+    with patch("job_queue.process_job", return_value=result) as mock_process:
+        run_pool_until([job_id], ("done", "dead"))
+
+    job = get_job(job_id)
+    assert mock_process.call_count == 2
+    assert (job["status"], job["attempts"], job["result"]) == ("dead", 2, None)
+    assert job["error"] == "ClassificationError: Request timed out."
+
+
+
+def test_retried_job_stores_one_result(tmp_path):
+    """Test that only the successful attempt of a retried job reaches the results store."""
+    job_id = submit_job(b"Subject: LC fee\n\nPlease pay the Letter of Credit Fee.")
+    success = {"request_type": "Fee Payment", "sub_request_type": "Letter of Credit Fee", "extracted_data": {}}
+    with override_config({"results_store": {"db_file": str(tmp_path / "results.sqlite3")},
+                          "thread_tracking": {"db_file": str(tmp_path / "threads.sqlite3")},
+                          "dedup_index": {"enabled": False}}), \
+            patch("email_pipeline.cached_compute_from_model", side_effect=[{"error": "Request timed out."}, success]):
+        run_pool_until([job_id], ("done", "dead"))
+        stored = list(iter_results())
+
+    assert get_job(job_id)["status"] == "done"
+    assert [result["classification_result"]["request_type"] for result in stored] == ["Fee Payment"]
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,104 @@
+import pytest
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+import llm_client
+from ai_classifier import compute_from_model
+from config_loader import override_config
+from llm_client import StubBackend, make_completion_response
+
+EMAILS = [
+    ("LC fee", "Please pay the Letter of Credit Fee of USD 1,200.00."),
+    ("Repayment", "We will send the Principal repayment on Friday."),
+    ("Adjustment", "Please book the Adjustment for deal Atlas."),
+    ("Fee", "The Amendment Fees are due next week.")
+]
+
+
+class RecordingBackend(llm_client.LLMBackend):
+    """Answers like the stub, optionally garbling batched answers, and records every prompt."""
+
+    def __init__(self, garble_batches=False):
+        self.garble_batches = garble_batches
+        self.prompts = []
+        self.lock = threading.Lock()
+
+    def create_chat_completion(self, model, messages, **kwargs):
+        prompt = messages[-1]["content"]
+        with self.lock:
+            self.prompts.append(prompt)
+        if self.garble_batches and "### **Emails to Analyze**" in prompt:
+            return make_completion_response('[{"id": "1", "request_type": ', 10)
+        return StubBackend().create_chat_completion(model, messages)
+
+
+@pytest.fixture(autouse=True)
+def batching():
+    """Turns micro-batching on with room for four emails and keeps the local classifier out of the way."""
+    settings = {"enabled": True, "max_batch_size": 4, "max_wait_ms": 500}
+    with override_config({"llm_batching": settings}), \
+            patch("ai_classifier.local_classifier.predict", return_value=None):
+        yield settings
+
+
+def classify_concurrently(emails):
+    """Classifies (subject, body) pairs from one thread each, so they arrive at the batcher together."""
+    with ThreadPoolExecutor(max_workers=len(emails)) as pool:
+        return list(pool.map(lambda email: compute_from_model(*email), emails))
+
+
+def test_short_emails_share_one_completion():
+    """Test that concurrent short emails are answered by one call and mapped back by id."""
+    backend = RecordingBackend()
+    llm_client.set_backend(backend)
+
+    results = classify_concurrently(EMAILS)
+
+    assert len(backend.prompts) == 1
+    assert backend.prompts[0].count("#### **Email ") == 4
+    assert [result["request_type"] for result in results] == ["Fee Payment", "Money Movement - Inbound", "Adjustment", "Closing Notice"]
+    assert results[0]["extracted_data"]["Total Payment Amount"] == "USD 1,200.00"
+    assert all(result["classification_tier"] == "llm" for result in results)
+
+
+def test_unparseable_batch_falls_back_to_single_calls():
+    """Test that every email of a garbled batch is retried with its own request."""
+    backend = RecordingBackend(garble_batches=True)
+    llm_client.set_backend(backend)
+
+    results = classify_concurrently(EMAILS)
+
+    assert len(backend.prompts) == 5
+    assert sum("### **Email to Analyze**" in prompt for prompt in backend.prompts) == 4
+    assert [result["request_type"] for result in results] == ["Fee Payment", "Money Movement - Inbound", "Adjustment", "Closing Notice"]
+
+
+def test_batch_prompt_lists_fields_any_email_still_needs():
+    """Test that fields found locally in every email of a batch are not asked for again."""
+    backend = RecordingBackend()
+    llm_client.set_backend(backend)
+
+    classify_concurrently([("Fee", "Please pay the Ongoing Fee. CUSIP: 037833100 ISIN: US0378331005"),
+                           ("Repayment", "Principal repayment on Friday. CUSIP: 037833100")])
+
+    assert len(backend.prompts) == 1
+    field_section = backend.prompts[0].split("### **Extractable Fields**")[1].split("###")[0]
+    assert '"CUSIP"' not in field_section
+    assert '"ISIN"' in field_section and '"Deal Name"' in field_section
+
+
+def test_long_emails_are_not_batched(batching):
+    """Test that emails above max_email_tokens go straight to a single request."""
+    backend = RecordingBackend()
+    llm_client.set_backend(backend)
+
+    with override_config({"llm_batching": {**batching, "max_email_tokens": 5}}):
+        result = compute_from_model(*EMAILS[0])
+
+    assert result["request_type"] == "Fee Payment"
+    assert len(backend.prompts) == 1
+    assert "### **Email to Analyze**" in backend.prompts[0]
+
+
+if __name__ == "__main__":
+    pytest.main()
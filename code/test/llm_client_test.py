@@ -0,0 +1,114 @@
+import pytest
+import asyncio
+import json
+import openai
+from unittest.mock import AsyncMock, patch
+import llm_client
+from config_loader import override_config
+from llm_client import (RateLimitScheduler, StubBackend, TokenBucket, async_chat_completion, chat_completion,
+                        get_llm_stats)
+from llm_stub_server import start_stub_server
+
+PROMPT = "### **Email to Analyze**\n**Subject:** LC fee\n**Email Content:** Please pay the letter of credit fee of $5,000.00"
+
+
+class FlakyBackend(llm_client.LLMBackend):
+    """Fails a fixed number of times before answering like the stub."""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def create_chat_completion(self, model, messages, **kwargs):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise openai.APITimeoutError(request=None)
+        return StubBackend().create_chat_completion(model, messages)
+
+
+def test_token_bucket_waits_when_empty():
+    """Test that the bucket only asks callers to wait once its capacity is used up."""
+    bucket = TokenBucket(capacity=10, refill_per_second=10)
+    assert bucket.reserve(10) == 0
+    assert bucket.reserve(5) == pytest.approx(0.5, abs=0.05)
+    bucket.adjust(-10)  # Real usage was lower than estimated
+    assert bucket.reserve(1) == 0
+
+
+def test_scheduler_limits_tokens_per_minute():
+    """Test that a large request is throttled by the TPM bucket even with requests to spare."""
+    scheduler = RateLimitScheduler(requests_per_minute=600, tokens_per_minute=600)
+    with patch("llm_client.time.sleep") as mock_sleep:
+        scheduler.acquire(600)
+        scheduler.acquire(60)
+    mock_sleep.assert_called_once()
+    assert mock_sleep.call_args[0][0] == pytest.approx(6, abs=0.1)
+
+
+def test_stub_backend_is_deterministic():
+    """Test that the stub backend labels emails from the classification criteria."""
+    with override_config({"llm": {"backend": "stub"}}):
+        first = chat_completion([{"role": "user", "content": PROMPT}])
+        second = chat_completion([{"role": "user", "content": PROMPT}])
+
+    result = json.loads(first.choices[0].message.content)
+    assert first.choices[0].message.content == second.choices[0].message.content
+    assert (result["request_type"], result["sub_request_type"]) == ("Fee Payment", "Letter of Credit Fee")
+
+
+def test_retryable_errors_are_retried():
+    """Test that transient errors are retried with backoff until the call succeeds."""
+    backend = FlakyBackend(failures=2)
+    llm_client.set_backend(backend)
+    with patch("llm_client.time.sleep") as mock_sleep:
+        response = chat_completion([{"role": "user", "content": PROMPT}])
+
+    assert backend.calls == 3
+    assert mock_sleep.call_count == 2
+    assert "Fee Payment" in response.choices[0].message.content
+
+
+def test_gives_up_after_max_retries():
+    """Test that the last error is raised once max_retries is exhausted."""
+    llm_client.set_backend(FlakyBackend(failures=10))
+    before = get_llm_stats()["failures"]
+    with override_config({"llm": {"max_retries": 2}}), patch("llm_client.time.sleep"):
+        with pytest.raises(openai.APITimeoutError):
+            chat_completion([{"role": "user", "content": PROMPT}])
+    assert get_llm_stats()["failures"] == before + 1
+
+
+def test_async_calls_retry_and_give_up_like_sync_calls():
+    """Test that the awaited client uses the same backoff and counters without blocking the loop."""
+    backend = FlakyBackend(failures=2)
+    llm_client.set_backend(backend)
+    before = get_llm_stats()
+    with patch("llm_client.asyncio.sleep", new_callable=AsyncMock) as mock_sleep:
+        response = asyncio.run(async_chat_completion([{"role": "user", "content": PROMPT}]))
+    assert backend.calls == 3 and mock_sleep.await_count == 2
+    assert "Fee Payment" in response.choices[0].message.content
+    assert get_llm_stats()["retries"] == before["retries"] + 2
+
+    llm_client.set_backend(FlakyBackend(failures=10))
+    with override_config({"llm": {"max_retries": 1}}), patch("llm_client.asyncio.sleep", new_callable=AsyncMock):
+        with pytest.raises(openai.APITimeoutError):
+            asyncio.run(async_chat_completion([{"role": "user", "content": PROMPT}]))
+    assert get_llm_stats()["failures"] == before["failures"] + 1
+
+
+def test_openai_backend_against_stub_server():
+    """Test the pooled OpenAI client end to end against the local stub server, including a 429 retry."""
+    server = start_stub_server(rate_limit_every=2)
+    try:
+        base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+        with override_config({"OPENAI_API_KEY": "test-key", "llm": {"base_url": base_url, "backoff_base_seconds": 0.01}}):
+            responses = [chat_completion([{"role": "user", "content": PROMPT}]) for _ in range(2)]
+    finally:
+        server.shutdown()
+
+    assert all("Letter of Credit Fee" in response.choices[0].message.content for response in responses)
+    assert get_llm_stats()["rate_limited"] >= 1
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,90 @@
+import pytest
+import json
+from unittest.mock import patch
+import local_classifier
+from ai_classifier import compute_from_model
+from config_loader import config, override_config
+from local_classifier import train_model, get_cascade_report
+
+FEE_EMAILS = [
+    "Letter of credit fee due for the standby LC issued under the facility, please remit the LC fee",
+    "Reminder: quarterly letter of credit fee invoice attached, LC fee payable on the 15th",
+    "Please pay the letter of credit fee of USD 4,500 for the outstanding LC",
+    "LC fee notice - the letter of credit fee for Q2 is now payable",
+    "Your letter of credit issuance fee is due, see attached LC fee statement"
+]
+PRINCIPAL_EMAILS = [
+    "Principal repayment received from the borrower, inbound principal wire credited",
+    "Incoming principal payment of USD 2,000,000 has been received today",
+    "Borrower repaid principal on the term loan, principal funds inbound",
+    "We received a principal prepayment wire for the revolving facility",
+    "Inbound wire: scheduled principal amortization payment received"
+]
+
+
+@pytest.fixture
+def trained_model(tmp_path):
+    """Trains a small model on two labels and points the cascade at it."""
+    examples = [(text, "Fee Payment / Letter of Credit Fee") for text in FEE_EMAILS] + \
+               [(text, "Money Movement - Inbound / Principal") for text in PRINCIPAL_EMAILS]
+    model_file = str(tmp_path / "model.npz")
+    train_model(examples).save(model_file)
+    with override_config({"local_classifier": {"model_file": model_file, "confidence_threshold": 0.9}}):
+        yield model_file
+
+
+def test_untrained_model_escalates():
+    """Test that no prediction is made when no model file exists."""
+    with override_config({"local_classifier": {"model_file": "missing-model.npz"}}):
+        assert local_classifier.predict("Subject", "Body") is None
+
+
+def test_predict_trained_labels(trained_model):
+    """Test that the local tier recognises the labels it was trained on."""
+    prediction = local_classifier.predict("LC fee", "Please pay the letter of credit fee for the LC")
+    assert (prediction["request_type"], prediction["sub_request_type"]) == ("Fee Payment", "Letter of Credit Fee")
+    assert prediction["confident"] is True
+
+
+def test_predict_scores_email_text_as_trained(trained_model):
+    """Test that the email text, which already carries its subject line, is scored unchanged."""
+    email_text = "Subject: LC fee\nBody: Please pay the letter of credit fee for the LC"
+    with patch.object(local_classifier.TfidfCentroidModel, "predict",
+                      return_value=("Fee Payment / Letter of Credit Fee", 0.95)) as mock_predict:
+        local_classifier.predict("LC fee", email_text)
+
+    assert mock_predict.call_args.args[0] == email_text
+
+
+def test_confident_prediction_skips_openai(trained_model):
+    """Test that a confident local prediction is returned without calling OpenAI."""
+    with patch("ai_classifier.openai.OpenAI") as mock_openai:
+        result = compute_from_model("Principal received", "Inbound principal repayment wire received from the borrower")
+
+    mock_openai.assert_not_called()
+    assert result["request_type"] == "Money Movement - Inbound"
+    assert result["sub_request_type"] == "Principal"
+    assert result["assigned_to"] == "Treasury Team"
+    assert result["classification_tier"] == "local"
+
+
+def test_uncertain_prediction_escalates_and_is_compared(trained_model):
+    """Test that low-confidence emails go to OpenAI and count towards the agreement report."""
+    llm_response = {"request_type": "Adjustment", "sub_request_type": "N/A", "extracted_data": {}}
+    before = get_cascade_report()
+    with patch.dict(config["local_classifier"], {"confidence_threshold": 1.01}), \
+            patch("ai_classifier.openai.OpenAI") as mock_openai:
+        mock_openai.return_value.chat.completions.create.return_value.choices = [
+            type("", (object,), {"message": type("", (object,), {"content": json.dumps(llm_response)})()})()
+        ]
+        result = compute_from_model("Adjustment", "Please adjust the booking")
+
+    after = get_cascade_report()
+    assert result["classification_tier"] == "llm"
+    assert after["escalated"] == before["escalated"] + 1
+    assert after["agreement_samples"] == before["agreement_samples"] + 1
+    assert after["latency"]["llm"]["count"] >= 1
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,112 @@
+import pytest
+import mailbox
+from email.message import EmailMessage
+from unittest.mock import patch
+from config_loader import override_config
+from mail_ingest import detect_kind, ingest, iter_mbox
+
+
+def make_message(index, body=None):
+    msg = EmailMessage()
+    msg["Subject"] = f"Notice {index}"
+    msg["Message-ID"] = f"<notice-{index}@example.com>"
+    msg.set_content(body or f"Principal payment notice number {index}.")
+    return msg
+
+
+def write_mbox(path, messages):
+    mbox = mailbox.mbox(str(path))
+    for msg in messages:
+        mbox.add(msg)
+    mbox.close()
+
+
+@pytest.fixture(autouse=True)
+def ingest_db(tmp_path):
+    with override_config({"mail_ingest": {"db_file": str(tmp_path / "ingest.sqlite3"), "checkpoint_every": 1}}):
+        yield
+
+
+@pytest.fixture
+def pipeline():
+    """Replaces the email pipeline with one that records which subjects it saw."""
+    seen = []
+
+    def run(data):
+        subject = data.split(b"Subject: ")[1].split(b"\n")[0].decode()
+        seen.append(subject)
+        return {"email_subject": subject, "classification_result": {"request_type": "Adjustment"}}
+
+    with patch("batch_processor.run_email_pipeline", side_effect=run):
+        yield seen
+
+
+def test_iter_mbox_streams_messages_and_unquotes_from_lines(tmp_path):
+    """Test that messages come out one by one with offsets and without mbox quoting."""
+    path = tmp_path / "inbox.mbox"
+    write_mbox(path, [make_message(1, "First line\nFrom here on the body continues."), make_message(2)])
+
+    messages = list(iter_mbox(path))
+    assert len(messages) == 2
+    assert b"\nFrom here on the body continues." in messages[0][2]
+    assert messages[0][1] == messages[1][0]
+    assert list(iter_mbox(path, messages[1][0]))[0][2] == messages[1][2]
+
+
+def test_mbox_rerun_only_processes_new_mail(tmp_path, pipeline):
+    """Test that the offset checkpoint lets a re-run skip everything already classified."""
+    path = tmp_path / "inbox.mbox"
+    write_mbox(path, [make_message(i) for i in range(3)])
+
+    first = ingest("mbox", path, concurrency=2)
+    assert first["processed"] == 3
+    assert first["checkpoint_offset"] == path.stat().st_size
+
+    mbox = mailbox.mbox(str(path))
+    mbox.add(make_message(3))
+    mbox.close()
+    second = ingest("mbox", path, concurrency=2)
+
+    assert second["processed"] == 1
+    assert second["start_offset"] == first["checkpoint_offset"]
+    assert sorted(pipeline) == ["Notice 0", "Notice 1", "Notice 2", "Notice 3"]
+
+
+def test_failed_messages_hold_the_checkpoint_and_are_retried(tmp_path):
+    """Test that a failed message is retried on the next run, while finished ones are skipped by Message-ID."""
+    path = tmp_path / "inbox.mbox"
+    write_mbox(path, [make_message(i) for i in range(3)])
+
+    def flaky(data):
+        if b"Notice 1" in data:
+            raise RuntimeError("OCR crashed")
+        return {"email_subject": "ok", "classification_result": {}}
+
+    with patch("batch_processor.run_email_pipeline", side_effect=flaky):
+        first = ingest("mbox", path, concurrency=1)
+    with patch("batch_processor.run_email_pipeline", return_value={"email_subject": "ok", "classification_result": {}}) as retry:
+        second = ingest("mbox", path, concurrency=1)
+
+    assert (first["processed"], first["errors"]) == (2, 1)
+    assert first["checkpoint_offset"] < path.stat().st_size
+    assert (second["processed"], second["skipped"]) == (1, 1)
+    assert retry.call_count == 1
+
+
+def test_maildir_ingestion(tmp_path, pipeline):
+    """Test that Maildir messages are detected, processed once and skipped on re-runs."""
+    maildir = mailbox.Maildir(str(tmp_path / "Maildir"))
+    for i in range(2):
+        maildir.add(make_message(i))
+    maildir.close()
+
+    assert detect_kind(tmp_path / "Maildir") == "maildir"
+    assert ingest("maildir", tmp_path / "Maildir")["processed"] == 2
+    # Files already ingested are skipped by their unique name without being opened
+    with patch("mail_ingest.open", create=True, side_effect=AssertionError("file was read")):
+        rerun = ingest("maildir", tmp_path / "Maildir")
+    assert (rerun["processed"], rerun["skipped"]) == (0, 2)
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,48 @@
+import pytest
+from config_loader import override_config
+from prompt_builder import build_prompt, count_tokens, get_static_prompt, select_relevant_text
+
+FILLER = "\n".join(f"Section {i}: general terms and conditions of the facility agreement apply." for i in range(400))
+KEY_FACTS = "CUSIP: 037833100\nTotal Payment Amount: USD 1,250,000.00"
+
+
+def test_static_prefix_is_built_once_per_config_version():
+    """Test that the criteria and field list are serialized once and reused."""
+    assert get_static_prompt() is get_static_prompt()
+    with override_config({"extractable_fields": ["Deal Name"]}):
+        assert "Deal Name" in get_static_prompt()["prefix"]
+        assert "CUSIP" not in get_static_prompt()["prefix"]
+
+
+def test_short_email_is_not_trimmed():
+    """Test that small emails are passed through untouched."""
+    prompt, stats = build_prompt("LC Fee", "Please pay the fee.", "Invoice total USD 500.00", False)
+    assert "Please pay the fee." in prompt
+    assert "Invoice total USD 500.00" in prompt
+    assert stats["tokens_saved"] == 0
+    assert stats["truncated"] is False
+
+
+def test_long_attachment_is_trimmed_to_relevant_chunks():
+    """Test that the budget is enforced and the chunks holding field values survive."""
+    attachment = FILLER[:len(FILLER) // 2] + "\n" + KEY_FACTS + "\n" + FILLER[len(FILLER) // 2:]
+    with override_config({"prompt_builder": {"max_prompt_tokens": 1500}}):
+        prompt, stats = build_prompt("Payment notice", "See attached.", attachment, True)
+
+    assert stats["prompt_tokens"] <= 1500
+    assert stats["tokens_saved"] > 0
+    assert "037833100" in prompt and "1,250,000.00" in prompt
+    assert '"DuplicateFlag": true' in prompt
+
+
+def test_selected_chunks_keep_document_order():
+    """Test that selected chunks are emitted in their original order with gap markers."""
+    text = "\n".join(["intro filler"] * 50 + ["Interest Amount: 10.00"] + ["middle filler"] * 50 + ["Fees: 20.00"])
+    selected = select_relevant_text(text, 20, {"interest", "fees"}, 5)
+    assert selected.index("Interest Amount") < selected.index("Fees: 20.00")
+    assert "[...]" in selected
+    assert count_tokens(selected.replace("[...]", "")) <= 30
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,153 @@
+import pytest
+import json
+import sqlite3
+import threading
+import results_store
+from config_loader import override_config
+from results_store import save_result, query_results, get_result, iter_results, query_aggregates, parse_confidence
+
+
+def make_record(index, request_type="Fee Payment", sub_request_type="Ongoing Fee", assigned_to="Accounts Payable Team"):
+    """Builds a processed email record as produced by the pipeline."""
+    return {
+        "email_subject": f"Notice {index}",
+        "classification_result": {
+            "request_type": request_type,
+            "sub_request_type": sub_request_type,
+            "assigned_to": assigned_to
+        },
+        "processed_at": f"2025-03-{10 + index % 10:02d} 09:00:00"
+    }
+
+
+@pytest.fixture
+def store(tmp_path):
+    """Points the results store at a fresh database."""
+    with override_config({"results_store": {"db_file": str(tmp_path / "results.sqlite3")},
+                          "processed_emails_file": str(tmp_path / "processed_emails.json")}):
+        yield tmp_path
+
+
+def test_save_and_get(store):
+    """Test that a saved record can be read back by id."""
+    record_id = save_result(make_record(1))
+    record = get_result(record_id)
+    assert record["email_subject"] == "Notice 1"
+    assert record["classification_result"]["request_type"] == "Fee Payment"
+    assert get_result(record_id + 100) is None
+
+
+def test_filters_and_cursor_pagination(store):
+    """Test filtering on indexed fields and walking pages with the cursor."""
+    for index in range(5):
+        save_result(make_record(index))
+    save_result(make_record(5, "Adjustment", None, "John Doe"))
+
+    page = query_results({"request_type": "Fee Payment"}, limit=2)
+    assert [item["email_subject"] for item in page["items"]] == ["Notice 4", "Notice 3"]
+
+    seen = [item["email_subject"] for item in page["items"]]
+    while page["next_cursor"]:
+        page = query_results({"request_type": "Fee Payment"}, limit=2, cursor=page["next_cursor"])
+        seen += [item["email_subject"] for item in page["items"]]
+    assert seen == [f"Notice {index}" for index in (4, 3, 2, 1, 0)]
+
+    assert [item["email_subject"] for item in query_results({"assigned_to": "John Doe"})["items"]] == ["Notice 5"]
+    assert len(query_results({"processed_from": "2025-03-12", "processed_to": "2025-03-13 23:59:59"})["items"]) == 2
+
+
+def test_concurrent_writers(store):
+    """Test that writes from many threads are all persisted."""
+    def writer(offset):
+        for index in range(25):
+            save_result(make_record(offset + index))
+
+    threads = [threading.Thread(target=writer, args=(n * 100,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(list(iter_results())) == 100
+
+
+def test_legacy_json_is_imported(store):
+    """Test that records from processed_emails.json are imported into an empty store."""
+    with open(store / "processed_emails.json", "w") as file:
+        json.dump([make_record(1), make_record(2)], file)
+
+    assert [record["email_subject"] for record in iter_results()] == ["Notice 1", "Notice 2"]
+
+
+def test_failed_legacy_import_is_rolled_back(store):
+    """Test that a legacy import failing part way leaves no partial rows or open transaction behind."""
+    with open(store / "processed_emails.json", "w") as file:
+        json.dump([make_record(1), "not a record"], file)
+    with pytest.raises(AttributeError):
+        results_store.get_connection()
+
+    with open(store / "processed_emails.json", "w") as file:
+        json.dump([make_record(1), make_record(2)], file)
+    assert [record["email_subject"] for record in iter_results()] == ["Notice 1", "Notice 2"]
+
+
+def test_aggregates_follow_each_save(store):
+    """Test that every save updates the hourly counts, duplicate count and confidence deciles."""
+    for index, confidence in enumerate(["92%", "95%", 0.41]):
+        record = make_record(index * 10)
+        record["classification_result"]["confidence_score"] = confidence
+        save_result(record)
+    duplicate = make_record(0, "Adjustment", None, "John Doe")
+    duplicate["classification_result"]["DuplicateFlag"] = True
+    save_result(duplicate)
+
+    total, = query_aggregates(period_length=0)
+    assert (total["emails"], total["duplicates"], total["errors"]) == (4, 1, 0)
+    assert (total["confidence_9"], total["confidence_4"], total["confidence_total"]) == (2, 1, 228)
+
+    rows = query_aggregates(group_by=("request_type",), period_length=10)
+    assert [(row["period"], row["request_type"], row["emails"]) for row in rows] == [
+        ("2025-03-10", "Adjustment", 1), ("2025-03-10", "Fee Payment", 3)]
+    with pytest.raises(ValueError):
+        query_aggregates(group_by=("email_subject",))
+
+
+def test_aggregates_are_backfilled_for_existing_stores(store):
+    """Test that a store created before aggregates existed gets them computed on open."""
+    conn = sqlite3.connect(store / "results.sqlite3")
+    conn.execute("CREATE TABLE processed_emails (id INTEGER PRIMARY KEY AUTOINCREMENT, email_subject TEXT, "
+                 "request_type TEXT, sub_request_type TEXT, assigned_to TEXT, processed_at TEXT, record TEXT NOT NULL)")
+    for index in range(3):
+        record = make_record(index)
+        conn.execute("INSERT INTO processed_emails (request_type, processed_at, record) VALUES (?, ?, ?)",
+                     ("Fee Payment", record["processed_at"], json.dumps(record)))
+    conn.commit()
+    conn.close()
+
+    assert [(row["period"], row["emails"]) for row in query_aggregates(period_length=7)] == [("2025-03", 3)]
+
+
+def test_aggregate_backfill_never_double_counts(store):
+    """Test that other processes opening the store, even one whose backfill never finished, count each record once."""
+    for index in range(3):
+        save_result(make_record(index))
+
+    # Another process initialising the same database
+    conn = sqlite3.connect(store / "results.sqlite3", isolation_level=None)
+    results_store._create_schema(conn)
+    # A process that created the aggregate table and died before backfilling, while results kept being saved
+    conn.execute("DELETE FROM result_aggregates_backfill")
+    results_store._create_schema(conn)
+    conn.close()
+
+    assert [(row["period"], row["emails"]) for row in query_aggregates(period_length=7)] == [("2025-03", 3)]
+
+
+def test_parse_confidence():
+    """Test the confidence formats found in stored results."""
+    assert [parse_confidence(value) for value in ("92%", 92, 0.92, "0.5", "high", None, 150)] == \
+        [92.0, 92.0, 92.0, 50.0, None, None, 100.0]
+
+
+if __name__ == "__main__":
+    pytest.main()
@@ -0,0 +1,111 @@
+import pytest
+import json
+import logging
+import fitz
+from PIL import Image
+from unittest.mock import patch
+import attachment_parser
+import ocr_cache
+import telemetry
+from app import app
+from attachment_parser import extract_text_from_attachment, extract_texts_from_attachments
+from config_loader import override_config
+from telemetry import JsonLogFormatter, increment, new_correlation_id, observe, render_prometheus, span
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    telemetry.reset_metrics()
+    yield
+    telemetry.reset_metrics()
+
+
+def test_span_records_latency_and_errors():
+    """Test that spans feed the stage histogram and count stages that raise."""
+    with span("parse"):
+        pass
+    with pytest.raises(ValueError):
+        with span("llm_call"):
+            raise ValueError("boom")
+
+    output = render_prometheus()
+    assert 'email_stage_duration_seconds_count{stage="parse"} 1' in output
+    assert 'email_stage_duration_seconds_count{stage="llm_call"} 1' in output
+    assert 'email_stage_errors_total{stage="llm_call"} 1' in output
+
+
+def test_histogram_buckets_are_cumulative():
+    """Test the Prometheus histogram exposition."""
+    for value in (0.003, 0.2, 100):
+        observe("email_stage_duration_seconds", value, stage="ocr")
+    output = render_prometheus()
+
+    assert "# TYPE email_stage_duration_seconds histogram" in output
+    assert 'email_stage_duration_seconds_bucket{stage="ocr",le="0.005"} 1' in output
+    assert 'email_stage_duration_seconds_bucket{stage="ocr",le="0.25"} 2' in output
+    assert 'email_stage_duration_seconds_bucket{stage="ocr",le="+Inf"} 3' in output
+
+
+def test_ocr_pages_are_timed_as_their_own_stage(tmp_path):
+    """Test that OCR is recorded as the ocr stage, in the sequential path and for pool workers."""
+    Image.new("RGB", (40, 40), "white").save(tmp_path / "scan.png")
+    doc = fitz.open()
+    doc.new_page().insert_image(fitz.Rect(0, 0, 40, 40), filename=str(tmp_path / "scan.png"))
+    doc.save(tmp_path / "scanned.pdf")
+    doc.close()
+
+    attachment_parser._reset_pool()
+    with patch("attachment_parser.pytesseract.image_to_string", return_value="Principal 100"):
+        for db_file, parallel in (("sequential.sqlite3", False), ("pool.sqlite3", True)):
+            ocr_cache.clear_memory_cache()
+            with override_config({"ocr_cache": {"db_file": str(tmp_path / db_file)},
+                                  "attachment_extraction": {"parallel": parallel, "max_workers": 2}}), \
+                    patch("attachment_parser.os.cpu_count", return_value=4):
+                if parallel:
+                    extract_texts_from_attachments([str(tmp_path / "scanned.pdf")])
+                else:
+                    extract_text_from_attachment(str(tmp_path / "scanned.pdf"))
+    attachment_parser._reset_pool()
+    ocr_cache.clear_memory_cache()
+
+    assert 'email_stage_duration_seconds_count{stage="ocr"} 2' in render_prometheus()
+
+
+def test_counters_escape_label_values():
+    """Test that counters accumulate and label values are escaped."""
+    increment("attachments_total", type="pdf")
+    increment("attachments_total", 2, type="pdf")
+    increment("attachments_total", type='we"ird')
+    output = render_prometheus()
+
+    assert 'attachments_total{type="pdf"} 3' in output
+    assert 'attachments_total{type="we\\"ird"} 1' in output
+
+
+def test_structured_log_carries_correlation_id():
+    """Test that log lines are JSON with the current correlation id and extra fields."""
+    new_correlation_id("req-123")
+    record = logging.LogRecord("email_classifier", logging.INFO, __file__, 1, "email_processed", None, None)
+    record.fields = {"tier": "llm"}
+    entry = json.loads(JsonLogFormatter().format(record))
+
+    assert entry["correlation_id"] == "req-123"
+    assert entry["event"] == "email_processed"
+    assert entry["tier"] == "llm"
+
+
+def test_metrics_endpoint_and_request_id():
+    """Test that /metrics is served and the caller's X-Request-ID is echoed back."""
+    client = app.test_client()
+    response = client.get("/cache-stats", headers={"X-Request-ID": "abc"})
+    assert response.headers["X-Request-ID"] == "abc"
+    assert client.get("/cache-stats").headers["X-Request-ID"]
+
+    metrics = client.get("/metrics")
+    assert metrics.status_code == 200
+    assert metrics.mimetype == "text/plain"
+    assert 'http_request_duration_seconds_count{endpoint="/cache-stats",method="GET",status="200"} 2' in metrics.get_data(as_text=True)
+
+
+if __name__ == "__main__":
+    pytest.main()
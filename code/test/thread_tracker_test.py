@@ -0,0 +1,156 @@
+import pytest
+from collections import OrderedDict
+from email.message import EmailMessage
+from unittest.mock import patch
+from config_loader import override_config
+from email_pipeline import run_email_pipeline
+from email_reader import split_thread_segments
+from prompt_builder import build_prompt
+
+ORIGINAL = "Please find the principal repayment of USD 250,000.00 for deal ABC-123 due on 15 April."
+
+CLASSIFICATION = OrderedDict([
+    ("request_type", "Money Movement - Inbound"),
+    ("sub_request_type", "Principal"),
+    ("DuplicateFlag", False),
+    ("confidence_score", "92%"),
+    ("extracted_data", {"deal_name": "ABC-123", "amount": "USD 250,000.00"})
+])
+
+
+@pytest.fixture
+def stores(tmp_path):
+    """Points every store the pipeline touches at temporary databases."""
+    with override_config({"thread_tracking": {"db_file": str(tmp_path / "threads.sqlite3")},
+                          "dedup_index": {"db_file": str(tmp_path / "dedup.sqlite3")},
+                          "results_store": {"db_file": str(tmp_path / "results.sqlite3")},
+                          "classification_cache": {"enabled": False}}):
+        yield tmp_path
+
+
+def make_message(message_id, body, in_reply_to=None):
+    msg = EmailMessage()
+    msg["Subject"] = "Principal repayment ABC-123" if in_reply_to is None else "RE: Principal repayment ABC-123"
+    msg["Message-ID"] = message_id
+    if in_reply_to:
+        msg["In-Reply-To"] = in_reply_to
+        msg["References"] = in_reply_to
+    msg.set_content(body)
+    return msg.as_bytes()
+
+
+def reply(text):
+    quoted = "\n".join(f"> {line}" for line in ORIGINAL.split("\n"))
+    return f"{text}\n\nOn Mon, 14 Apr 2025 at 09:00, Agent Bank <agency@example.com> wrote:\n{quoted}"
+
+
+def test_split_thread_segments_newest_first():
+    """Test that replies, attributions and deeper quote levels become separate segments."""
+    body = (
+        "Thanks, please also send the ISIN.\n\n"
+        "On Mon, 14 Apr 2025, Ops <ops@example.com> wrote:\n"
+        "> Please find the principal payment.\n"
+        ">\n"
+        "> On Fri, 11 Apr 2025, Agent <agent@example.com> wrote:\n"
+        ">> Can you confirm the repayment?"
+    )
+    segments = split_thread_segments(body)
+
+    assert segments[0] == "Thanks, please also send the ISIN."
+    assert segments[1].endswith("Please find the principal payment.")
+    assert segments[2].endswith("Can you confirm the repayment?")
+    assert split_thread_segments("Single message body") == ["Single message body"]
+
+
+def test_reply_sends_only_new_segment_with_thread_summary(stores):
+    """Test that a reply is classified from its newest segment, with prior fields carried forward."""
+    follow_up = OrderedDict(CLASSIFICATION, extracted_data={"value_date": "16 April"})
+    with patch("email_pipeline.cached_compute_from_model", side_effect=[CLASSIFICATION.copy(), follow_up]) as mock_model:
+        run_email_pipeline(make_message("<m1@example.com>", ORIGINAL))
+        result = run_email_pipeline(make_message(
+            "<m2@example.com>", reply("Please move the value date to 16 April."), "<m1@example.com>"
+        ))
+
+    subject, email_text, _, thread_context = mock_model.call_args.args
+    assert "Please move the value date" in email_text
+    assert "principal repayment of USD" not in email_text
+    assert "ABC-123" in thread_context
+    assert result["thread"]["prior_messages"] == 1
+    assert result["classification_result"]["extracted_data"] == {
+        "deal_name": "ABC-123", "amount": "USD 250,000.00", "value_date": "16 April"
+    }
+
+
+def test_reply_above_long_quote_is_not_a_duplicate_of_the_original(stores):
+    """Test that dedup compares the newest segment, so a quoted original does not mask the new request."""
+    original = " ".join(
+        f"Item {n}: the agent confirms that tranche {n} of deal ABC-123 settles on schedule {n} without any amendment."
+        for n in range(40)
+    )
+    quoted = "\n".join([
+        "-----Original Message-----", "From: Agent Bank <agency@example.com>",
+        "Sent: Monday, 14 April 2025 09:00", "Subject: Principal repayment ABC-123", "", original,
+    ])
+    follow_up = OrderedDict(CLASSIFICATION, extracted_data={"value_date": "16 April"})
+    with patch("email_pipeline.cached_compute_from_model", side_effect=[CLASSIFICATION.copy(), follow_up]) as mock_model:
+        run_email_pipeline(make_message("<m1@example.com>", original))
+        result = run_email_pipeline(make_message(
+            "<m2@example.com>", f"Please move the value date to 16 April.\n\n{quoted}", "<m1@example.com>"
+        ))
+
+    assert mock_model.call_count == 2
+    assert "Please move the value date" in mock_model.call_args.args[1]
+    assert result["classification_result"]["DuplicateFlag"] is False
+    assert result["thread"]["prior_messages"] == 1
+
+
+def test_generic_reply_reuses_thread_classification(stores):
+    """Test that a bare acknowledgement is matched by its quoted text and never reaches the model."""
+    with patch("email_pipeline.cached_compute_from_model", return_value=CLASSIFICATION.copy()) as mock_model:
+        run_email_pipeline(make_message("<m1@example.com>", ORIGINAL))
+        # No In-Reply-To header: the thread is found through the quoted original
+        result = run_email_pipeline(make_message("<m3@example.com>", reply("Thanks, noted.")))
+
+    assert mock_model.call_count == 1
+    assert result["classification_result"]["DuplicateFlag"] is True
+    assert result["classification_result"]["classification_tier"] == "thread"
+    assert result["classification_result"]["sub_request_type"] == "Principal"
+
+
+def test_only_a_whole_acknowledgement_skips_the_model(stores):
+    """Test that a signed "Thanks" reuses the thread, while a new request that ends in "Thanks" is classified."""
+    with patch("email_pipeline.cached_compute_from_model", return_value=CLASSIFICATION.copy()) as mock_model:
+        run_email_pipeline(make_message("<m1@example.com>", ORIGINAL))
+        signed = run_email_pipeline(make_message(
+            "<m4@example.com>", reply("Hi team,\nNoted, thank you.\n\nBest regards,\nJane Doe\nAgency Desk"), "<m1@example.com>"
+        ))
+        request = run_email_pipeline(make_message(
+            "<m5@example.com>", reply("Please move the value date to 16 April.\nThanks"), "<m1@example.com>"
+        ))
+
+    assert signed["classification_result"]["classification_tier"] == "thread"
+    assert mock_model.call_count == 2
+    assert "Please move the value date" in mock_model.call_args.args[1]
+    assert request["thread"]["prior_messages"] == 1
+
+
+def test_standalone_email_without_thread_headers_is_not_recorded(stores):
+    """Test that an email no reply could ever be matched to leaves the thread store untouched."""
+    msg = EmailMessage()
+    msg["Subject"] = "Principal repayment ABC-123"
+    msg.set_content(ORIGINAL)
+    with patch("email_pipeline.cached_compute_from_model", return_value=CLASSIFICATION.copy()):
+        run_email_pipeline(msg.as_bytes())
+
+    assert not (stores / "threads.sqlite3").exists()
+
+
+def test_prompt_includes_thread_history():
+    """Test that the thread summary replaces the quoted history in the prompt."""
+    prompt, _ = build_prompt("RE: Repayment", "Please move the date.", "", False, "1 earlier message(s) in this thread.")
+    assert "**Thread History:** 1 earlier message(s) in this thread." in prompt
+    assert "Thread History" not in build_prompt("Repayment", "Please move the date.", "", False)[0]
+
+
+if __name__ == "__main__":
+    pytest.main()